@@ -0,0 +1,61 @@
+import time, argparse
+import torch
+from train import MODELS, create_model
+from scripts.models.transformer_block import ATTENTION_BACKENDS
+import scripts.models.utils as utils
+from eeg_logger import logger
+
+"""
+Checks that attention backends of TransformerBlock give the same outputs and compares their
+forward + backward step time for all models.
+
+Run from repository root:
+python -m benchmarks.attention --times 481 961
+"""
+
+
+def step_time(model: torch.nn.Module, X: torch.Tensor, steps: int) -> float:
+    y = torch.zeros(len(X), dtype=torch.long)
+    criterion = torch.nn.CrossEntropyLoss()
+    criterion(model(X), y).backward()  # WARM-UP
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        model.zero_grad()
+        criterion(model(X), y).backward()
+    return (time.perf_counter() - start) / steps
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks attention backends")
+    parser.add_argument("--times", type=int, nargs="+", default=[481, 961], help="window lengths in samples")
+    parser.add_argument("--channels", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=utils.BATCH_SIZE)
+    parser.add_argument("--steps", type=int, default=5)
+    args = parser.parse_args()
+
+    for model_name, cnn_mode in MODELS.values():
+        for n_times in args.times:
+            if model_name in ["SpatialCNNTransformer", "FusionCNNTransformer"] and n_times > 511:
+                continue  # SPATIAL CNN STEM SUPPORTS ONLY 3S WINDOWS
+
+            X = torch.randn(args.batch_size, args.channels, n_times)
+            if cnn_mode:
+                X = X.unsqueeze(1)
+
+            models = {backend: create_model(model_name, X.shape, attention=backend) for backend in ATTENTION_BACKENDS}
+            reference = models["mha"]
+            for model in models.values():
+                model.load_state_dict(reference.state_dict())
+                model.eval()
+
+            with torch.no_grad():
+                difference = max((model(X) - reference(X)).abs().max().item() for model in models.values())
+
+            times = {backend: step_time(model, X, args.steps) for backend, model in models.items()}
+            summary = ", ".join(f"{backend}: {t * 1000:.1f} ms" for backend, t in times.items())
+            logger.info(f"{model_name}, T={n_times}: {summary}, max output difference: {difference:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import time, argparse
+import numpy as np
+import torch
+from sklearn.model_selection import KFold, train_test_split
+from train import MODELS, create_model, load_dataset
+from scripts.dataset.eeg_dataset import EEGDataset
+from scripts.dataset.batch_loader import TensorBatchLoader
+import scripts.models.utils as utils
+from eeg_logger import logger
+
+"""
+Time-to-accuracy of early stopping (train.py --patience). Trains every fold of every model for
+all NUM_EPOCHS epochs and with early stopping on a validation split carved from the training fold,
+reports epochs and time saved and the change of test accuracy.
+
+Run from repository root:
+python -m benchmarks.early_stopping --models spatial temporal --patience 10
+"""
+
+
+def run_fold(model_name: str, cnn_mode: bool, X, y, train_idx, test_idx, fold: int, patience: int | None) -> dict:
+    torch.manual_seed(utils.SEED + fold)
+    device = torch.device("cpu")
+
+    def loader(idx: np.ndarray, shuffle: bool) -> TensorBatchLoader:
+        dataset = EEGDataset(X, y, cnn_mode=cnn_mode, indices=idx)
+        return TensorBatchLoader(dataset, batch_size=utils.BATCH_SIZE, shuffle=shuffle, reuse_buffers=True)
+
+    options = {}
+    if patience is not None:
+        train_idx, val_idx = train_test_split(
+            train_idx, test_size=utils.VALIDATION_SPLIT, stratify=y[train_idx], random_state=utils.SEED + fold
+        )
+        options = {"val_loader": loader(val_idx, False), "patience": patience}
+
+    model = create_model(model_name, (len(train_idx), *X.shape[1:]))
+    start = time.perf_counter()
+    result = utils.train_model(model, loader(train_idx, True), device, verbose=False, **options)
+    return {
+        "epochs": result["epochs"],
+        "time": time.perf_counter() - start,
+        "accuracy": utils.evaluate_model(model, loader(test_idx, False), device),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compares early stopping with training for all epochs")
+    parser.add_argument("--models", nargs="+", default=list(MODELS), help=", ".join(MODELS))
+    parser.add_argument("--patience", type=int, default=utils.PATIENCE)
+    parser.add_argument("--epochs", type=int, default=utils.NUM_EPOCHS)
+    parser.add_argument("--window", default="3s")
+    args = parser.parse_args()
+
+    utils.NUM_EPOCHS = args.epochs
+    X, y = load_dataset(args.window)
+    y = np.asarray(y)
+    folds = list(KFold(n_splits=5, shuffle=True, random_state=42).split(X, y))
+
+    for model in args.models:
+        model_name, cnn_mode = MODELS[model]
+        full, early = [], []
+        for fold, (train_idx, test_idx) in enumerate(folds):
+            full.append(run_fold(model_name, cnn_mode, X, y, train_idx, test_idx, fold, patience=None))
+            early.append(run_fold(model_name, cnn_mode, X, y, train_idx, test_idx, fold, patience=args.patience))
+            logger.info(
+                f"{model_name}, fold {fold + 1}: {early[-1]['epochs']}/{full[-1]['epochs']} epochs, "
+                f"accuracy {full[-1]['accuracy'] * 100:.2f}% -> {early[-1]['accuracy'] * 100:.2f}%"
+            )
+
+        epochs_saved = sum(run["epochs"] for run in full) - sum(run["epochs"] for run in early)
+        time_saved = 1 - sum(run["time"] for run in early) / sum(run["time"] for run in full)
+        accuracy_change = np.mean([run["accuracy"] for run in early]) - np.mean([run["accuracy"] for run in full])
+        logger.info(
+            f"{model_name}: {epochs_saved} of {sum(run['epochs'] for run in full)} epochs saved, "
+            f"{time_saved * 100:.0f}% less training time, accuracy change {accuracy_change * 100:+.2f}%"
+        )
+
+
+if __name__ == "__main__":
+    main()
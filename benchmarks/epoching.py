@@ -0,0 +1,76 @@
+import sys, time, argparse
+import numpy as np
+import mne
+from scripts.preprocessing import epoching
+from scripts.preprocessing.physionet import SELECTED_EVENT_ID, WINDOWS
+from eeg_logger import logger
+
+"""
+Guard of epoching.extract_windows against mne.Epochs. Builds a synthetic Physionet-like subject from runs
+joined by mne.concatenate_raws (with "BAD boundary" annotations at the joins) and a BAD_muscle segment,
+extracts all Physionet WINDOWS with both, reports extraction time and fails if kept events differ
+or data differ by more than float32 precision.
+
+Run from repository root:
+python -m benchmarks.epoching --runs 3 --channels 64
+"""
+
+SFREQ: float = 160.0
+
+
+def synthetic_raw(runs: int, channels: int, run_seconds: float, event_every: float) -> mne.io.BaseRaw:
+    rng = np.random.default_rng(0)
+    info = mne.create_info([f"EEG{channel:03d}" for channel in range(channels)], SFREQ, "eeg")
+    raws = []
+    for _ in range(runs):
+        raw = mne.io.RawArray(1e-5 * rng.standard_normal((channels, int(run_seconds * SFREQ))), info, verbose=False)
+        onsets = np.arange(0.5, run_seconds, event_every)
+        descriptions = rng.choice(list(SELECTED_EVENT_ID) + ["rest"], len(onsets))
+        raw.set_annotations(mne.Annotations(onsets, np.minimum(4.1, run_seconds - onsets), descriptions))
+        raws.append(raw)
+
+    raw = mne.concatenate_raws(raws)
+    raw.annotations.append(run_seconds / 3, 1.5, "BAD_muscle")
+    return raw
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compares extract_windows with mne.Epochs")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--channels", type=int, default=64)
+    parser.add_argument("--run-seconds", type=float, default=120.0)
+    parser.add_argument("--event-every", type=float, default=4.1, help="seconds between events")
+    args = parser.parse_args()
+
+    raw = synthetic_raw(args.runs, args.channels, args.run_seconds, args.event_every)
+    events, event_ids = mne.events_from_annotations(raw, verbose=False)
+    event_id = {name: event_ids[name] for name in SELECTED_EVENT_ID}
+
+    start = time.perf_counter()
+    windows = epoching.extract_windows(raw, events, event_id, WINDOWS)
+    logger.info(f"extract_windows: {(time.perf_counter() - start) * 1000:.0f} ms for {len(WINDOWS)} windows")
+
+    start = time.perf_counter()
+    reference = {
+        name: mne.Epochs(raw, events, event_id, tmin, tmax, baseline=None, preload=True, verbose=False)
+        for name, (tmin, tmax) in WINDOWS.items()
+    }
+    logger.info(f"mne.Epochs: {(time.perf_counter() - start) * 1000:.0f} ms for {len(WINDOWS)} windows")
+
+    failed = False
+    for name, epochs in reference.items():
+        data, kept = windows[name]
+        logger.info(f"{name}: extract_windows kept {len(kept)} epochs, mne.Epochs {len(epochs)}")
+        if not np.array_equal(kept, epochs.events):
+            logger.error(f"{name}: kept events differ from mne.Epochs")
+            failed = True
+        elif not np.allclose(data, epochs.get_data(), rtol=1e-6, atol=1e-12):
+            logger.error(f"{name}: data differ from mne.Epochs")
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import time, argparse
+import torch
+from torch.utils.data import DataLoader
+from scripts.dataset.eeg_dataset import EEGDataset
+from scripts.dataset.batch_loader import TensorBatchLoader
+import scripts.models.utils as utils
+from eeg_logger import logger
+
+"""
+Compares batches/sec of DataLoader over EEGDataset with TensorBatchLoader on synthetic epochs.
+
+Run from repository root:
+python -m benchmarks.loader --epochs 4000 --channels 64 --times 481
+"""
+
+
+def batches_per_second(loader, passes: int) -> float:
+    num_batches = 0
+    start = time.perf_counter()
+
+    for _ in range(passes):
+        for X_batch, y_batch in loader:
+            X_batch.sum()  # TOUCH THE BATCH, AS TRAINING WOULD
+            num_batches += 1
+
+    return num_batches / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks batch loading")
+    parser.add_argument("--epochs", type=int, default=4000, help="number of synthetic epochs")
+    parser.add_argument("--channels", type=int, default=64)
+    parser.add_argument("--times", type=int, default=481)
+    parser.add_argument("--batch-size", type=int, default=utils.BATCH_SIZE)
+    parser.add_argument("--passes", type=int, default=3, help="number of passes over dataset")
+    args = parser.parse_args()
+
+    X = torch.randn(args.epochs, args.channels, args.times)
+    y = torch.randint(0, utils.NUM_CLASSES, (args.epochs,))
+    dataset = EEGDataset(X, y, cnn_mode=True)
+
+    loaders = {
+        "DataLoader": DataLoader(dataset, batch_size=args.batch_size, shuffle=True),
+        "TensorBatchLoader": TensorBatchLoader(dataset, batch_size=args.batch_size, shuffle=True),
+        "TensorBatchLoader (reused buffers)": TensorBatchLoader(
+            dataset, batch_size=args.batch_size, shuffle=True, reuse_buffers=True
+        ),
+    }
+
+    results = {name: batches_per_second(loader, args.passes) for name, loader in loaders.items()}
+    for name, result in results.items():
+        speedup = result / results["DataLoader"]
+        logger.info(f"{name}: {result:.1f} batches/sec ({speedup:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import time, argparse, resource
+import torch
+import torch.multiprocessing as mp
+from train import create_model
+import scripts.models.utils as utils
+from eeg_logger import logger
+
+"""
+Measures how training step time and peak memory of temporal models grow with window length
+for every attention backend. Every configuration runs in a fresh process, so peak RSS of one
+configuration does not hide the others.
+
+Run from repository root:
+python -m benchmarks.long_sequence --seconds 3 6 10 20 --backends sdpa local linear
+"""
+
+SAMPLING_FREQUENCY: int = 160  # PHYSIONET
+
+
+def measure(model_name: str, backend: str, n_times: int, args: argparse.Namespace, results: mp.Queue) -> None:
+    torch.set_num_threads(args.threads)
+    X = torch.randn(args.batch_size, args.channels, n_times)
+    if "CNN" in model_name:
+        X = X.unsqueeze(1)
+    y = torch.zeros(args.batch_size, dtype=torch.long)
+
+    model = create_model(model_name, X.shape, attention=backend, attention_window=args.window)
+    optimizer = torch.optim.Adam(model.parameters(), lr=utils.LEARNING_RATE)
+    criterion = torch.nn.CrossEntropyLoss()
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    step_times = []
+    for _ in range(args.steps + 1):  # FIRST STEP IS WARM-UP
+        start = time.perf_counter()
+        optimizer.zero_grad()
+        criterion(model(X), y).backward()
+        optimizer.step()
+        step_times.append(time.perf_counter() - start)
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((sum(step_times[1:]) / args.steps, (peak_rss - baseline_rss) / 1024))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks attention backends on long windows")
+    parser.add_argument("--models", nargs="+", default=["TemporalTransformer", "TemporalCNNTransformer"])
+    parser.add_argument("--backends", nargs="+", default=["sdpa", "local", "linear"])
+    parser.add_argument("--seconds", type=int, nargs="+", default=[3, 6, 10, 20], help="window lengths in seconds")
+    parser.add_argument("--channels", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--window", type=int, default=utils.ATTENTION_WINDOW, help="radius of local attention")
+    parser.add_argument("--threads", type=int, default=torch.get_num_threads())
+    parser.add_argument("--steps", type=int, default=3)
+    args = parser.parse_args()
+
+    context = mp.get_context("spawn")
+    results = context.Queue()
+
+    for model_name in args.models:
+        for backend in args.backends:
+            for seconds in args.seconds:
+                n_times = seconds * SAMPLING_FREQUENCY + 1
+                process = context.Process(target=measure, args=(model_name, backend, n_times, args, results))
+                process.start()
+                process.join()
+
+                if process.exitcode != 0:
+                    logger.error(f"{model_name}, {backend}, {seconds}s: failed with exit code {process.exitcode}")
+                    continue
+
+                step_time, memory = results.get()
+                logger.info(
+                    f"{model_name}, {backend}, {seconds}s (T={n_times}): "
+                    f"step {step_time * 1000:.1f} ms, peak memory increase {memory:.1f} MB"
+                )
+
+
+if __name__ == "__main__":
+    main()
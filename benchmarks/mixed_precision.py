@@ -0,0 +1,82 @@
+import sys, time, argparse
+import numpy as np
+import torch
+from sklearn.model_selection import KFold
+from train import MODELS, create_model, load_dataset
+from scripts.dataset.eeg_dataset import EEGDataset
+from scripts.dataset.batch_loader import TensorBatchLoader
+import scripts.models.utils as utils
+from eeg_logger import logger
+
+"""
+Guard of bfloat16 mixed precision (train.py --bf16). Trains every model on the first
+cross-validation fold of Physionet data in float32 and in bf16 with channels_last CNN stems,
+reports training and evaluation speedup and fails if bf16 accuracy is lower than float32
+accuracy by more than --tolerance.
+
+Run from repository root:
+python -m benchmarks.mixed_precision --epochs 10
+"""
+
+
+def run(model_name: str, cnn_mode: bool, X: np.ndarray, y: np.ndarray, bf16: bool) -> dict:
+    train_idx, test_idx = next(KFold(n_splits=5, shuffle=True, random_state=42).split(X, y))
+    torch.manual_seed(utils.SEED)
+
+    train_dataset = EEGDataset(X, y, cnn_mode=cnn_mode, indices=train_idx)
+    test_dataset = EEGDataset(X, y, cnn_mode=cnn_mode, indices=test_idx)
+    train_loader = TensorBatchLoader(train_dataset, batch_size=utils.BATCH_SIZE, shuffle=True, reuse_buffers=True)
+    test_loader = TensorBatchLoader(test_dataset, batch_size=utils.BATCH_SIZE, reuse_buffers=True)
+    device = torch.device("cpu")
+
+    model = create_model(model_name, (len(train_idx), *X.shape[1:]))
+    stages = utils.train_model(model, train_loader, device, verbose=False, profile=True, bf16=bf16)
+
+    start = time.perf_counter()
+    accuracy = utils.evaluate_model(model, test_loader, device, bf16=bf16)
+    eval_time = time.perf_counter() - start
+
+    train_time = sum(stages[stage] for stage in ["data", "forward", "backward", "step"])
+    return {
+        "accuracy": accuracy,
+        "train_samples_per_sec": stages["samples"] / train_time,
+        "eval_samples_per_sec": len(test_idx) / eval_time,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compares bfloat16 mixed precision with float32 training")
+    parser.add_argument("--models", nargs="+", default=["spatialcnn", "temporalcnn", "fusion"], help=", ".join(MODELS))
+    parser.add_argument("--epochs", type=int, default=utils.NUM_EPOCHS)
+    parser.add_argument("--window", default="3s")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="allowed accuracy drop of bf16")
+    args = parser.parse_args()
+
+    utils.NUM_EPOCHS = args.epochs
+    X, y = load_dataset(args.window)
+    logger.info(f"CPU capability {torch.backends.cpu.get_cpu_capability()}, {torch.get_num_threads()} threads")
+    failed = []
+
+    for model in args.models:
+        model_name, cnn_mode = MODELS[model]
+        fp32 = run(model_name, cnn_mode, X, y, bf16=False)
+        bf16 = run(model_name, cnn_mode, X, y, bf16=True)
+
+        accuracy_drop = fp32["accuracy"] - bf16["accuracy"]
+        train_speedup = bf16["train_samples_per_sec"] / fp32["train_samples_per_sec"]
+        eval_speedup = bf16["eval_samples_per_sec"] / fp32["eval_samples_per_sec"]
+        logger.info(
+            f"{model_name}: accuracy fp32 {fp32['accuracy'] * 100:.2f}%, bf16 {bf16['accuracy'] * 100:.2f}%, "
+            f"training {fp32['train_samples_per_sec']:.1f} -> {bf16['train_samples_per_sec']:.1f} samples/sec "
+            f"({train_speedup:.2f}x), evaluation {eval_speedup:.2f}x"
+        )
+        if accuracy_drop > args.tolerance:
+            logger.error(f"{model_name}: bf16 accuracy lower by {accuracy_drop * 100:.2f}%")
+            failed.append(model_name)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import time, argparse
+import torch
+from train import create_model
+import scripts.models.utils as utils
+from eeg_logger import logger
+
+"""
+Measures training throughput of temporal models for different patch sizes.
+Accuracy of every patch size is measured with train.py, e.g.:
+python train.py temporal --patch-size 16
+
+Run from repository root:
+python -m benchmarks.patching --patch-sizes 0 4 8 16 32
+"""
+
+
+def samples_per_second(model: torch.nn.Module, X: torch.Tensor, steps: int) -> float:
+    y = torch.zeros(len(X), dtype=torch.long)
+    optimizer = torch.optim.Adam(model.parameters(), lr=utils.LEARNING_RATE)
+    criterion = torch.nn.CrossEntropyLoss()
+
+    for step in range(steps + 1):
+        if step == 1:  # FIRST STEP IS WARM-UP
+            start = time.perf_counter()
+        optimizer.zero_grad()
+        criterion(model(X), y).backward()
+        optimizer.step()
+
+    return steps * len(X) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks patch tokenization of temporal models")
+    parser.add_argument("--models", nargs="+", default=["TemporalTransformer", "TemporalCNNTransformer"])
+    parser.add_argument("--patch-sizes", type=int, nargs="+", default=[0, 4, 8, 16, 32], help="0 - no patching")
+    parser.add_argument("--channels", type=int, default=64)
+    parser.add_argument("--times", type=int, default=481)
+    parser.add_argument("--batch-size", type=int, default=utils.BATCH_SIZE)
+    parser.add_argument("--steps", type=int, default=5)
+    args = parser.parse_args()
+
+    for model_name in args.models:
+        X = torch.randn(args.batch_size, args.channels, args.times)
+        if "CNN" in model_name:
+            X = X.unsqueeze(1)
+
+        for patch_size in args.patch_sizes:
+            model = create_model(model_name, X.shape, patch_size=patch_size or None, patch_stride=None)
+            tokens = {}
+            hook = model.pos_encoder.register_forward_hook(lambda m, inputs, output: tokens.update(n=output.shape[1]))
+            throughput = samples_per_second(model, X, args.steps)
+            hook.remove()
+            summary = f"{tokens['n']} tokens, {throughput:.1f} samples/sec"
+            logger.info(f"{model_name}, patch size {patch_size or 1}: {summary}")
+
+
+if __name__ == "__main__":
+    main()
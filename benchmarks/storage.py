@@ -0,0 +1,80 @@
+import sys, argparse
+import numpy as np
+import torch
+from sklearn.model_selection import KFold
+from train import MODELS, create_model, load_dataset
+from scripts.dataset.eeg_dataset import EEGDataset
+from scripts.dataset.batch_loader import TensorBatchLoader
+from scripts.dataset.epoch_store import STORE_DTYPES, CompactEpochs, encode
+import scripts.models.utils as utils
+from eeg_logger import logger
+
+"""
+Accuracy of compact epoch stores (preprocess.py pack --dtype). Encodes float32 Physionet epochs
+as float16 and int16, reports memory and reconstruction error of every dtype, trains every model
+on the first cross-validation fold with every dtype and fails if accuracy is lower than with float32
+by more than --tolerance.
+
+Run from repository root:
+python -m benchmarks.storage --epochs 10
+"""
+
+
+def run(model_name: str, cnn_mode: bool, X: np.ndarray | CompactEpochs, y: np.ndarray) -> float:
+    train_idx, test_idx = next(KFold(n_splits=5, shuffle=True, random_state=42).split(y, y))
+    torch.manual_seed(utils.SEED)
+
+    train_dataset = EEGDataset(X, y, cnn_mode=cnn_mode, indices=train_idx)
+    test_dataset = EEGDataset(X, y, cnn_mode=cnn_mode, indices=test_idx)
+    train_loader = TensorBatchLoader(train_dataset, batch_size=utils.BATCH_SIZE, shuffle=True, reuse_buffers=True)
+    test_loader = TensorBatchLoader(test_dataset, batch_size=utils.BATCH_SIZE, reuse_buffers=True)
+    device = torch.device("cpu")
+
+    model = create_model(model_name, (len(train_idx), *X.shape[1:]))
+    utils.train_model(model, train_loader, device, verbose=False)
+    return utils.evaluate_model(model, test_loader, device)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compares float16 and int16 epoch storage with float32")
+    parser.add_argument("--models", nargs="+", default=list(MODELS), help=", ".join(MODELS))
+    parser.add_argument("--epochs", type=int, default=utils.NUM_EPOCHS)
+    parser.add_argument("--window", default="3s")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="allowed accuracy drop of compact storage")
+    args = parser.parse_args()
+
+    utils.NUM_EPOCHS = args.epochs
+    X, y = load_dataset(args.window)
+    X, y = (X.decode().numpy() if isinstance(X, CompactEpochs) else np.asarray(X, dtype=np.float32)), np.asarray(y)
+
+    stores = {}
+    for dtype in STORE_DTYPES:
+        stores[dtype] = X if dtype == "float32" else CompactEpochs(*encode(X, dtype))
+        error = X - (stores[dtype].decode().numpy() if dtype != "float32" else X)
+        logger.info(
+            f"{dtype}: {stores[dtype].nbytes / 2**20:.1f} MB, "
+            f"reconstruction error max {np.abs(error).max():.2e}, rms {np.sqrt(np.mean(error**2)):.2e}"
+        )
+
+    failed = []
+    for model in args.models:
+        model_name, cnn_mode = MODELS[model]
+        accuracies = {dtype: run(model_name, cnn_mode, stores[dtype], y) for dtype in STORE_DTYPES}
+        logger.info(
+            f"{model_name}: accuracy "
+            + ", ".join(
+                f"{dtype} {accuracy * 100:.2f}% ({(accuracy - accuracies['float32']) * 100:+.2f}%)"
+                for dtype, accuracy in accuracies.items()
+            )
+        )
+        for dtype, accuracy in accuracies.items():
+            if accuracies["float32"] - accuracy > args.tolerance:
+                logger.error(f"{model_name}: {dtype} accuracy lower by {(accuracies['float32'] - accuracy) * 100:.2f}%")
+                failed.append(f"{model_name} {dtype}")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import os, json, time, argparse, resource, itertools, platform, subprocess
+from datetime import datetime
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from train import MODELS, create_model
+import scripts.models.utils as utils
+from eeg_logger import logger
+
+"""
+Forward and training step throughput, latency and peak memory of all models on synthetic EEG.
+Sweeps batch size, number of channels (3 - BCI IV 2b, 22 - BCI IV 2a, 64 - Physionet),
+window length and number of torch threads. Every configuration runs in a fresh process,
+so peak RSS of one configuration does not hide the others.
+
+Results are saved as JSON, a previous results file passed with --baseline is compared
+with the new results and configurations slower by more than --tolerance are reported.
+
+Run from repository root:
+python -m benchmarks.throughput --output results.json
+python -m benchmarks.throughput --models temporal --batch-sizes 32 --baseline results.json --output new.json
+python -m benchmarks.throughput --compare new.json --baseline results.json
+"""
+
+METRICS: list[str] = ["samples_per_sec", "latency_p50_ms", "latency_p99_ms", "peak_rss_mb"]
+
+
+def __peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def __time_steps(step, batch_size: int, steps: int, warmup: int) -> dict:
+    latencies = []
+    for i in range(warmup + steps):
+        start = time.perf_counter()
+        step()
+        if i >= warmup:
+            latencies.append(time.perf_counter() - start)
+
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    return {
+        "samples_per_sec": batch_size * steps / sum(latencies),
+        "latency_p50_ms": p50,
+        "latency_p99_ms": p99,
+        "peak_rss_mb": __peak_rss_mb(),  # FORWARD RUNS FIRST, SO TRAIN PEAK INCLUDES IT
+    }
+
+
+def measure(config: dict, steps: int, warmup: int, results: mp.Queue) -> None:
+    torch.manual_seed(utils.SEED)
+    torch.set_num_threads(config["threads"])
+    model_name, cnn_mode = MODELS[config["model"]]
+
+    X = torch.randn(config["batch_size"], config["channels"], config["window"])
+    if cnn_mode:
+        X = X.unsqueeze(1)
+    y = torch.randint(0, utils.NUM_CLASSES, (config["batch_size"],))
+
+    model = create_model(model_name, X.shape)
+    optimizer = torch.optim.Adam(model.parameters(), lr=utils.LEARNING_RATE)
+    criterion = torch.nn.CrossEntropyLoss()
+
+    def forward_step():
+        with torch.inference_mode():
+            model(X)
+
+    def train_step():
+        optimizer.zero_grad()
+        criterion(model(X), y).backward()
+        optimizer.step()
+
+    model.eval()
+    forward = __time_steps(forward_step, len(X), steps, warmup)
+    model.train()
+    train = __time_steps(train_step, len(X), steps, warmup)
+    results.put({"forward": forward, "train": train})
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "torch": torch.__version__,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def config_key(config: dict) -> tuple:
+    return config["model"], config["batch_size"], config["channels"], config["window"], config["threads"]
+
+
+def compare(baseline: dict, results: dict, tolerance: float) -> list[str]:
+    """
+    :return: descriptions of regressions, lower throughput or higher latency by more than tolerance
+    """
+    baseline_results = {config_key(result["config"]): result for result in baseline["results"]}
+    regressions = []
+
+    for result in results["results"]:
+        previous = baseline_results.get(config_key(result["config"]))
+        if previous is None or "error" in result or "error" in previous:
+            continue
+
+        for mode in ["forward", "train"]:
+            for metric in METRICS:
+                old, new = previous[mode][metric], result[mode][metric]
+                change = (new - old) / old
+                worse = -change if metric == "samples_per_sec" else change
+                if worse > tolerance:
+                    regressions.append(f"{config_key(result['config'])} {mode} {metric}: {old:.2f} -> {new:.2f}")
+
+    return regressions
+
+
+def __log_regressions(baseline_path: str, results: dict, tolerance: float) -> None:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    regressions = compare(baseline, results, tolerance)
+    for regression in regressions:
+        logger.warning(f"Regression {regression}")
+    logger.info(f"{len(regressions)} regressions compared to {baseline_path} (tolerance {tolerance * 100:.0f}%)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks throughput, latency and memory of all models")
+    parser.add_argument("--models", nargs="+", default=list(MODELS), help=", ".join(MODELS))
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, utils.BATCH_SIZE])
+    parser.add_argument("--channels", type=int, nargs="+", default=[3, 22, 64])
+    parser.add_argument("--windows", type=int, nargs="+", default=[480, 960, 1750], help="window lengths in samples")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, torch.get_num_threads()])
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", default=None, help="previous results to compare with")
+    parser.add_argument("--compare", default=None, help="compares this results file with baseline without running")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative change reported as regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        if not args.baseline:
+            parser.error("--compare requires --baseline")
+        with open(args.compare) as f:
+            __log_regressions(args.baseline, json.load(f), args.tolerance)
+        return
+
+    context = mp.get_context("spawn")
+    queue = context.Queue()
+    results = {"environment": environment(), "steps": args.steps, "results": []}
+
+    for model, batch_size, channels, window, threads in itertools.product(
+        args.models, args.batch_sizes, args.channels, args.windows, sorted(set(args.threads))
+    ):
+        config = {"model": model, "batch_size": batch_size, "channels": channels, "window": window, "threads": threads}
+        process = context.Process(target=measure, args=(config, args.steps, args.warmup, queue))
+        process.start()
+        process.join()
+
+        if process.exitcode != 0:
+            logger.error(f"{config_key(config)}: failed with exit code {process.exitcode}")
+            results["results"].append({"config": config, "error": process.exitcode})
+            continue
+
+        result = {"config": config, **queue.get()}
+        results["results"].append(result)
+        forward, train = result["forward"], result["train"]
+        logger.info(
+            f"{config_key(config)}: forward {forward['samples_per_sec']:.1f} samples/sec "
+            f"(p50 {forward['latency_p50_ms']:.1f} ms, p99 {forward['latency_p99_ms']:.1f} ms), "
+            f"train {train['samples_per_sec']:.1f} samples/sec "
+            f"(p50 {train['latency_p50_ms']:.1f} ms, p99 {train['latency_p99_ms']:.1f} ms), "
+            f"peak RSS {train['peak_rss_mb']:.0f} MB"
+        )
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    logger.info(f"Results of {len(results['results'])} configurations saved to {args.output}")
+
+    if args.baseline:
+        __log_regressions(args.baseline, results, args.tolerance)
+
+
+if __name__ == "__main__":
+    main()
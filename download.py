@@ -1,162 +1,170 @@
-import requests, zipfile, os, shutil, sys
-import numpy as np
-from mne.datasets.eegbci import load_data
+import os, argparse
+from functools import partial
+import requests
+from scripts.download.engine import MANIFEST, TIMEOUT, WORKERS, fetch_all, session, verify_manifest, write_manifest
+from scripts.download.stream_zip import extract_stream
 from eeg_logger import logger
 
 DATA_BASE_DIR: str = "./data"
-
-
-def download_BCI_III_3a(path: str) -> None:
-
-    urls: list[str] = [
-        "https://www.bbci.de/competition/download/competition_iii/graz/k3b.gdf",
-        "https://www.bbci.de/competition/download/competition_iii/graz/k6b.gdf",
-        "https://www.bbci.de/competition/download/competition_iii/graz/l1b.gdf",
+BCI_III_URL: str = "https://www.bbci.de/competition/download/competition_iii/graz"
+BCI_IV_URL: str = "https://www.bbci.de/competition/download/competition_iv"
+PHYSIONET_URL: str = "https://physionet.org/files/eegmmidb/1.0.0"
+PHYSIONET_RUNS: list[int] = [4, 8, 12]  # RUNS FOR MOTOR IMAGERY
+
+
+def download_BCI_III_3a(path: str, base_url: str = BCI_III_URL, workers: int = WORKERS) -> None:
+    """
+    :param base_url: directory with k3b.gdf, k6b.gdf and l1b.gdf, e.g. a local mirror
+    :param workers: number of files downloaded concurrently
+    """
+    files = [
+        (f"{base_url}/{name}.gdf", f"S{subject_index}/{subject_index}.gdf")
+        for subject_index, name in enumerate(["k3b", "k6b", "l1b"], start=1)
     ]
 
-    if os.path.exists(path):
-        logger.info(f"Dataset already downloaded in {path}")
+    logger.info(f"Downloading BCI III 3a data from {base_url}...")
+    failed = fetch_all(files, path, workers)
+    if failed:
+        logger.error(f"Failed to download BCI III 3a files: {', '.join(failed)}")
         return
+    logger.info(f"Saved data in {path}")
 
-    for index, url in enumerate(urls):
-
-        subject_index: int = index + 1
-        subject_dir: str = f"{path}/S{subject_index}"
-
-        logger.info(f"Downloading data from {url}...")
-        r = requests.get(url, stream=True)
-        if r.status_code != 200:
-            logger.error(
-                f"Failed to download BCI III 3a dataset, subject {subject_index}. Status code: {r.status_code}"
-            )
-            continue
-
-        subject_dir: str = f"{path}/S{subject_index}"
 
-        if not os.path.exists(subject_dir):
-            os.makedirs(subject_dir)
+def download_BCI_IV_2a(path: str, base_url: str = BCI_IV_URL) -> None:
+    download_BCI_IV(path, f"{base_url}/BCICIV_2a_gdf.zip", "BCI 2a")
 
-        with open(f"{subject_dir}/{subject_index}.gdf", "wb") as file:
-            for chunk in r.iter_content(1024):
-                file.write(chunk)
-        logger.info(f"Saved data in {subject_dir}")
 
+def download_BCI_IV_2b(path: str, base_url: str = BCI_IV_URL) -> None:
+    download_BCI_IV(path, f"{base_url}/BCICIV_2b_gdf.zip", "BCI 2b")
 
-def download_BCI_IV_2a(path: str) -> None:
-    url: str = "https://www.bbci.de/competition/download/competition_iv/BCICIV_2a_gdf.zip"
-    zip_path: str = "./data/BCI_IV_2a.zip"
 
-    if os.path.exists(path):
+def download_BCI_IV(path: str, url: str, dataset_name: str) -> None:
+    """
+    Extracts archive while it downloads straight into subject directories, the archive is not saved.
+    """
+    if verify_manifest(path):
         logger.info(f"Dataset already downloaded in {path}")
         return
 
     logger.info(f"Downloading data from {url}...")
-    r = requests.get(url, stream=True)
-
-    if r.status_code != 200:
-        logger.error(f"Failed to download BCI 2a dataset. Status code: {r.status_code}")
+    try:
+        checksums = extract_stream(url, partial(subject_file_BCI_IV, path))
+    except Exception as e:
+        logger.error(f"Failed to download {dataset_name} dataset: {e}")
         return
 
-    with open(zip_path, "wb") as file:
-        for chunk in r.iter_content(1024):
-            file.write(chunk)
-
-    with zipfile.ZipFile(zip_path, "r") as zip_ref:
-        zip_ref.extractall(path)
+    # MANIFEST IS WRITTEN ONLY WHEN THE WHOLE ARCHIVE WAS EXTRACTED
+    write_manifest(f"{path}/{MANIFEST}", {os.path.relpath(file, path): digest for file, digest in checksums.items()})
     logger.info(f"Extraction complete: Files saved in {path}")
 
-    os.remove(zip_path)
-    create_subject_dir_structure_BCI_IV(path)
-
-
-def download_BCI_IV_2b(path: str) -> None:
-    url: str = "https://www.bbci.de/competition/download/competition_iv/BCICIV_2b_gdf.zip"
-    zip_path: str = "./data/BCI_IV_2b.zip"
 
-    if os.path.exists(path):
-        logger.info(f"Dataset already downloaded in {path}")
-        return
+def subject_file_BCI_IV(path: str, member: str) -> str:
+    filename = os.path.basename(member)
+    return f"{path}/S{filename[1:3]}/{filename}"
 
-    logger.info(f"Downloading data from {url}...")
-    r = requests.get(url, stream=True)
 
-    if r.status_code != 200:
-        logger.error(f"Failed to download BCI 2b dataset. Status code: {r.status_code}")
-        return
+def download_Physionet(
+    path: str, num_patients: int = 109, base_url: str = PHYSIONET_URL, workers: int = WORKERS
+) -> None:
+    """
+    Downloads motor imagery runs of subjects 1 to num_patients, subjects with valid runs already
+    downloaded are skipped, so the dataset can grow incrementally.
 
-    with open(zip_path, "wb") as file:
-        for chunk in r.iter_content(1024):
-            file.write(chunk)
-
-    with zipfile.ZipFile(zip_path, "r") as zip_ref:
-        zip_ref.extractall(path)
-    logger.info(f"Extraction complete: Files saved in {path}")
-
-    os.remove(zip_path)
-    create_subject_dir_structure_BCI_IV(path)
-
-
-def create_subject_dir_structure_BCI_IV(path: str) -> None:
-
-    for filename in os.listdir(path):
-        subject_dir: str = f"{path}/S{filename[1:3]}"
-
-        if not os.path.exists(subject_dir):
-            os.makedirs(subject_dir)
-
-        shutil.move(f"{path}/{filename}", subject_dir)
-
-    logger.info(f"Subject file structure created in {path}")
-
-
-def download_Physionet(path: str, num_patients: int = 109) -> None:
-
-    if os.path.exists(path):
+    :param base_url: directory with S001/S001R04.edf..., e.g. a local mirror
+    :param workers: number of files downloaded concurrently
+    """
+    subjects = [f"S{subject:03d}" for subject in range(1, num_patients + 1)]
+    missing = [subject for subject in subjects if not all(valid_edf(f"{path}/{file}") for file in __run_files(subject))]
+    if not missing:
         logger.info(f"Dataset already downloaded in {path}")
         return
+    logger.info(f"Downloading Physionet data of {len(missing)} of {num_patients} subjects from {base_url}...")
 
-    runs = [4, 8, 12]  # RUNS FOR MOTOR IMAGERY
-    subject_list: list[int] = np.arange(1, num_patients + 1, 1).tolist()  # PATIENTS TO DOWNLOAD
-    custom_mne_dir = "MNE-eegbci-data"  # MNE IMPORTS DATA TO THIS DIRECTORY BY DEFAULT
+    files = [(f"{base_url}/{file}", file) for subject in missing for file in __run_files(subject)]
+    failed = fetch_all(files, path, workers, expected=__physionet_checksums(base_url))
 
-    logger.info(f"Downloading Physionet data...")
-    filenames: list[str] = load_data(subjects=subject_list, runs=runs, path=path, update_path=False)
+    for file in failed:
+        logger.error(f"Failed to download Physionet file {file}")
     logger.info(f"Download complete: Files saved in {path}.")
 
-    # HERE WE MOVE THE FILES FOR BETTER READABILITY
-    for filename in filenames:
-        parent_dir = os.path.basename(os.path.abspath(os.path.join(filename, os.pardir)))
-        dest_path = f"{path}/{parent_dir}/"
-        if not os.path.exists(dest_path):
-            os.makedirs(dest_path)
-        shutil.move(filename, dest_path)
-    logger.info(f"Files divided into subdirectories for {num_patients} patients in {path}")
 
-    # REMOVE CUSTOM MNE DIRECTORY
-    shutil.rmtree(f"{path}/{custom_mne_dir}")
+def __run_files(subject: str) -> list[str]:
+    return [f"{subject}/{subject}R{run:02d}.edf" for run in PHYSIONET_RUNS]
+
+
+def __physionet_checksums(base_url: str) -> dict[str, str]:
+    """
+    :return: checksums published with the dataset, empty if the server has none, e.g. a local mirror
+    """
+    try:
+        response = session().get(f"{base_url}/SHA256SUMS.txt", timeout=TIMEOUT)
+        response.raise_for_status()
+    except requests.RequestException:
+        logger.warning(f"No checksums published in {base_url}, downloads are not verified")
+        return {}
+    lines = (line.split(maxsplit=1) for line in response.text.splitlines() if line.strip())
+    return {name.strip(): digest for digest, name in lines}
+
+
+def valid_edf(path: str) -> bool:
+    """
+    :return: True if path is an EDF file with complete header and all data records of its header
+    """
+    if not os.path.exists(path):
+        return False
+    with open(path, "rb") as file:
+        header = file.read(256)
+        if len(header) < 256 or header[:8] != b"0       ":
+            return False
+        try:
+            header_bytes, num_records, num_signals = int(header[184:192]), int(header[236:244]), int(header[252:256])
+            file.seek(256 + num_signals * 216)  # SAMPLES PER RECORD FOLLOW 216 BYTES OF OTHER SIGNAL FIELDS
+            samples = sum(int(file.read(8)) for _ in range(num_signals))
+        except ValueError:
+            return False
+    return num_records > 0 and os.path.getsize(path) == header_bytes + num_records * samples * 2  # INT16 SAMPLES
 
 
 def main() -> None:
-    dataset_name: str = sys.argv[1] if len(sys.argv) > 1 else ""
+    parser = argparse.ArgumentParser(description="Downloads raw motor imagery datasets")
+    parser.add_argument("dataset", nargs="?", default="", help="bci3a, bci2a, bci2b, physionet, all by default")
+    parser.add_argument("--base-url", default=None, help="downloads datasets from this mirror, e.g. local server")
+    parser.add_argument("--subjects", type=int, default=2, help="number of Physionet subjects, 109 at most")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="number of files downloaded concurrently")
+    args = parser.parse_args()
 
     if not os.path.exists(DATA_BASE_DIR):
         os.makedirs(DATA_BASE_DIR)
 
-    match dataset_name:
+    bci_iii_url = args.base_url or BCI_III_URL
+    bci_iv_url = args.base_url or BCI_IV_URL
+    physionet_url = args.base_url or PHYSIONET_URL
+
+    match args.dataset:
         case "bci3a":
-            download_BCI_III_3a(path=f"{DATA_BASE_DIR}/BCI_III_3a")
+            download_BCI_III_3a(path=f"{DATA_BASE_DIR}/BCI_III_3a", base_url=bci_iii_url, workers=args.workers)
         case "bci2a":
-            download_BCI_IV_2a(path=f"{DATA_BASE_DIR}/BCI_IV_2a")
+            download_BCI_IV_2a(path=f"{DATA_BASE_DIR}/BCI_IV_2a", base_url=bci_iv_url)
         case "bci2b":
-            download_BCI_IV_2b(path=f"{DATA_BASE_DIR}/BCI_IV_2b")
+            download_BCI_IV_2b(path=f"{DATA_BASE_DIR}/BCI_IV_2b", base_url=bci_iv_url)
         case "physionet":
-            download_Physionet(path=f"{DATA_BASE_DIR}/Physionet", num_patients=2)
+            download_Physionet(
+                path=f"{DATA_BASE_DIR}/Physionet",
+                num_patients=args.subjects,
+                base_url=physionet_url,
+                workers=args.workers,
+            )
         case _:
             logger.info("Downloading all datasets")
-            download_BCI_III_3a(path=f"{DATA_BASE_DIR}/BCI_III_3a")
-            download_BCI_IV_2a(path=f"{DATA_BASE_DIR}/BCI_IV_2a")
-            download_BCI_IV_2b(path=f"{DATA_BASE_DIR}/BCI_IV_2b")
-            download_Physionet(path=f"{DATA_BASE_DIR}/Physionet", num_patients=2)
+            download_BCI_III_3a(path=f"{DATA_BASE_DIR}/BCI_III_3a", base_url=bci_iii_url, workers=args.workers)
+            download_BCI_IV_2a(path=f"{DATA_BASE_DIR}/BCI_IV_2a", base_url=bci_iv_url)
+            download_BCI_IV_2b(path=f"{DATA_BASE_DIR}/BCI_IV_2b", base_url=bci_iv_url)
+            download_Physionet(
+                path=f"{DATA_BASE_DIR}/Physionet",
+                num_patients=args.subjects,
+                base_url=physionet_url,
+                workers=args.workers,
+            )
 
 
 if __name__ == "__main__":
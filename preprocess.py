@@ -1,33 +1,64 @@
-import os, sys
+import os, argparse
 import scripts.preprocessing.bci2a as bci2a
 import scripts.preprocessing.bci2b as bci2b
 import scripts.preprocessing.bci3a as bci3a
 import scripts.preprocessing.physionet as physionet
+from scripts.dataset.epoch_store import STORE_DTYPES, pack_epochs
 from eeg_logger import logger
 from download import DATA_BASE_DIR
 
 PREPROCESSED_DATA_BASE_DIR: str = "./preprocessed_data"
+EPOCH_STORE_DIR: str = f"{PREPROCESSED_DATA_BASE_DIR}/store"
+
+
+def pack_physionet(dtype: str = "float32") -> None:
+    """
+    Packs preprocessed Physionet epochs (3s and 6s) into epoch stores used by train.py.
+
+    :param dtype: dtype of stored epochs, one of STORE_DTYPES
+    """
+    physionet_dir = f"{PREPROCESSED_DATA_BASE_DIR}/Physionet"
+
+    if not os.path.exists(physionet_dir):
+        logger.error(f"No preprocessed data to pack in {physionet_dir}")
+        return
+
+    for window in ["3s", "6s"]:
+        subject_files = {}
+        for subject in os.listdir(physionet_dir):
+            file_path = os.path.join(physionet_dir, subject, f"PA{subject[1:4]}-{window}-epo.fif")
+            if os.path.exists(file_path):
+                subject_files[subject] = file_path
+        pack_epochs(subject_files, f"{EPOCH_STORE_DIR}/Physionet-{window}", dtype)
 
 
 def main() -> None:
-    dataset_name: str = sys.argv[1] if len(sys.argv) > 1 else ""
+    parser = argparse.ArgumentParser(description="Extracts epochs from downloaded datasets")
+    parser.add_argument("dataset", nargs="?", default="", help="bci3a, bci2a, bci2b, physionet or pack")
+    parser.add_argument("--jobs", type=int, default=1, help="number of subjects preprocessed in parallel")
+    parser.add_argument("--force", action="store_true", help="preprocess all subjects, even unchanged ones")
+    parser.add_argument("--dtype", default="float32", choices=STORE_DTYPES, help="dtype of packed epoch stores")
+    args = parser.parse_args()
+    options = {"save_path_root": PREPROCESSED_DATA_BASE_DIR, "jobs": args.jobs, "force": args.force}
 
     if not os.path.exists(PREPROCESSED_DATA_BASE_DIR):
         os.makedirs(PREPROCESSED_DATA_BASE_DIR)
 
-    match dataset_name:
+    match args.dataset:
         case "bci3a":
-            bci3a.extract_epochs(data_path=f"{DATA_BASE_DIR}/BCI_III_3a", save_path_root=PREPROCESSED_DATA_BASE_DIR)
+            bci3a.extract_epochs(data_path=f"{DATA_BASE_DIR}/BCI_III_3a", **options)
         case "bci2a":
-            bci2a.extract_epochs(data_path=f"{DATA_BASE_DIR}/BCI_IV_2a", save_path_root=PREPROCESSED_DATA_BASE_DIR)
+            bci2a.extract_epochs(data_path=f"{DATA_BASE_DIR}/BCI_IV_2a", **options)
         case "bci2b":
-            bci2b.extract_epochs(data_path=f"{DATA_BASE_DIR}/BCI_IV_2b", save_path_root=PREPROCESSED_DATA_BASE_DIR)
+            bci2b.extract_epochs(data_path=f"{DATA_BASE_DIR}/BCI_IV_2b", **options)
         case "physionet":
-            physionet.extract_epochs(data_path=f"{DATA_BASE_DIR}/Physionet", save_path_root=PREPROCESSED_DATA_BASE_DIR)
+            physionet.extract_epochs(data_path=f"{DATA_BASE_DIR}/Physionet", **options)
+        case "pack":
+            pack_physionet(args.dtype)
         case _:
             logger.warning("No dataset to preprocess provided")
 
 
 if __name__ == "__main__":
     main()
-    # input("Press Enter to exit...")
\ No newline at end of file
+    # input("Press Enter to exit...")
@@ -0,0 +1,58 @@
+import torch
+
+"""
+Augmentation of training batches, applied by utils.train_model after every batch is moved to its device.
+
+Every augmentation is a few whole-batch tensor operations drawing from one seeded generator, so training
+with the same seed sees the same augmented batches and preprocessed epochs can be stored without noise.
+Batches are (B, C, T) or (B, 1, C, T) of CNN models, channels are the second to last and time the last axis.
+"""
+
+AUGMENTATIONS: list[str] = ["noise", "scale", "shift", "channel_dropout"]
+
+
+class BatchAugmenter:
+    def __init__(
+        self, noise: float = 0.0, scale: float = 0.0, shift: int = 0, channel_dropout: float = 0.0, seed: int = 0
+    ):
+        """
+        :param float noise: standard deviation of Gaussian noise added to every sample, a of X* = X + aN
+        :param float scale: amplitude of every channel of every sample is scaled by uniform factor in [1 - scale, 1 + scale]
+        :param int shift: every sample is circularly shifted in time by uniform number of samples in [-shift, shift]
+        :param float channel_dropout: probability of zeroing every channel of every sample
+        :param int seed: seed of generator
+        """
+        self.noise = noise
+        self.scale = scale
+        self.shift = shift
+        self.channel_dropout = channel_dropout
+        self.seed = seed
+        self.generator: torch.Generator | None = None
+
+    def __call__(self, X: torch.Tensor) -> torch.Tensor:
+        if self.generator is None or self.generator.device != X.device:
+            self.generator = torch.Generator(device=X.device).manual_seed(self.seed)
+        channels = (*X.shape[:-1], 1)  # ONE VALUE PER CHANNEL OF EVERY SAMPLE
+
+        if self.shift:
+            offsets = torch.randint(-self.shift, self.shift + 1, (len(X), 1), generator=self.generator, device=X.device)
+            time = (torch.arange(X.shape[-1], device=X.device) - offsets) % X.shape[-1]
+            X = X.gather(-1, time.view(len(X), *[1] * (X.dim() - 2), -1).expand_as(X))
+        if self.scale:
+            factors = torch.rand(channels, generator=self.generator, device=X.device, dtype=X.dtype)
+            X = X * (1 - self.scale + 2 * self.scale * factors)
+        if self.channel_dropout:
+            keep = torch.rand(channels, generator=self.generator, device=X.device) >= self.channel_dropout
+            X = X * keep
+        if self.noise:
+            X = X + self.noise * torch.randn(X.shape, generator=self.generator, device=X.device, dtype=X.dtype)
+
+        return X
+
+    def get_state(self) -> torch.Tensor | None:
+        return self.generator.get_state() if self.generator is not None else None
+
+    def set_state(self, state: torch.Tensor | None, device: torch.device) -> None:
+        self.generator = torch.Generator(device=device).manual_seed(self.seed)
+        if state is not None:
+            self.generator.set_state(state)
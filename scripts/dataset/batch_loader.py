@@ -0,0 +1,80 @@
+import torch
+from scripts.dataset.eeg_dataset import EEGDataset
+
+
+class TensorBatchLoader:
+    """
+    Drop-in replacement of DataLoader for datasets that are already one in-memory tensor.
+    Every batch is gathered with a single index_select on the backing tensors instead of
+    collating batch_size separate items. Batches of compact float16/int16 datasets are decoded into float32.
+    Datasets with indices (fold views) are gathered from their shared tensors, no fold-sized copy is made.
+    """
+
+    def __init__(
+        self,
+        dataset: EEGDataset,
+        batch_size: int = 1,
+        shuffle: bool = False,
+        drop_last: bool = False,
+        reuse_buffers: bool = False,
+        pin_memory: bool = False,
+        generator: torch.Generator | None = None,
+    ):
+        """
+        :param dataset: dataset with X and y tensors
+        :param int batch_size: number of samples in batch
+        :param bool shuffle: reshuffles samples at every epoch
+        :param bool drop_last: drops the last incomplete batch
+        :param bool reuse_buffers: gathers every batch into the same preallocated tensors,
+            batches are then only valid until the next one is requested
+        :param bool pin_memory: allocates batches in page-locked memory for faster copies to GPU
+        :param generator: generator used for shuffling, torch global generator by default
+        """
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.reuse_buffers = reuse_buffers
+        self.pin_memory = pin_memory and torch.cuda.is_available()
+        self.generator = generator
+        self.__X_buffer: torch.Tensor | None = None
+        self.__y_buffer: torch.Tensor | None = None
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.dataset) // self.batch_size
+        return (len(self.dataset) + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        X, y = self.dataset.X, self.dataset.y
+        n = len(self.dataset)
+
+        if self.shuffle:
+            order = torch.randperm(n, generator=self.generator)
+        else:
+            order = torch.arange(n)
+
+        for batch in range(len(self)):
+            idx = self.dataset.epochs(order[batch * self.batch_size : (batch + 1) * self.batch_size])
+            yield self.__gather(X, y, idx)
+
+    def __gather(self, X: torch.Tensor, y: torch.Tensor, idx: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        if not self.reuse_buffers:
+            X_batch, y_batch = self.dataset.decode(X.index_select(0, idx), idx), y.index_select(0, idx)
+            if self.pin_memory:
+                X_batch, y_batch = X_batch.pin_memory(), y_batch.pin_memory()
+            return X_batch, y_batch
+
+        if self.__X_buffer is None:
+            self.__X_buffer = torch.empty(
+                (self.batch_size, *X.shape[1:]), dtype=torch.float32, pin_memory=self.pin_memory
+            )
+            self.__y_buffer = torch.empty((self.batch_size, *y.shape[1:]), dtype=y.dtype, pin_memory=self.pin_memory)
+
+        X_batch, y_batch = self.__X_buffer[: len(idx)], self.__y_buffer[: len(idx)]
+        if self.dataset.compact:
+            self.dataset.decode(X.index_select(0, idx), idx, out=X_batch)
+        else:
+            torch.index_select(X, 0, idx, out=X_batch)
+        torch.index_select(y, 0, idx, out=y_batch)
+        return X_batch, y_batch
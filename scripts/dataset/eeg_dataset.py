@@ -1,17 +1,60 @@
 import torch
 from numpy import ndarray
 from torch.utils.data import Dataset
+from scripts.dataset.epoch_store import CompactEpochs, decode
 
 
 class EEGDataset(Dataset):
-    def __init__(self, X: ndarray, y: ndarray, cnn_mode=False):
-        self.X = torch.tensor(X, dtype=torch.float32)
+    def __init__(
+        self,
+        X: ndarray | torch.Tensor | CompactEpochs,
+        y: ndarray | torch.Tensor,
+        cnn_mode=False,
+        indices: ndarray | torch.Tensor | None = None,
+    ):
+        """
+        :param X: float epochs, or compact float16/int16 epochs that stay compact and are decoded per batch
+        :param indices: epochs of X and y in this dataset, e.g. one cross-validation fold, all epochs by default.
+            X is not copied, float32 epochs and tensors are shared with the caller and gathered per batch
+        """
+        self.scale = self.offset = None
+        if isinstance(X, CompactEpochs):
+            self.X, self.scale, self.offset = X.data, X.scale, X.offset
+        else:
+            self.X = torch.as_tensor(X, dtype=torch.float32)
         if cnn_mode:
-            self.X = self.X.unsqueeze(1)  # CNN models require 4 dimensions
-        self.y = torch.tensor(y, dtype=torch.long)
+            self.X = self.X.unsqueeze(1)  # CNN models require 4 dimensions, view without copy
+            if self.scale is not None:
+                self.scale, self.offset = self.scale.unsqueeze(1), self.offset.unsqueeze(1)
+        self.y = torch.as_tensor(y, dtype=torch.long)
+        self.indices = torch.as_tensor(indices, dtype=torch.long) if indices is not None else None
 
     def __len__(self):
-        return len(self.X)
+        return len(self.indices) if self.indices is not None else len(self.X)
 
     def __getitem__(self, idx):
-        return self.X[idx], self.y[idx]
+        idx = self.epochs(idx)
+        return self.decode(self.X[idx], idx), self.y[idx]
+
+    @property
+    def compact(self) -> bool:
+        return self.X.dtype != torch.float32
+
+    def epochs(self, idx):
+        """
+        :param idx: positions in this dataset
+        :return: indices of X and y at idx
+        """
+        return self.indices[idx] if self.indices is not None else idx
+
+    def decode(self, X: torch.Tensor, idx, out: torch.Tensor | None = None) -> torch.Tensor:
+        """
+        :param X: epochs of X at idx
+        :param idx: indices of X, see epochs
+        :return: float32 epochs, written into out if given
+        """
+        if not self.compact:
+            return X if out is None else out.copy_(X)
+        if self.scale is None:
+            return decode(X, out=out)
+        return decode(X, self.scale[idx], self.offset[idx], out=out)
@@ -0,0 +1,242 @@
+import hashlib, os
+import numpy as np
+import mne
+import torch
+from eeg_logger import logger
+
+"""
+Consolidated epoch store.
+
+All preprocessed epochs of a dataset are packed once into a single contiguous array
+saved as a regular .npy file, next to a small .npz index:
+
+<store_path>.npy        - epochs data, shape: (n_epochs, n_channels, n_times)
+<store_path>-index.npz  - y (labels), subjects (subject name per epoch), offsets (first epoch of every subject),
+                          subject_names, content_hash (sha1 of the packed data), dtype of data and for int16
+                          stores scale and offset of every channel of every epoch
+
+The data file is opened with np.load(mmap_mode=...), so opening the store does not parse or copy anything
+and all worker processes reading it share the same pages through the page cache.
+
+Data is float32 by default. float16 and int16 stores take half of the memory and are decoded into float32
+only per batch by TensorBatchLoader (see CompactEpochs). float16 keeps ~3 significant digits and suits
+z-scored epochs, int16 maps the range of every channel of every epoch onto 65535 levels:
+X = encoded * scale + offset
+"""
+
+DATA_SUFFIX: str = ".npy"
+INDEX_SUFFIX: str = "-index.npz"
+STORE_DTYPES: list[str] = ["float32", "float16", "int16"]
+INT16_MAX: int = 32767
+
+
+def load_subject_data(file_path: str) -> tuple[np.ndarray, np.ndarray]:
+    epochs = mne.read_epochs(file_path, preload=True, verbose=False)
+    """
+    Format danych: (Number of epochs, channels, n_times)
+    Dla danych 3-sekundowych: 3 sekundy x 160 Hz = 480, n_times = 480
+    Dla danych 6-sekundowych: 6 sekund x 160 Hz = 960, n_times = 960
+    """
+    # Data
+    X = epochs.get_data().astype(np.float32)  # FLOAT64 COPY ONLY FOR ONE SUBJECT AT A TIME
+    # Labels
+    y = epochs.events[:, -1]
+    # Labels should be numered 0, 1, 2 ...
+    y = np.array([0 if label == 2 else 1 for label in y])
+    return X, y
+
+
+def store_exists(store_path: str) -> bool:
+    return os.path.exists(store_path + DATA_SUFFIX) and os.path.exists(store_path + INDEX_SUFFIX)
+
+
+def encode(X: np.ndarray, dtype: str = "float32") -> tuple[np.ndarray, np.ndarray | None, np.ndarray | None]:
+    """
+    :param X: float epochs (n_epochs, n_channels, n_times)
+    :param dtype: one of STORE_DTYPES
+    :return: encoded epochs, scale and offset (n_epochs, n_channels, 1) of int16 epochs, None otherwise
+    """
+    match dtype:
+        case "float32" | "float16":
+            return X.astype(dtype, copy=False), None, None
+        case "int16":
+            low, high = X.min(axis=-1, keepdims=True), X.max(axis=-1, keepdims=True)
+            offset = ((high + low) / 2).astype(np.float32)
+            scale = ((high - low) / (2 * INT16_MAX)).astype(np.float32)
+            scale[scale == 0] = 1.0
+            encoded = np.rint((X - offset) / scale).clip(-INT16_MAX, INT16_MAX).astype(np.int16)
+            return encoded, scale, offset
+        case _:
+            raise ValueError(f"Unsupported store dtype: {dtype}. Supported dtypes: {STORE_DTYPES}")
+
+
+def decode(
+    data: torch.Tensor, scale: torch.Tensor | None = None, offset: torch.Tensor | None = None, out=None
+) -> torch.Tensor:
+    """
+    :return: float32 epochs, written into out if given
+    """
+    if scale is None:
+        return data.float() if out is None else out.copy_(data)
+    X = torch.mul(data, scale, out=out)
+    return X.add_(offset)
+
+
+def pack_epochs(subject_files: dict[str, str], store_path: str, dtype: str = "float32") -> None:
+    """
+    Packs epochs of all subjects into one contiguous store.
+    The store is written in two passes (headers first, data second), so only one subject
+    is held in memory at a time. Files are written under temporary names and renamed when complete.
+
+    :param subject_files: mapping of subject name to its -epo.fif file
+    :param store_path: path of the store without suffix, e.g. ./preprocessed_data/store/Physionet-3s
+    :param dtype: dtype of stored epochs, one of STORE_DTYPES
+    """
+    subjects = sorted(subject_files)
+    if not subjects:
+        logger.error(f"No epochs to pack into {store_path}")
+        return
+
+    os.makedirs(os.path.dirname(store_path) or ".", exist_ok=True)
+
+    # FIRST PASS - ONLY HEADERS, TO KNOW THE FINAL SHAPE
+    counts = []
+    for subject in subjects:
+        epochs = mne.read_epochs(subject_files[subject], preload=False, verbose=False)
+        counts.append(len(epochs.events))
+        n_channels, n_times = len(epochs.ch_names), len(epochs.times)
+
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    data_tmp_path = store_path + ".tmp" + DATA_SUFFIX
+    data = np.lib.format.open_memmap(
+        data_tmp_path, mode="w+", dtype=np.dtype(dtype), shape=(offsets[-1], n_channels, n_times)
+    )
+    scales = np.empty((offsets[-1], n_channels, 1), dtype=np.float32) if dtype == "int16" else None
+    shifts = np.empty((offsets[-1], n_channels, 1), dtype=np.float32) if dtype == "int16" else None
+    y = np.empty(offsets[-1], dtype=np.int64)
+    subject_of_epoch = np.empty(offsets[-1], dtype=np.int32)
+    content_hash = hashlib.sha1()
+
+    # SECOND PASS - DATA
+    for index, subject in enumerate(subjects):
+        X_subject, y_subject = load_subject_data(subject_files[subject])
+        start, stop = offsets[index], offsets[index + 1]
+        data[start:stop], scale, offset = encode(X_subject, dtype)
+        if scale is not None:
+            scales[start:stop], shifts[start:stop] = scale, offset
+            content_hash.update(scale.tobytes() + offset.tobytes())
+        y[start:stop] = y_subject
+        subject_of_epoch[start:stop] = index
+        content_hash.update(data[start:stop].tobytes())
+        logger.info(f"Packed {stop - start} epochs of subject {subject}")
+
+    content_hash.update(y.tobytes())
+    data.flush()
+    del data
+
+    index_tmp_path = store_path + ".tmp" + INDEX_SUFFIX
+    scaling = {"scale": scales, "offset": shifts} if scales is not None else {}
+    np.savez(
+        index_tmp_path,
+        y=y,
+        subjects=subject_of_epoch,
+        offsets=offsets,
+        subject_names=np.array(subjects),
+        content_hash=np.array(content_hash.hexdigest()),
+        dtype=np.array(dtype),
+        **scaling,
+    )
+    os.replace(data_tmp_path, store_path + DATA_SUFFIX)
+    os.replace(index_tmp_path, store_path + INDEX_SUFFIX)
+    logger.info(f"{dtype} epoch store with {offsets[-1]} epochs from {len(subjects)} subjects saved in {store_path}")
+
+
+class CompactEpochs:
+    """
+    float16 or int16 epochs with their scale and offset, indexed like an array of epochs.
+    EEGDataset keeps them compact and TensorBatchLoader decodes every batch into float32.
+    """
+
+    def __init__(self, data, scale=None, offset=None):
+        """
+        :param data: encoded epochs (n_epochs, n_channels, n_times), see encode
+        :param scale: scale of every channel of every epoch (n_epochs, n_channels, 1), int16 epochs only
+        :param offset: offset of every channel of every epoch (n_epochs, n_channels, 1), int16 epochs only
+        """
+        self.data = torch.as_tensor(data)
+        self.scale = torch.as_tensor(scale) if scale is not None else None
+        self.offset = torch.as_tensor(offset) if offset is not None else None
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, idx) -> "CompactEpochs":
+        idx = idx if isinstance(idx, slice) else torch.as_tensor(idx)
+        if self.scale is None:
+            return CompactEpochs(self.data[idx])
+        return CompactEpochs(self.data[idx], self.scale[idx], self.offset[idx])
+
+    @property
+    def shape(self) -> torch.Size:
+        return self.data.shape
+
+    @property
+    def nbytes(self) -> int:
+        tensors = [self.data] + ([self.scale, self.offset] if self.scale is not None else [])
+        return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+    def decode(self) -> torch.Tensor:
+        return decode(self.data, self.scale, self.offset)
+
+    def share_memory_(self) -> "CompactEpochs":
+        for tensor in [self.data, self.scale, self.offset]:
+            if tensor is not None:
+                tensor.share_memory_()
+        return self
+
+
+class EpochStore:
+    """
+    Read-only view of a packed epoch store.
+    """
+
+    def __init__(self, store_path: str):
+        """
+        :param str store_path: path of the store without suffix
+        """
+        self.store_path = store_path
+        # copy-on-write mapping - pages stay shared between processes and torch.from_numpy gets a writable array
+        self.X: np.ndarray = np.load(store_path + DATA_SUFFIX, mmap_mode="c")
+        with np.load(store_path + INDEX_SUFFIX) as index:
+            self.y: np.ndarray = index["y"]
+            self.subjects: np.ndarray = index["subjects"]
+            self.offsets: np.ndarray = index["offsets"]
+            self.subject_names: list[str] = index["subject_names"].tolist()
+            self.content_hash: str = str(index["content_hash"])
+            self.dtype: str = str(index["dtype"]) if "dtype" in index else "float32"
+            self.scale: np.ndarray | None = index["scale"] if "scale" in index else None
+            self.offset: np.ndarray | None = index["offset"] if "offset" in index else None
+
+        # EPOCHS FOR EEGDataset, COMPACT STORES STAY COMPACT UNTIL BATCHES ARE GATHERED
+        self.epochs: np.ndarray | CompactEpochs = (
+            self.X if self.dtype == "float32" else CompactEpochs(self.X, self.scale, self.offset)
+        )
+
+    def __len__(self):
+        return len(self.y)
+
+    def subject_data(self, subject: str) -> tuple[np.ndarray, np.ndarray]:
+        index = self.subject_names.index(subject)
+        start, stop = self.offsets[index], self.offsets[index + 1]
+        if self.dtype == "float32":
+            return self.X[start:stop], self.y[start:stop]
+        return self.epochs[start:stop].decode().numpy(), self.y[start:stop]
+
+    def as_tensor(self) -> torch.Tensor:
+        """
+        Returns the whole store as a float32 tensor, backed by the mapped file (no copy) for float32 stores,
+        decoded copy for compact stores.
+        """
+        if self.dtype == "float32":
+            return torch.from_numpy(self.X)
+        return self.epochs.decode()
@@ -0,0 +1,163 @@
+import os, time, hashlib, threading
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from eeg_logger import logger
+
+"""
+Download engine of download.py.
+
+- every file is downloaded into <path>.part in 1 MB chunks and renamed when complete
+- interrupted downloads are resumed with HTTP Range requests from the size of the .part file,
+  servers ignoring Range send the whole file again
+- connection errors, timeouts, 429 and 5xx responses are retried with exponential backoff
+- sha256 of every downloaded file is recorded in the SHA256SUMS manifest of the dataset directory
+  (sha256sum format), a file is downloaded again only if it is missing or does not match the manifest,
+  files with expected checksums (e.g. published by the dataset) must match them
+- files are fetched concurrently by a pool of threads, each with its own HTTP session
+"""
+
+CHUNK_SIZE: int = 1024 * 1024
+RETRIES: int = 5
+BACKOFF: float = 1.0  # SECONDS BEFORE FIRST RETRY, DOUBLED WITH EVERY RETRY
+TIMEOUT: float = 30.0
+WORKERS: int = 4
+MANIFEST: str = "SHA256SUMS"
+
+_local = threading.local()
+
+
+def session() -> requests.Session:
+    """
+    :return: HTTP session of the current thread
+    """
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_manifest(path: str) -> dict[str, str]:
+    """
+    :param path: manifest in sha256sum format, "<sha256>  <relative path>" per line
+    :return: sha256 of every relative path
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        lines = (line.split(maxsplit=1) for line in file if line.strip())
+        return {name.strip().lstrip("*"): digest for digest, name in lines}
+
+
+def write_manifest(path: str, checksums: dict[str, str]) -> None:
+    with open(path + ".tmp", "w") as file:
+        file.writelines(f"{digest}  {name}\n" for name, digest in sorted(checksums.items()))
+    os.replace(path + ".tmp", path)
+
+
+def verify_manifest(root: str) -> bool:
+    """
+    :return: True if root has manifest and all files in it match their checksums
+    """
+    checksums = read_manifest(f"{root}/{MANIFEST}")
+    return bool(checksums) and all(
+        os.path.exists(f"{root}/{name}") and sha256_file(f"{root}/{name}") == digest
+        for name, digest in checksums.items()
+    )
+
+
+def retryable(error: requests.RequestException) -> bool:
+    if isinstance(error, requests.HTTPError):
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return True  # CONNECTION ERRORS, TIMEOUTS AND TRUNCATED BODIES
+
+
+def fetch(url: str, path: str, sha256: str | None = None, retries: int = RETRIES) -> str:
+    """
+    Downloads url into path, resumes a partial download left in path.part.
+
+    :param sha256: expected checksum, mismatching download is removed and ValueError raised
+    :return: sha256 of downloaded file
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    part_path = f"{path}.part"
+
+    for attempt in range(retries + 1):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        try:
+            with session().get(url, stream=True, headers=headers, timeout=TIMEOUT) as response:
+                if response.status_code == 416:  # PART FILE IS ALREADY COMPLETE
+                    break
+                response.raise_for_status()
+                if response.status_code != 206:
+                    offset = 0  # SERVER IGNORED RANGE AND SENDS WHOLE FILE
+                with open(part_path, "ab" if offset else "wb") as file:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        file.write(chunk)
+            break
+        except requests.RequestException as e:
+            if attempt == retries or not retryable(e):
+                raise
+            delay = BACKOFF * 2**attempt
+            logger.warning(f"Download of {url} failed ({e}), retrying in {delay:g} s")
+            time.sleep(delay)
+
+    digest = sha256_file(part_path)
+    if sha256 is not None and digest != sha256:
+        os.remove(part_path)
+        raise ValueError(f"Checksum mismatch of {url}: expected {sha256}, got {digest}")
+    os.replace(part_path, path)
+    return digest
+
+
+def fetch_all(
+    files: list[tuple[str, str]], root: str, workers: int = WORKERS, expected: dict[str, str] | None = None
+) -> list[str]:
+    """
+    Downloads files concurrently into root and records their checksums in root/SHA256SUMS.
+
+    :param files: url and path relative to root of every file
+    :param expected: expected sha256 of relative paths, checksums recorded in manifest are expected otherwise
+    :return: relative paths of files that failed to download
+    """
+    manifest_path = f"{root}/{MANIFEST}"
+    checksums = read_manifest(manifest_path)
+    expected = expected or {}
+
+    pending = []
+    for url, name in files:
+        path, checksum = f"{root}/{name}", expected.get(name) or checksums.get(name)
+        if checksum is not None and os.path.exists(path) and sha256_file(path) == checksum:
+            continue
+        pending.append((url, name, checksum))
+
+    if len(pending) < len(files):
+        logger.info(f"{len(files) - len(pending)} of {len(files)} files already downloaded in {root}")
+    if not pending:
+        return []
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(fetch, url, f"{root}/{name}", checksum): (url, name) for url, name, checksum in pending
+        }
+        for future in as_completed(futures):
+            url, name = futures[future]
+            try:
+                checksums[name] = future.result()
+            except Exception as e:
+                logger.error(f"Failed to download {url}: {e}")
+                failed.append(name)
+                continue
+            write_manifest(manifest_path, checksums)  # FINISHED FILES ARE RECORDED BEFORE SLOWER ONES FINISH
+            logger.info(f"Downloaded {url}")
+
+    return failed
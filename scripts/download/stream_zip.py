@@ -0,0 +1,190 @@
+import os, zlib, time, struct, hashlib
+from collections.abc import Callable
+import requests
+from scripts.download.engine import CHUNK_SIZE, RETRIES, BACKOFF, TIMEOUT, retryable, session
+from eeg_logger import logger
+
+"""
+Zip archives extracted while they download, the archive itself is never written to disk.
+
+Members are read in order from their local file headers, deflated members are decompressed with
+raw zlib streams, so members written with data descriptors (sizes after the data) are supported too.
+Every member is written to <path>.part, checked against CRC-32 and size from the archive and renamed.
+Broken connections are resumed with HTTP Range requests from the current offset in the archive.
+"""
+
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+LOCAL_HEADER_SIGNATURE: int = 0x04034B50
+DATA_DESCRIPTOR_SIGNATURE: int = 0x08074B50
+ZIP64_EXTRA_ID: int = 0x0001
+STORED, DEFLATED = 0, 8
+
+
+class RangeReader:
+    """
+    Sequential reader of url, reconnects with Range request from the current offset when connection breaks.
+    """
+
+    def __init__(self, url: str, retries: int = RETRIES):
+        self.url = url
+        self.retries = retries
+        self.offset = 0  # BYTES OF URL CONSUMED SO FAR
+        self.buffer = b""
+        self.chunks = None
+
+    def __connect(self) -> None:
+        start = self.offset + len(self.buffer)
+        headers = {"Range": f"bytes={start}-"} if start else {}
+        response = session().get(self.url, stream=True, headers=headers, timeout=TIMEOUT)
+        response.raise_for_status()
+        self.chunks = response.iter_content(CHUNK_SIZE)
+        if start and response.status_code != 206:
+            self.__skip_response(start)  # SERVER IGNORED RANGE
+
+    def __skip_response(self, count: int) -> None:
+        while count > 0:
+            chunk = next(self.chunks)
+            count -= len(chunk)
+        if count < 0:
+            self.buffer += chunk[count:]
+
+    def __fill(self) -> bool:
+        for attempt in range(self.retries + 1):
+            try:
+                if self.chunks is None:
+                    self.__connect()
+                chunk = next(self.chunks, None)
+                if chunk is None:
+                    return False
+                self.buffer += chunk
+                return True
+            except requests.RequestException as e:
+                if attempt == self.retries or not retryable(e):
+                    raise
+                self.chunks = None
+                delay = BACKOFF * 2**attempt
+                logger.warning(f"Download of {self.url} failed ({e}), resuming in {delay:g} s")
+                time.sleep(delay)
+
+    def read(self, size: int) -> bytes:
+        """
+        :return: next size bytes, fewer only at the end of url
+        """
+        while len(self.buffer) < size and self.__fill():
+            pass
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        self.offset += len(data)
+        return data
+
+    def read_exactly(self, size: int) -> bytes:
+        data = self.read(size)
+        if len(data) < size:
+            raise ValueError(f"Unexpected end of {self.url} at offset {self.offset}")
+        return data
+
+    def unread(self, data: bytes) -> None:
+        self.buffer = data + self.buffer
+        self.offset -= len(data)
+
+
+def __zip64_sizes(extra: bytes) -> tuple[int, int] | None:
+    """
+    :return: uncompressed and compressed size from zip64 extra field
+    """
+    while len(extra) >= 4:
+        header_id, size = struct.unpack("<HH", extra[:4])
+        if header_id == ZIP64_EXTRA_ID and size >= 16:
+            return struct.unpack("<QQ", extra[4:20])
+        extra = extra[4 + size :]
+    return None
+
+
+def __copy_member(reader: RangeReader, file, method: int, compressed_size: int | None) -> tuple[int, int, str]:
+    """
+    Writes member data into file, compressed_size is None for members with data descriptor.
+
+    :return: CRC-32, uncompressed size and sha256 of written data
+    """
+    crc, size, digest = 0, 0, hashlib.sha256()
+    decompressor = zlib.decompressobj(-15) if method == DEFLATED else None
+    remaining = compressed_size
+
+    while remaining is None or remaining > 0:
+        chunk = reader.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+        if not chunk:
+            raise ValueError(f"Unexpected end of {reader.url} at offset {reader.offset}")
+        if remaining is not None:
+            remaining -= len(chunk)
+
+        data = decompressor.decompress(chunk) if decompressor else chunk
+        crc, size = zlib.crc32(data, crc), size + len(data)
+        digest.update(data)
+        file.write(data)
+
+        if decompressor and decompressor.eof:
+            reader.unread(decompressor.unused_data)  # BYTES AFTER END OF DEFLATE STREAM BELONG TO NEXT RECORD
+            break
+
+    if decompressor and not decompressor.eof:
+        raise ValueError(f"Truncated deflate stream in {reader.url}")
+    return crc, size, digest.hexdigest()
+
+
+def extract_stream(url: str, destination: Callable[[str], str | None]) -> dict[str, str]:
+    """
+    Downloads zip archive from url and extracts its members while downloading.
+
+    :param destination: path of every member name, members with None are skipped
+    :return: sha256 of every extracted path
+    """
+    reader = RangeReader(url)
+    checksums = {}
+
+    while True:
+        signature = reader.read(4)
+        if len(signature) < 4 or struct.unpack("<I", signature)[0] != LOCAL_HEADER_SIGNATURE:
+            break  # CENTRAL DIRECTORY, ALL MEMBERS WERE READ
+        header = LOCAL_HEADER.unpack(signature + reader.read_exactly(LOCAL_HEADER.size - 4))
+        _, _, flags, method, _, _, crc, compressed_size, size, name_length, extra_length = header
+        name = reader.read_exactly(name_length).decode("utf-8" if flags & 0x800 else "cp437")
+        extra = reader.read_exactly(extra_length)
+
+        zip64 = __zip64_sizes(extra)
+        if zip64 and 0xFFFFFFFF in (compressed_size, size):
+            size, compressed_size = zip64
+        has_descriptor = bool(flags & 0x08)
+        if method not in (STORED, DEFLATED):
+            raise ValueError(f"Unsupported compression method {method} of {name}")
+        if has_descriptor and method == STORED:
+            raise ValueError(f"Stored member {name} with data descriptor cannot be streamed")
+
+        path = None if name.endswith("/") else destination(name)
+        if path is None:
+            file = open(os.devnull, "wb")
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            file = open(f"{path}.part", "wb")
+        with file:
+            actual_crc, actual_size, digest = __copy_member(
+                reader, file, method, None if has_descriptor else compressed_size
+            )
+
+        if has_descriptor:
+            descriptor = reader.read_exactly(4)
+            if struct.unpack("<I", descriptor)[0] == DATA_DESCRIPTOR_SIGNATURE:
+                descriptor = reader.read_exactly(4)
+            crc = struct.unpack("<I", descriptor)[0]
+            size = struct.unpack("<QQ" if zip64 else "<II", reader.read_exactly(16 if zip64 else 8))[1]
+
+        if path is None:
+            continue
+        if actual_crc != crc or actual_size != size:
+            os.remove(f"{path}.part")
+            raise ValueError(
+                f"CRC check of {name} failed: {actual_crc:08x}/{actual_size} B, expected {crc:08x}/{size} B"
+            )
+        os.replace(f"{path}.part", path)
+        checksums[path] = digest
+        logger.info(f"Extracted {name} to {path}")
+
+    return checksums
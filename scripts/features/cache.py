@@ -0,0 +1,157 @@
+import os, json, hashlib
+from collections.abc import Callable
+import numpy as np
+import torch
+from eeg_logger import logger
+from scripts.features.stft import stft_features
+from scripts.features.wavelet import wavelet_features
+
+"""
+Content-addressed on-disk cache of precomputed features.
+
+Key of every entry is sha1 of the source epoch store hash, window length, feature method and
+parameters of that method (and layout of features laid out as model input, see sweep.py).
+Every entry is one shard:
+
+<cache_dir>/<key>.npy   - features, float32 or float16
+<cache_dir>/<key>.json  - what the shard contains, for humans
+
+Shards are memory-mapped copy-on-write, so processes reading one shard share its pages.
+Modification time of a shard is its last access time, the least recently used shards are removed
+when total size of the cache exceeds its size cap.
+"""
+
+FEATURE_METHODS: dict[str, Callable[..., torch.Tensor]] = {
+    "stft": stft_features,  # params: n_fft, hop_length
+    "wavelet": wavelet_features,  # params: wavelet, level
+}
+CACHE_DIR: str = "./preprocessed_data/feature_cache"
+MAX_CACHE_SIZE: int = 20 * 1024**3  # 20 GB
+BATCH_SIZE: int = 256
+
+
+def feature_key(store_hash: str, window: str, method: str, params: dict) -> str:
+    """
+    :param store_hash: content hash of the source epoch store (EpochStore.content_hash)
+    :param window: epochs length, e.g. "3s"
+    :param method: feature method, one of FEATURE_METHODS keys
+    :param params: parameters of the feature method
+    """
+    description = {"store": store_hash, "window": window, "method": method, "params": params}
+    return hashlib.sha1(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+
+class FeatureCache:
+    def __init__(self, cache_dir: str = CACHE_DIR, max_size: int = MAX_CACHE_SIZE, dtype: np.dtype = np.float32):
+        """
+        :param str cache_dir: directory with cached shards
+        :param int max_size: size cap of the cache in bytes
+        :param dtype: dtype of stored features, np.float32 or np.float16
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.dtype = np.dtype(dtype)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, key: str) -> np.ndarray | None:
+        path = self.__shard_path(key)
+
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        os.utime(path)  # MARK AS RECENTLY USED
+        return np.load(path, mmap_mode="c")
+
+    def put(self, key: str, features: np.ndarray, description: dict | None = None) -> None:
+        path = self.__shard_path(key)
+        np.save(path + ".tmp.npy", features.astype(self.dtype, copy=False))
+        with open(os.path.join(self.cache_dir, f"{key}.json"), "w") as file:
+            json.dump(description or {}, file, indent=4, sort_keys=True)
+        os.replace(path + ".tmp.npy", path)
+        self.evict()
+
+    def cached(self, key: str, compute: Callable[[], np.ndarray], description: dict | None = None) -> np.ndarray:
+        """
+        Returns memory-mapped array of key, computing and caching it on a miss.
+        """
+        array = self.get(key)
+
+        if array is None:
+            self.put(key, compute(), description)
+            array = np.load(self.__shard_path(key), mmap_mode="c")
+
+        return array
+
+    def features(self, X: np.ndarray, store_hash: str, window: str, method: str, params: dict) -> np.ndarray:
+        """
+        Returns features of all epochs, computing and caching them on a miss.
+
+        :param X: epochs data of shape (n_epochs, n_channels, n_times), e.g. EpochStore.X
+        """
+
+        def compute() -> np.ndarray:
+            logger.info(f"Computing {method} features {params} for {len(X)} epochs")
+            return compute_features(X, method, params)
+
+        key = feature_key(store_hash, window, method, params)
+        return self.cached(key, compute, {"store": store_hash, "window": window, "method": method, "params": params})
+
+    def evict(self) -> None:
+        """
+        Removes least recently used shards until the cache fits in its size cap.
+        """
+        shards = [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir) if f.endswith(".npy")]
+        shards = [s for s in shards if not s.endswith(".tmp.npy")]
+        shards.sort(key=os.path.getmtime)
+        total_size = sum(os.path.getsize(s) for s in shards)
+
+        # THE MOST RECENT SHARD IS NEVER REMOVED, EVEN IF IT ALONE EXCEEDS THE CAP
+        for shard in shards[:-1]:
+            if total_size <= self.max_size:
+                break
+            total_size -= os.path.getsize(shard)
+            os.remove(shard)
+            description_path = shard[: -len(".npy")] + ".json"
+            if os.path.exists(description_path):
+                os.remove(description_path)
+            self.evictions += 1
+            logger.info(f"Evicted feature shard {shard}")
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / requests if requests else 0.0,
+        }
+
+    def __shard_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+
+def compute_features(X: np.ndarray, method: str, params: dict, batch_size: int = BATCH_SIZE) -> np.ndarray:
+    """
+    Computes features in batches, so only one batch of epochs is converted to a tensor at a time.
+
+    :param X: epochs data of shape (n_epochs, n_channels, n_times)
+    :param method: feature method, one of FEATURE_METHODS keys
+    :param params: keyword arguments of the feature method
+    """
+    if method not in FEATURE_METHODS:
+        raise ValueError(f"Unsupported feature method: {method}. Supported methods: {list(FEATURE_METHODS)}")
+
+    extract = FEATURE_METHODS[method]
+    batches = []
+
+    with torch.no_grad():
+        for start in range(0, len(X), batch_size):
+            batch = torch.as_tensor(np.asarray(X[start : start + batch_size], dtype=np.float32))
+            batches.append(extract(batch, **params).numpy())
+
+    return np.concatenate(batches, axis=0)
@@ -0,0 +1,43 @@
+import numpy as np
+
+"""
+Layout of precomputed features as input of models in transformer_models.py, same orientation
+as FeatureExtractor in notebooks. Every layout is (n_epochs, rows, sequence):
+
+- spatial models - tokens are channels, features of one channel are flattened into one vector
+- temporal models - tokens are time frames, features of all channels are stacked per frame
+
+CNN models get the same layouts with channel dimension added by EEGDataset(cnn_mode=True).
+"""
+
+FEATURE_LAYOUTS: list[str] = ["raw", "stft", "wavelet"]
+
+
+def model_input(features: np.ndarray, method: str, spatial: bool) -> np.ndarray:
+    """
+    :param features: raw epochs (N, C, T), stft features (N, 2, C, F, T') or wavelet features (N, C, L, T_sub)
+    :param method: feature method, one of FEATURE_LAYOUTS
+    :param spatial: layout of spatial models, otherwise of temporal models
+    :return: float32 array of shape (N, C, features) for spatial or (N, features, frames) for temporal models
+    """
+    n = len(features)
+
+    match method:
+        case "raw":
+            layout = features
+        case "stft":
+            _, parts, channels, frequencies, frames = features.shape
+            if spatial:
+                layout = features.transpose(0, 2, 1, 3, 4).reshape(n, channels, parts * frequencies * frames)
+            else:
+                layout = features.transpose(0, 2, 3, 1, 4).reshape(n, channels * frequencies * parts, frames)
+        case "wavelet":
+            _, channels, levels, frames = features.shape
+            if spatial:
+                layout = features.reshape(n, channels, levels * frames)
+            else:
+                layout = features.reshape(n, channels * levels, frames)
+        case _:
+            raise ValueError(f"Unsupported feature layout: {method}. Supported layouts: {FEATURE_LAYOUTS}")
+
+    return np.ascontiguousarray(layout, dtype=np.float32)
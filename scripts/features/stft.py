@@ -0,0 +1,22 @@
+import torch
+
+"""
+Batched short-time Fourier transform features, same layout as FeatureExtractor in notebooks.
+"""
+
+
+def stft_features(x: torch.Tensor, n_fft: int, hop_length: int) -> torch.Tensor:
+    """
+    :param x: tensor of shape (B, C, T) or (B, 1, C, T)
+    :param n_fft: size of Fourier transform
+    :param hop_length: distance between neighboring sliding window frames
+    :return: tensor of shape (B, 2, C, F, T'), real and imaginary parts stacked on dimension 1
+    """
+    if x.ndim == 4:
+        x = x.squeeze(1)
+
+    B, C, T = x.shape
+    window = torch.hann_window(n_fft, device=x.device, dtype=x.dtype)
+    stft = torch.stft(x.reshape(B * C, T), n_fft=n_fft, hop_length=hop_length, window=window, return_complex=True)
+    stft = stft.view(B, C, stft.shape[-2], stft.shape[-1])
+    return torch.stack([stft.real, stft.imag], dim=1)
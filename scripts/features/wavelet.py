@@ -0,0 +1,135 @@
+import torch
+import torch.nn.functional as F
+
+"""
+Batched discrete wavelet transform.
+
+Equivalent of pywt.wavedec(x, wavelet, level, mode="symmetric") computed on whole (B, C, T) tensors.
+Every decomposition level is one strided conv1d with the low-pass and high-pass decomposition
+filters stacked as two output channels, applied to all trials and channels at once.
+
+Only decomposition low-pass filters are stored, high-pass filters are their quadrature mirrors:
+dec_hi[k] = (-1)^(k + 1) * dec_lo[N - 1 - k]
+Coefficients are the same as in PyWavelets.
+"""
+
+WAVELET_DEC_LO: dict[str, list[float]] = {
+    "db4": [
+        -0.010597401785069032,
+        0.0328830116668852,
+        0.030841381835560764,
+        -0.18703481171909309,
+        -0.027983769416859854,
+        0.6308807679298589,
+        0.7148465705529157,
+        0.2303778133088965,
+    ],
+    "db6": [
+        -0.0010773010853084796,
+        0.004777257510945511,
+        0.0005538422011614961,
+        -0.03158203931748603,
+        0.027522865530305727,
+        0.09750160558732304,
+        -0.12976686756726194,
+        -0.22626469396543983,
+        0.31525035170919763,
+        0.7511339080210954,
+        0.49462389039845306,
+        0.11154074335010947,
+    ],
+    "coif3": [
+        -3.459977319727278e-05,
+        -7.0983302506379e-05,
+        0.0004662169598204029,
+        0.0011175187708306303,
+        -0.0025745176881367972,
+        -0.009007976136730624,
+        0.015880544863669452,
+        0.03455502757329774,
+        -0.08230192710629983,
+        -0.07179982161915484,
+        0.42848347637737,
+        0.7937772226260872,
+        0.40517690240911824,
+        -0.06112339000297255,
+        -0.06577191128146936,
+        0.023452696142077168,
+        0.007782596425672746,
+        -0.003793512864380802,
+    ],
+}
+
+
+def filter_bank(wavelet: str, dtype: torch.dtype = torch.float32, device: torch.device = None) -> torch.Tensor:
+    """
+    Returns conv1d weights of shape (2, 1, filter_length) - low-pass and high-pass decomposition filters,
+    reversed, because conv1d computes cross-correlation and DWT is defined as convolution.
+
+    :param wavelet: wavelet name, one of WAVELET_DEC_LO keys
+    """
+    if wavelet not in WAVELET_DEC_LO:
+        raise ValueError(f"Unsupported wavelet: {wavelet}. Supported wavelets: {list(WAVELET_DEC_LO)}")
+
+    dec_lo = torch.tensor(WAVELET_DEC_LO[wavelet], dtype=torch.float64)
+    n = len(dec_lo)
+    signs = torch.tensor([(-1.0) ** (k + 1) for k in range(n)], dtype=torch.float64)
+    dec_hi = signs * dec_lo.flip(0)
+    return torch.stack([dec_lo, dec_hi]).flip(1).unsqueeze(1).to(dtype=dtype, device=device)
+
+
+def dwt(x: torch.Tensor, filters: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    Single level DWT along the last dimension, mode "symmetric".
+
+    :param x: tensor of shape (..., T)
+    :param filters: filter bank returned by filter_bank
+    :return: approximation and detail coefficients, both of shape (..., (T + filter_length - 1) // 2)
+    """
+    *leading, n = x.shape
+    filter_length = filters.shape[-1]
+
+    # HALF-SAMPLE SYMMETRIC EXTENSION BY filter_length - 1 ON BOTH SIDES, ALSO VALID FOR SIGNALS SHORTER THAN FILTERS
+    idx = torch.arange(-(filter_length - 1), n + filter_length - 1, device=x.device) % (2 * n)
+    idx = torch.where(idx < n, idx, 2 * n - 1 - idx)
+    x = x.reshape(-1, 1, n)[:, :, idx]
+
+    # FULL CONVOLUTION DOWNSAMPLED AT ODD POSITIONS, AS IN PYWAVELETS
+    coeffs = F.conv1d(x[:, :, 1:], filters, stride=2)
+    return coeffs[:, 0].reshape(*leading, -1), coeffs[:, 1].reshape(*leading, -1)
+
+
+def wavedec(x: torch.Tensor, wavelet: str, level: int) -> list[torch.Tensor]:
+    """
+    Multilevel DWT along the last dimension.
+
+    :param x: tensor of shape (..., T), e.g. (B, C, T)
+    :param wavelet: wavelet name, one of WAVELET_DEC_LO keys
+    :param level: decomposition level
+    :return: [cA_level, cD_level, ..., cD_1], same order as pywt.wavedec
+    """
+    filters = filter_bank(wavelet, dtype=x.dtype, device=x.device)
+    details = []
+
+    approximation = x
+    for _ in range(level):
+        approximation, detail = dwt(approximation, filters)
+        details.append(detail)
+
+    return [approximation] + details[::-1]
+
+
+def wavelet_features(x: torch.Tensor, wavelet: str, level: int) -> torch.Tensor:
+    """
+    Wavelet features in the layout used by FeatureExtractor in notebooks:
+    coefficients of every level are zero-padded at the end to the longest one (cD_1).
+
+    :param x: tensor of shape (B, C, T) or (B, 1, C, T)
+    :return: tensor of shape (B, C, level + 1, T_sub)
+    """
+    if x.ndim == 4:
+        x = x.squeeze(1)
+
+    coeffs = wavedec(x, wavelet, level)
+    t_sub = max(c.shape[-1] for c in coeffs)
+    return torch.stack([F.pad(c, (0, t_sub - c.shape[-1])) for c in coeffs], dim=2)
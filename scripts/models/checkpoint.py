@@ -0,0 +1,76 @@
+import os, json, random
+import numpy as np
+import torch
+
+"""
+Checkpoints of interrupted cross-validation runs.
+
+- epoch checkpoint - one per fold, model and optimizer state, early stopping state and RNG states
+                     after the last finished epoch, training resumed from it continues exactly
+                     like the uninterrupted run
+- results          - accuracies of finished folds with options of the run, finished folds
+                     are not trained again on resume
+
+Both are written to a temporary file first and renamed, so an interruption while saving
+leaves the previous checkpoint intact.
+"""
+
+
+def rng_state(generator: torch.Generator | None = None) -> dict:
+    """
+    :param generator: generator of data loader, if it does not use the global torch generator
+    """
+    return {
+        "torch": torch.get_rng_state(),
+        "cuda": torch.cuda.get_rng_state_all() if torch.cuda.is_available() else [],
+        "numpy": np.random.get_state(),
+        "random": random.getstate(),
+        "generator": generator.get_state() if generator is not None else None,
+    }
+
+
+def set_rng_state(state: dict, generator: torch.Generator | None = None) -> None:
+    torch.set_rng_state(state["torch"])
+    if state["cuda"] and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+    np.random.set_state(state["numpy"])
+    random.setstate(state["random"])
+    if generator is not None and state["generator"] is not None:
+        generator.set_state(state["generator"])
+
+
+def save_checkpoint(checkpoint: dict, path: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    torch.save(checkpoint, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def load_checkpoint(path: str) -> dict | None:
+    if not os.path.exists(path):
+        return None
+    return torch.load(path, map_location="cpu", weights_only=False)  # RNG STATES ARE NOT ONLY TENSORS
+
+
+def save_results(path: str, options: dict, accuracies: dict[int, float]) -> None:
+    """
+    :param options: options of the run, results of a run with different options are not resumed
+    :param accuracies: accuracy of every finished fold
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w") as file:
+        json.dump({"options": options, "accuracies": accuracies}, file, indent=4)
+    os.replace(path + ".tmp", path)
+
+
+def load_results(path: str, options: dict) -> dict[int, float] | None:
+    """
+    :return: accuracies of finished folds, None if there are no results of a run with the same options
+    """
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as file:
+        results = json.load(file)
+    if results["options"] != json.loads(json.dumps(options)):  # TUPLES OF OPTIONS ARE LISTS IN JSON
+        return None
+    return {int(fold): accuracy for fold, accuracy in results["accuracies"].items()}
@@ -0,0 +1,41 @@
+import os
+import torch
+
+"""
+torch.compile execution mode.
+
+Models are compiled with static shapes, every distinct input shape is compiled once. Shapes are kept
+to a small set: the last incomplete batch of an epoch is padded to the batch size (pad_batch), so
+training and evaluation see one batch shape per window length and channel count.
+Compiled kernels are cached on disk, later runs with the same models and shapes skip recompilation.
+"""
+
+
+def enable_compile_cache(cache_dir: str) -> None:
+    """
+    Persistent inductor cache. Environment variable is inherited by fold processes started afterwards.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", os.path.abspath(cache_dir))
+    torch._inductor.config.fx_graph_cache = True
+    if hasattr(torch._functorch.config, "enable_autograd_cache"):
+        torch._functorch.config.enable_autograd_cache = True  # CACHES COMPILED BACKWARD GRAPHS TOO
+
+
+def compile_model(model: torch.nn.Module, cache_dir: str) -> torch.nn.Module:
+    """
+    Compiles model in place, its class and state dict keys do not change.
+    """
+    enable_compile_cache(cache_dir)
+    model.compile(dynamic=False)
+    return model
+
+
+def pad_batch(X: torch.Tensor, batch_size: int) -> torch.Tensor:
+    """
+    Pads batch with zero samples to batch_size. Models have no layers mixing samples of a batch,
+    so outputs of real samples do not change and padded outputs are sliced off.
+    """
+    if len(X) >= batch_size:
+        return X
+    return torch.cat([X, X.new_zeros((batch_size - len(X), *X.shape[1:]))])
@@ -0,0 +1,167 @@
+import os, copy, time
+import numpy as np
+import torch
+import torch.nn as nn
+import scripts.models.utils as utils
+from scripts.models.transformer_block import TransformerBlock
+from eeg_logger import logger
+
+"""
+Export of trained models to CPU inference artifacts.
+
+- torchscript - traced model, loaded with torch.jit.load, optionally with dynamic int8 quantization
+                of nn.Linear layers (embeddings, attention projections and feed-forward layers
+                of TransformerBlocks, classifiers)
+- onnx        - float model, requires onnx package
+"""
+
+EXPORT_FORMATS: list[str] = ["torchscript", "onnx"]
+
+
+def quantized_layers(model: nn.Module) -> set[str]:
+    """
+    :return: names of nn.Linear layers quantized by quantize, attention projections of mha backend
+        are passed as weights to F.multi_head_attention_forward and stay in float32
+    """
+    float_layers = {
+        f"{name}.{projection}"
+        for name, module in model.named_modules()
+        if isinstance(module, TransformerBlock) and module.attention == "mha"
+        for projection in ["in_proj", "out_proj"]
+    }
+    return {name for name, module in model.named_modules() if type(module) is nn.Linear and name not in float_layers}
+
+
+def quantized_fraction(model: nn.Module) -> float:
+    """
+    :return: fraction of parameters of float model stored as int8 by quantize (weights, biases stay float32)
+    """
+    weights = {f"{layer}.weight" for layer in quantized_layers(model)}
+    quantized = sum(parameter.numel() for name, parameter in model.named_parameters() if name in weights)
+    return quantized / sum(parameter.numel() for parameter in model.parameters())
+
+
+def quantize(model: nn.Module) -> nn.Module:
+    """
+    Dynamic int8 quantization of nn.Linear layers (see quantized_layers). Weights are stored as int8,
+    activations are quantized on the fly, so no calibration data is needed.
+    """
+    return torch.ao.quantization.quantize_dynamic(model, quantized_layers(model), dtype=torch.qint8)
+
+
+def eager_model(model: nn.Module) -> nn.Module:
+    """
+    :return: model on CPU in eval mode, models compiled in place by train.create_model are shallow-copied
+        with their eager forward, so exporting and checking them never recompiles for other batch shapes
+    """
+    model = model.cpu().eval()
+    if getattr(model, "_compiled_call_impl", None) is not None:
+        model = copy.copy(model)
+        model._compiled_call_impl = None
+    return model
+
+
+def export_model(
+    model: nn.Module, example_input: torch.Tensor, path: str, export_format: str = "torchscript", int8: bool = False
+) -> str:
+    """
+    :param model: trained model
+    :param example_input: batch with the same shape of every sample as inference data
+    :param path: path of artifact without extension
+    :param export_format: one of EXPORT_FORMATS
+    :param int8: applies dynamic int8 quantization before export
+    :return: path of saved artifact
+    """
+    model = eager_model(model)
+    example_input = example_input.cpu()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    match export_format:
+        case "torchscript":
+            if int8:
+                model = quantize(model)
+            path = f"{path}.pt"
+            with torch.no_grad():
+                torch.jit.trace(model, example_input).save(path)
+        case "onnx":
+            if int8:
+                raise ValueError("Dynamic int8 quantization is supported only for torchscript artifacts")
+            path = f"{path}.onnx"
+            torch.onnx.export(
+                model,
+                (example_input,),
+                path,
+                input_names=["X"],
+                output_names=["logits"],
+                dynamic_axes={"X": {0: "batch"}, "logits": {0: "batch"}},
+            )
+        case _:
+            raise ValueError(f"Unsupported export format: {export_format}. Supported formats: {EXPORT_FORMATS}")
+
+    logger.info(f"Model exported to {path} ({os.path.getsize(path) / 1024**2:.2f} MB)")
+    return path
+
+
+def load_artifact(path: str) -> nn.Module:
+    """
+    Loads torchscript artifact for CPU inference.
+    """
+    return torch.jit.load(path, map_location="cpu").eval()
+
+
+def single_sample_latency(model: nn.Module, sample: torch.Tensor, repeats: int = 50) -> tuple[float, float]:
+    """
+    :return: p50 and p99 latency of one sample in milliseconds
+    """
+    latencies = []
+
+    with torch.inference_mode():
+        model(sample)  # WARM-UP
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model(sample)
+            latencies.append(time.perf_counter() - start)
+
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    return p50, p99
+
+
+def check_artifact(artifact_path: str, model: nn.Module, test_loader, int8: bool = False) -> dict:
+    """
+    Compares accuracy and single-sample latency of torchscript artifact with eager float model
+    (the one traced by export_model) on the held-out data.
+
+    :param artifact_path: exported torchscript artifact
+    :param model: float model the artifact was exported from
+    :param test_loader: loader of held-out data
+    :param int8: artifact was quantized, reports fraction of quantized parameters
+    """
+    device = torch.device("cpu")
+    model = eager_model(model)
+    artifact = load_artifact(artifact_path)
+    sample = next(iter(test_loader))[0][:1].clone()
+
+    float_accuracy = utils.evaluate_model(model, test_loader, device)
+    artifact_accuracy = utils.evaluate_model(artifact, test_loader, device)
+    float_p50, float_p99 = single_sample_latency(model, sample)
+    artifact_p50, artifact_p99 = single_sample_latency(artifact, sample)
+
+    report = {
+        "artifact": artifact_path,
+        "size_mb": os.path.getsize(artifact_path) / 1024**2,
+        "float_accuracy": float_accuracy,
+        "artifact_accuracy": artifact_accuracy,
+        "float_latency_p50_ms": float_p50,
+        "float_latency_p99_ms": float_p99,
+        "artifact_latency_p50_ms": artifact_p50,
+        "artifact_latency_p99_ms": artifact_p99,
+    }
+    if int8:
+        report["quantized_fraction"] = quantized_fraction(model)
+    logger.info(
+        f"{artifact_path}: accuracy {artifact_accuracy * 100:.2f}% (float {float_accuracy * 100:.2f}%), "
+        f"latency p50 {artifact_p50:.2f} ms (float {float_p50:.2f} ms), p99 {artifact_p99:.2f} ms "
+        f"(float {float_p99:.2f} ms)"
+        + (f", {report['quantized_fraction'] * 100:.1f}% of parameters int8" if int8 else "")
+    )
+    return report
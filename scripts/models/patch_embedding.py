@@ -0,0 +1,22 @@
+import torch
+import torch.nn as nn
+
+
+class PatchEmbedding(nn.Module):
+    """
+    Groups consecutive time samples into tokens and embeds every token with one linear projection
+    (a strided 1D convolution), so sequence length falls by the stride.
+    """
+
+    def __init__(self, in_features: int, d_model: int, patch_size: int, stride: int | None = None):
+        """
+        :param int in_features: number of features of every time sample, e.g. EEG channels
+        :param int d_model: size of token embedding
+        :param int patch_size: number of time samples in one token
+        :param int stride: distance between starts of consecutive patches, patch_size by default (no overlap)
+        """
+        super(PatchEmbedding, self).__init__()
+        self.proj = nn.Conv1d(in_features, d_model, kernel_size=patch_size, stride=stride or patch_size)
+
+    def forward(self, x: torch.Tensor):  # x shape: (batch, features, time)
+        return self.proj(x).transpose(1, 2)  # (batch, patches, d_model)
@@ -17,8 +17,8 @@ class PositionalEncoding(torch.nn.Module):
         div_term = torch.exp(torch.arange(0, d_model, 2).float() * (-torch.log(torch.tensor(10000.0)) / d_model))
         pe[:, 0::2] = torch.sin(position * div_term)
         pe[:, 1::2] = torch.cos(position * div_term)
-        pe = pe.unsqueeze(0).transpose(0, 1)
+        pe = pe.unsqueeze(0)  # (1, max_len, d_model)
         self.register_buffer("pe", pe)
 
-    def forward(self, x: torch.Tensor):
-        return x + self.pe[: x.size(0), :]
+    def forward(self, x: torch.Tensor):  # x shape: (batch, sequence, features)
+        return x + self.pe[:, : x.size(1)]
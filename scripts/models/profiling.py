@@ -0,0 +1,92 @@
+import time
+import torch
+from eeg_logger import logger
+
+"""
+Per-stage timing of training steps. Every step is split into stages:
+
+- data     - fetching batch from loader and moving it to device
+- forward  - forward pass and loss
+- backward - backward pass
+- step     - optimizer step and reading the loss
+
+On CUDA the device is synchronized at every stage boundary, so kernels are attributed to the stage
+that launched them. Training loop creates timer only when profiling is enabled, so disabled profiling
+costs one `if` per stage.
+"""
+
+STAGES: list[str] = ["data", "forward", "backward", "step"]
+
+
+class StageTimer:
+    def __init__(self, device: torch.device):
+        """
+        :param device: device of trained model
+        """
+        self.synchronize = torch.device(device).type == "cuda"
+        self.epochs: list[dict] = []
+        self.current: dict = {}
+        self.last = 0.0
+
+    def start_epoch(self) -> None:
+        self.current = {**dict.fromkeys(STAGES, 0.0), "samples": 0, "steps": 0}
+        self.last = time.perf_counter()
+
+    def mark(self, stage: str, samples: int = 0) -> None:
+        """
+        Ends stage, time since the previous mark is added to it.
+
+        :param stage: one of STAGES
+        :param samples: batch size, passed with the last stage of a step
+        """
+        if self.synchronize:
+            torch.cuda.synchronize()
+        now = time.perf_counter()
+        self.current[stage] += now - self.last
+        self.last = now
+        if samples:
+            self.current["samples"] += samples
+            self.current["steps"] += 1
+
+    def end_epoch(self) -> dict:
+        self.epochs.append(self.current)
+        return self.current
+
+    def summary(self) -> dict:
+        """
+        Stage times and samples summed over all epochs.
+        """
+        keys = [*STAGES, "samples", "steps"]
+        return {key: sum(epoch[key] for epoch in self.epochs) for key in keys}
+
+
+def describe(stats: dict) -> str:
+    """
+    :param stats: one epoch of StageTimer or its summary
+    """
+    total = sum(stats[stage] for stage in STAGES) or 1.0
+    stages = ", ".join(f"{stage} {stats[stage]:.2f} s ({stats[stage] / total * 100:.0f}%)" for stage in STAGES)
+    return f"{stages}, {stats['samples'] / total:.1f} samples/sec"
+
+
+def trace_profiler(first_step: int, num_steps: int, trace_path: str) -> torch.profiler.profile:
+    """
+    torch.profiler recording `num_steps` training steps from `first_step` (counted over all epochs),
+    the trace is exported to `trace_path` in Chrome trace format (chrome://tracing, Perfetto).
+    Training loop calls step() of returned profiler after every training step.
+    """
+    activities = [torch.profiler.ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(torch.profiler.ProfilerActivity.CUDA)
+
+    def export_trace(profiler: torch.profiler.profile) -> None:
+        profiler.export_chrome_trace(trace_path)
+        logger.info(f"Profiler trace of {num_steps} steps from step {first_step} saved to {trace_path}")
+
+    warmup = min(first_step, 1)
+    return torch.profiler.profile(
+        activities=activities,
+        schedule=torch.profiler.schedule(wait=first_step - warmup, warmup=warmup, active=num_steps, repeat=1),
+        on_trace_ready=export_trace,
+        record_shapes=True,
+    )
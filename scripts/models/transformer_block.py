@@ -1,15 +1,56 @@
+import torch
 import torch.nn as nn
+import torch.nn.functional as F
 from torch import Tensor
+from torch.nn.utils import skip_init
+
+"""
+Attention backends:
+
+- sdpa - input projection passed directly to F.scaled_dot_product_attention,
+         attention weights are never materialized
+- mha  - F.multi_head_attention_forward of nn.MultiheadAttention, reference implementation
+         (computes and averages attention weights)
+
+Sub-quadratic backends for long temporal sequences:
+
+- local  - sliding window attention, every position attends only to positions at most `window` steps away.
+           Sequence is split into blocks of `window` positions and every block attends to itself and
+           its two neighbours, so time and memory grow as O(L * window) instead of O(L^2)
+- linear - linear attention with elu(x) + 1 feature map (Katharopoulos et al., 2020,
+           https://arxiv.org/abs/2006.16236), O(L * E_head^2)
+
+All backends use the same parameters, so weights trained with one of them can be loaded into another,
+but only sdpa and mha compute the same function. Input (q, k, v) and output projections are nn.Linear modules
+initialised like nn.MultiheadAttention, so they are quantized by dynamic int8 quantization (export.quantize),
+state dicts with parameters of nn.MultiheadAttention (attn.in_proj_weight, ...) of older blocks are still loaded.
+"""
+
+ATTENTION_BACKENDS: list[str] = ["sdpa", "mha", "local", "linear"]
 
 
 class TransformerBlock(nn.Module):
-    def __init__(self, d_model=512, num_heads=8):
+    def __init__(self, d_model=512, num_heads=8, attention="sdpa", window=64):
         """
         :param int d_model: the number of expected features in the encoder/decoder inputs
         :param int num_heads: the number of heads in the multiheadattention models
+        :param str attention: attention backend, one of ATTENTION_BACKENDS
+        :param int window: attention radius of local backend
         """
         super(TransformerBlock, self).__init__()
-        self.attn = nn.MultiheadAttention(embed_dim=d_model, num_heads=num_heads)
+        if attention not in ATTENTION_BACKENDS:
+            raise ValueError(f"Unsupported attention backend: {attention}. Supported backends: {ATTENTION_BACKENDS}")
+
+        self.attention = attention
+        self.num_heads = num_heads
+        self.window = window
+        # PROJECTIONS OF nn.MultiheadAttention, SAME INITIALISATION AND ORDER OF RANDOM NUMBERS
+        self.in_proj = skip_init(nn.Linear, d_model, 3 * d_model)
+        self.out_proj = nn.Linear(d_model, d_model)
+        nn.init.xavier_uniform_(self.in_proj.weight)
+        nn.init.zeros_(self.in_proj.bias)
+        nn.init.zeros_(self.out_proj.bias)
+        self._register_load_state_dict_pre_hook(_rename_attention_parameters)
 
         # feed-forward layer
         self.ff = nn.Sequential(nn.Linear(d_model, d_model), nn.ReLU(), nn.Linear(d_model, d_model))
@@ -17,8 +58,8 @@ class TransformerBlock(nn.Module):
         self.norm1 = nn.LayerNorm(d_model)
         self.norm2 = nn.LayerNorm(d_model)
 
-    def forward(self, x: Tensor):
-        attn_output, _ = self.attn(x, x, x)  # query, key, value
+    def forward(self, x: Tensor):  # x shape: (batch, sequence, features)
+        attn_output = self.__attend(x)
         """
         x + attn_output
         To residual connection, czyli technika projektowania sieci neuronowych,
@@ -29,3 +70,90 @@ class TransformerBlock(nn.Module):
         ff_output = self.ff(x)
         x = self.norm2(x + ff_output)
         return x
+
+    def __attend(self, x: Tensor) -> Tensor:
+        if self.attention == "mha":
+            x = x.transpose(0, 1)  # (sequence, batch, features)
+            attn_output, _ = F.multi_head_attention_forward(
+                query=x,
+                key=x,
+                value=x,
+                embed_dim_to_check=x.shape[-1],
+                num_heads=self.num_heads,
+                in_proj_weight=self.in_proj.weight,
+                in_proj_bias=self.in_proj.bias,
+                bias_k=None,
+                bias_v=None,
+                add_zero_attn=False,
+                dropout_p=0.0,
+                out_proj_weight=self.out_proj.weight,
+                out_proj_bias=self.out_proj.bias,
+                training=self.training,
+            )
+            return attn_output.transpose(0, 1)
+
+        B, L, E = x.shape
+        qkv = self.in_proj(x)
+        q, k, v = qkv.view(B, L, 3, self.num_heads, E // self.num_heads).permute(2, 0, 3, 1, 4)  # (B, heads, L, E_head)
+
+        if self.attention == "local":
+            attn_output = local_attention(q, k, v, self.window)
+        elif self.attention == "linear":
+            attn_output = linear_attention(q, k, v)
+        else:
+            attn_output = F.scaled_dot_product_attention(q, k, v)
+
+        return self.out_proj(attn_output.transpose(1, 2).reshape(B, L, E))
+
+
+def _rename_attention_parameters(state_dict: dict, prefix: str, *args) -> None:
+    """
+    Renames parameters of nn.MultiheadAttention in state dicts of older blocks to in_proj and out_proj.
+    """
+    names = {
+        "attn.in_proj_weight": "in_proj.weight",
+        "attn.in_proj_bias": "in_proj.bias",
+        "attn.out_proj.weight": "out_proj.weight",
+        "attn.out_proj.bias": "out_proj.bias",
+    }
+    for old, new in names.items():
+        if prefix + old in state_dict:
+            state_dict[prefix + new] = state_dict.pop(prefix + old)
+
+
+def local_attention(q: Tensor, k: Tensor, v: Tensor, window: int) -> Tensor:
+    """
+    Sliding window attention, position i attends to positions j with |i - j| <= window.
+
+    :param q, k, v: tensors of shape (batch, heads, L, E_head)
+    """
+    B, H, L, E = q.shape
+    num_blocks = (L + window - 1) // window
+    padding = num_blocks * window - L
+
+    q = F.pad(q, (0, 0, 0, padding)).view(B, H, num_blocks, window, E)
+    # ONE EXTRA BLOCK ON BOTH SIDES, SO EVERY BLOCK CAN SEE ITS PREVIOUS AND NEXT BLOCK
+    k = F.pad(k, (0, 0, window, padding + window)).view(B, H, num_blocks + 2, window, E)
+    v = F.pad(v, (0, 0, window, padding + window)).view(B, H, num_blocks + 2, window, E)
+    k = torch.cat([k[:, :, :-2], k[:, :, 1:-1], k[:, :, 2:]], dim=3)  # (B, H, blocks, 3 * window, E)
+    v = torch.cat([v[:, :, :-2], v[:, :, 1:-1], v[:, :, 2:]], dim=3)
+
+    block_starts = torch.arange(0, num_blocks * window, window, device=q.device).view(num_blocks, 1, 1)
+    query_positions = block_starts + torch.arange(window, device=q.device).view(1, window, 1)
+    key_positions = block_starts + torch.arange(-window, 2 * window, device=q.device).view(1, 1, 3 * window)
+    mask = ((query_positions - key_positions).abs() <= window) & (key_positions >= 0) & (key_positions < L)
+
+    attn_output = F.scaled_dot_product_attention(q, k, v, attn_mask=mask)  # (B, H, blocks, window, E)
+    return attn_output.view(B, H, num_blocks * window, E)[:, :, :L]
+
+
+def linear_attention(q: Tensor, k: Tensor, v: Tensor) -> Tensor:
+    """
+    Non-causal linear attention with elu(x) + 1 feature map.
+
+    :param q, k, v: tensors of shape (batch, heads, L, E_head)
+    """
+    q, k = F.elu(q) + 1, F.elu(k) + 1
+    kv = k.transpose(-2, -1) @ v  # (B, H, E_head, E_head)
+    normaliser = q @ k.sum(dim=2).unsqueeze(-1)  # (B, H, L, 1)
+    return (q @ kv) / normaliser
@@ -1,9 +1,9 @@
 import torch
 import torch.nn as nn
+from scripts.models.patch_embedding import PatchEmbedding
 from scripts.models.positional_encoding import PositionalEncoding
 from scripts.models.transformer_block import TransformerBlock
 
-
 """
     Very good article that explains how transformers work:
     https://medium.com/data-science/transformers-explained-visually-not-just-how-but-why-they-work-so-well-d840bd61a9d3
@@ -12,37 +12,66 @@ from scripts.models.transformer_block import TransformerBlock
 
 # Learns dependencies between channels
 class SpatialTransformer(nn.Module):
-    def __init__(self, input_size: int, d_model: int, num_heads: int, num_classes: int):
+    def __init__(
+        self,
+        input_size: int,
+        d_model: int,
+        num_heads: int,
+        num_classes: int,
+        attention: str = "sdpa",
+        attention_window: int = 64,
+    ):
         super(SpatialTransformer, self).__init__()
         self.embedding = nn.Linear(input_size, d_model)
         self.pos_encoder = PositionalEncoding(d_model)
-        self.transformer = nn.Sequential(*[TransformerBlock(d_model, num_heads) for _ in range(3)])
+        self.transformer = nn.Sequential(
+            *[TransformerBlock(d_model, num_heads, attention, attention_window) for _ in range(3)]
+        )
         self.fc = nn.Linear(d_model, num_classes)
 
-    def forward(self, x: torch.Tensor):
-        x = x.permute(1, 0, 2)  # (channels, batch, time)
+    def forward(self, x: torch.Tensor):  # x shape: (batch, channels, time)
         x = self.embedding(x)
         x = self.pos_encoder(x)
         x = self.transformer(x)
-        x = x.mean(dim=0)
+        x = x.mean(dim=1)
         return self.fc(x)
 
 
 # Learns relationships between time points
 class TemporalTransformer(nn.Module):
-    def __init__(self, input_size: int, d_model: int, num_heads: int, num_classes: int):
+    def __init__(
+        self,
+        input_size: int,
+        d_model: int,
+        num_heads: int,
+        num_classes: int,
+        attention: str = "sdpa",
+        attention_window: int = 64,
+        max_len: int = 1000,
+        patch_size: int | None = None,
+        patch_stride: int | None = None,
+    ):
         super(TemporalTransformer, self).__init__()
-        self.embedding = nn.Linear(input_size, d_model)
-        self.pos_encoder = PositionalEncoding(d_model)
-        self.transformer = nn.Sequential(*[TransformerBlock(d_model, num_heads) for _ in range(3)])
+        self.patch_size = patch_size
+        if patch_size:
+            self.embedding = PatchEmbedding(input_size, d_model, patch_size, patch_stride)
+        else:
+            self.embedding = nn.Linear(input_size, d_model)
+        self.pos_encoder = PositionalEncoding(d_model, max_len)
+        self.transformer = nn.Sequential(
+            *[TransformerBlock(d_model, num_heads, attention, attention_window) for _ in range(3)]
+        )
         self.fc = nn.Linear(d_model, num_classes)
 
     def forward(self, x: torch.Tensor):  # x shape: (batch, channels, time)
-        x = x.permute(2, 0, 1)  # (time, batch, channels)
-        x = self.embedding(x)
+        if self.patch_size:
+            x = self.embedding(x)  # (batch, patches, d_model)
+        else:
+            x = x.permute(0, 2, 1)  # (batch, time, channels)
+            x = self.embedding(x)
         x = self.pos_encoder(x)
         x = self.transformer(x)
-        x = x.mean(dim=0)
+        x = x.mean(dim=1)
         return self.fc(x)
 
 
@@ -58,7 +87,9 @@ class SpatialCNNTransformer(nn.Module):
     layer used 64 kernels with the size of 1 x 15, and adopted the VALID padding.
     """
 
-    def __init__(self, d_model: int, num_heads: int, num_classes: int):
+    def __init__(
+        self, d_model: int, num_heads: int, num_classes: int, attention: str = "sdpa", attention_window: int = 64
+    ):
         super(SpatialCNNTransformer, self).__init__()
         self.cnn = nn.Sequential(
             nn.Conv2d(1, 64, (1, 16), padding="same"),
@@ -69,15 +100,17 @@ class SpatialCNNTransformer(nn.Module):
         )
         self.embedding = nn.Linear(64, d_model)
         self.pos_encoder = PositionalEncoding(d_model)
-        self.transformer = nn.Sequential(*[TransformerBlock(d_model, num_heads) for _ in range(3)])
+        self.transformer = nn.Sequential(
+            *[TransformerBlock(d_model, num_heads, attention, attention_window) for _ in range(3)]
+        )
         self.fc = nn.Linear(d_model, num_classes)
 
     def forward(self, x: torch.Tensor):  # x shape: (batch, 1, channels, time)
-        x = self.cnn(x).squeeze(3).permute(2, 0, 1)
+        x = self.cnn(x).squeeze(3).permute(0, 2, 1)  # (batch, channels, features)
         x = self.embedding(x)
         x = self.pos_encoder(x)
         x = self.transformer(x)
-        x = x.mean(dim=0)
+        x = x.mean(dim=1)
         return self.fc(x)
 
 
@@ -92,30 +125,60 @@ class TemporalCNNTransformer(nn.Module):
     After the average pooling layer, we transposed the features.
     """
 
-    def __init__(self, d_model: int, num_heads: int, num_classes: int):
+    def __init__(
+        self,
+        d_model: int,
+        num_heads: int,
+        num_classes: int,
+        attention: str = "sdpa",
+        attention_window: int = 64,
+        patch_size: int | None = None,
+        patch_stride: int | None = None,
+    ):
         super(TemporalCNNTransformer, self).__init__()
         self.cnn = nn.Sequential(nn.Conv2d(1, 64, kernel_size=(64, 1), padding="same"), nn.ReLU(), nn.AvgPool2d((1, 8)))
-        self.embedding = nn.Linear(64, d_model)
+        self.patch_size = patch_size
+        if patch_size:
+            self.embedding = PatchEmbedding(64, d_model, patch_size, patch_stride)
+        else:
+            self.embedding = nn.Linear(64, d_model)
         self.pos_encoder = PositionalEncoding(d_model)
-        self.transformer = nn.Sequential(*[TransformerBlock(d_model, num_heads) for _ in range(3)])
+        self.transformer = nn.Sequential(
+            *[TransformerBlock(d_model, num_heads, attention, attention_window) for _ in range(3)]
+        )
         self.fc = nn.Linear(d_model, num_classes)
 
     def forward(self, x: torch.Tensor):  # (batch, 1, channels, time)
         x = self.cnn(x)  # (B, 64, 1, T_new)
         x = x.mean(dim=2)  # (B, 64, T_new)
-        x = x.permute(2, 0, 1)  # (time, batch, features)
-        x = self.embedding(x)
+        if self.patch_size:
+            x = self.embedding(x)  # (batch, patches, d_model)
+        else:
+            x = x.permute(0, 2, 1)  # (batch, time, features)
+            x = self.embedding(x)
         x = self.pos_encoder(x)
         x = self.transformer(x)
-        x = x.mean(dim=0)
+        x = x.mean(dim=1)
         return self.fc(x)
 
 
 class FusionCNNTransformer(nn.Module):
-    def __init__(self, d_model: int, num_heads: int, num_classes: int):
+    def __init__(
+        self,
+        d_model: int,
+        num_heads: int,
+        num_classes: int,
+        attention: str = "sdpa",
+        attention_window: int = 64,
+        patch_size: int | None = None,
+        patch_stride: int | None = None,
+    ):
         super(FusionCNNTransformer, self).__init__()
-        self.s_cnn = SpatialCNNTransformer(d_model, num_heads, num_classes)
-        self.t_cnn = TemporalCNNTransformer(d_model, num_heads, num_classes)
+        self.s_cnn = SpatialCNNTransformer(d_model, num_heads, num_classes, attention, attention_window)
+        # PATCHING SHORTENS ONLY THE TEMPORAL BRANCH, SEQUENCE OF THE SPATIAL BRANCH ARE CHANNELS
+        self.t_cnn = TemporalCNNTransformer(
+            d_model, num_heads, num_classes, attention, attention_window, patch_size, patch_stride
+        )
         self.fc = nn.Linear(num_classes * 2, num_classes)
 
     def forward(self, x: torch.Tensor):
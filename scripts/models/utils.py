@@ -1,5 +1,11 @@
+import time, statistics
+from contextlib import nullcontext
 import torch
 from torchmetrics.classification import Accuracy
+from scripts.dataset.augmentation import BatchAugmenter
+from scripts.models.compilation import pad_batch
+from scripts.models.checkpoint import rng_state, set_rng_state, save_checkpoint, load_checkpoint
+from scripts.models.profiling import StageTimer, describe, trace_profiler
 from eeg_logger import logger
 
 """
@@ -16,6 +22,7 @@ From paper:
 """
 
 PREPROCESSED_DATA_DIR = "./preprocessed_data/Physionet"
+EPOCH_STORE_DIR = "./preprocessed_data/store"
 D_MODEL = 64
 NUM_HEADS = 8
 NUM_CLASSES = 2
@@ -23,11 +30,49 @@ BATCH_SIZE = 32
 NUM_EPOCHS = 50
 WEIGHT_DECAY = 0.0001
 LEARNING_RATE = 0.0007
+SEED = 42
+ATTENTION = "sdpa"  # ATTENTION BACKEND OF TRANSFORMER BLOCKS, SEE transformer_block.py
+ATTENTION_WINDOW = 64  # ATTENTION RADIUS OF LOCAL BACKEND, IN TOKENS
+PATCH_SIZE = None  # TIME SAMPLES PER TOKEN OF TEMPORAL MODELS, None - ONE TOKEN PER SAMPLE
+PATCH_STRIDE = None  # None - SAME AS PATCH_SIZE
+VALIDATION_SPLIT = 0.1  # PART OF TRAINING FOLD HELD OUT FOR EARLY STOPPING
+PATIENCE = 10  # EPOCHS WITHOUT IMPROVEMENT OF VALIDATION ACCURACY BEFORE STOPPING
+TRACE_DIR = "./traces"  # CHROME TRACES OF train.py --trace-steps
+COMPILE_CACHE_DIR = "./.compile_cache"  # INDUCTOR CACHE OF train.py --compile
+CHECKPOINT_DIR = "./checkpoints"  # CHECKPOINTS OF train.py --checkpoint
+CHECKPOINT_EVERY = 1  # EPOCHS BETWEEN CHECKPOINTS
+
+
+def mixed_precision(device: torch.device, enabled: bool) -> torch.autocast:
+    """
+    bfloat16 autocast, matrix multiplications and convolutions run in bfloat16, weights, softmax,
+    normalisation and loss stay in float32. Training and evaluation with bf16 also lay out
+    4D inputs and convolution weights of CNN models as channels_last (NHWC), the layout of oneDNN
+    bf16 convolution kernels. Fast on CPUs with AVX512-BF16 or AMX, older CPUs emulate bfloat16.
+    """
+    return torch.autocast(torch.device(device).type, dtype=torch.bfloat16, enabled=enabled)
 
 
 def train_model(
-    model: torch.nn.Module, train_loader: torch.utils.data.DataLoader, device: torch.device, verbose: bool
-) -> None:
+    model: torch.nn.Module,
+    train_loader: torch.utils.data.DataLoader,
+    device: torch.device,
+    verbose: bool,
+    profile: bool = False,
+    trace_steps: tuple[int, int] | None = None,
+    trace_path: str = "trace.json",
+    bf16: bool = False,
+    compiled: bool = False,
+    val_loader: torch.utils.data.DataLoader | None = None,
+    patience: int | None = None,
+    max_epochs: int | None = None,
+    time_budget: float | None = None,
+    learning_rate: float = LEARNING_RATE,
+    checkpoint_path: str | None = None,
+    checkpoint_every: int = CHECKPOINT_EVERY,
+    resume: bool = False,
+    augmenter: BatchAugmenter | None = None,
+) -> dict:
     """
     Trains model with parameters specified in paper.
 
@@ -35,30 +80,157 @@ def train_model(
     :param train_loader: loader for training data
     :param device: device to train model on
     :param verbose: logs more info if set to true
+    :param profile: times data, forward, backward and optimizer step stages of every training step,
+        logs them for every epoch and summed over all epochs
+    :param trace_steps: first step and number of steps recorded with torch.profiler
+    :param trace_path: path of Chrome trace of recorded steps
+    :param bf16: mixed precision, see mixed_precision
+    :param compiled: model was compiled by train.create_model, pads the last batch to batch size of loader
+        and logs compilation time and steady-state step time
+    :param val_loader: loader for validation data, model is evaluated on it after every epoch
+        and weights of the epoch with the best validation accuracy are restored after training
+    :param patience: stops training when validation accuracy did not improve for this many epochs
+    :param max_epochs: epoch budget, at most NUM_EPOCHS
+    :param time_budget: wall-clock budget in seconds, training stops before the epoch that would exceed it
+    :param learning_rate: learning rate of Adam optimizer
+    :param checkpoint_path: path of checkpoint with model, optimizer, early stopping and RNG states,
+        written every checkpoint_every epochs and after the last epoch
+    :param checkpoint_every: epochs between checkpoints
+    :param resume: continues training from checkpoint_path if it exists, result is the same as without interruption
+    :param augmenter: augments every training batch, its generator state is saved in checkpoints
+    :return: number of trained epochs, best epoch and its validation accuracy,
+        stage times and samples summed over all epochs if profile is set
     """
     model.to(device)
-    optimizer = torch.optim.Adam(model.parameters(), lr=LEARNING_RATE, weight_decay=WEIGHT_DECAY)
+    if bf16:
+        model.to(memory_format=torch.channels_last)
+    optimizer = torch.optim.Adam(model.parameters(), lr=learning_rate, weight_decay=WEIGHT_DECAY)
     criterion = torch.nn.CrossEntropyLoss()
+    timer = StageTimer(device) if profile else None
+    tracing = trace_profiler(*trace_steps, trace_path) if trace_steps else nullcontext()
+    step_times = []
+    num_epochs = min(NUM_EPOCHS, max_epochs or NUM_EPOCHS)
+    best = {"epoch": 0, "val_accuracy": -1.0, "state": None}
+    stop_reason = f"epoch budget of {num_epochs}"
+    epochs = 0
+    elapsed = 0.0
 
-    for epoch in range(NUM_EPOCHS):
-        model.train()
-        total_loss = 0
-        for X_batch, y_batch in train_loader:
-            X_batch, y_batch = X_batch.to(device), y_batch.to(device)
-            optimizer.zero_grad()
-            output = model(X_batch)
-            loss = criterion(output, y_batch)
-            loss.backward()
-            optimizer.step()
-            total_loss += loss.item()
-        if verbose:
-            logger.info(f"Epoch {epoch+1}/{NUM_EPOCHS}, Loss: {total_loss:.4f}")
+    checkpoint = load_checkpoint(checkpoint_path) if checkpoint_path and resume else None
+    if checkpoint:
+        model.load_state_dict(checkpoint["model"])
+        optimizer.load_state_dict(checkpoint["optimizer"])
+        set_rng_state(checkpoint["rng"], getattr(train_loader, "generator", None))
+        if augmenter:
+            augmenter.set_state(checkpoint["augmenter"], device)
+        epochs, elapsed, best = checkpoint["epochs"], checkpoint["elapsed"], checkpoint["best"]
+        stop_reason = checkpoint["stop_reason"] or stop_reason
+        logger.info(f"Resuming from epoch {epochs} of {checkpoint_path}")
+        if checkpoint["stop_reason"]:
+            num_epochs = epochs  # TRAINING HAD ALREADY STOPPED
+    start = time.perf_counter() - elapsed  # TIME BUDGET COUNTS TIME BEFORE INTERRUPTION
+
+    with tracing as profiler:
+        for epoch in range(epochs, num_epochs):
+            model.train()
+            total_loss = 0
+            stop = None
+            if timer:
+                timer.start_epoch()
+            for X_batch, y_batch in train_loader:
+                X_batch, y_batch = X_batch.to(device), y_batch.to(device)
+                if augmenter:
+                    X_batch = augmenter(X_batch)
+                if compiled:
+                    X_batch = pad_batch(X_batch, train_loader.batch_size)
+                    step_start = time.perf_counter()
+                if bf16 and X_batch.dim() == 4:
+                    X_batch = X_batch.contiguous(memory_format=torch.channels_last)
+                if timer:
+                    timer.mark("data")
+                optimizer.zero_grad()
+                with mixed_precision(device, bf16):
+                    output = model(X_batch)[: len(y_batch)]  # OUTPUTS OF PADDED SAMPLES ARE DROPPED
+                    loss = criterion(output, y_batch)
+                if timer:
+                    timer.mark("forward")
+                loss.backward()
+                if timer:
+                    timer.mark("backward")
+                optimizer.step()
+                total_loss += loss.item()
+                if compiled:
+                    step_times.append(time.perf_counter() - step_start)
+                if timer:
+                    timer.mark("step", len(y_batch))
+                if profiler:
+                    profiler.step()
+            if verbose:
+                logger.info(f"Epoch {epoch+1}/{num_epochs}, Loss: {total_loss:.4f}")
+            if timer:  # LOGGED ALSO WITHOUT verbose, e.g. BY train.py --profile
+                logger.info(f"Epoch {epoch+1}/{num_epochs}, {describe(timer.end_epoch())}")
+
+            if val_loader is not None:
+                val_accuracy = evaluate_model(model, val_loader, device, bf16=bf16, compiled=compiled)
+                if verbose:
+                    logger.info(f"Epoch {epoch+1}/{num_epochs}, validation accuracy: {val_accuracy * 100:.2f}%")
+                if val_accuracy > best["val_accuracy"]:
+                    state = {key: value.detach().clone() for key, value in model.state_dict().items()}
+                    best = {"epoch": epoch + 1, "val_accuracy": val_accuracy, "state": state}
+                elif patience is not None and epoch + 1 - best["epoch"] >= patience:
+                    stop = f"no improvement for {patience} epochs"
+
+            next_epoch_end = (time.perf_counter() - start) * (epoch + 2) / (epoch + 1)  # EPOCHS TAKE EQUALLY LONG
+            if not stop and time_budget is not None and epoch + 1 < num_epochs and next_epoch_end > time_budget:
+                stop = f"time budget of {time_budget:g} s"
+
+            epochs = epoch + 1
+            if checkpoint_path and (epochs % checkpoint_every == 0 or epochs == num_epochs or stop):
+                checkpoint = {
+                    "model": model.state_dict(),
+                    "optimizer": optimizer.state_dict(),
+                    "rng": rng_state(getattr(train_loader, "generator", None)),
+                    "augmenter": augmenter.get_state() if augmenter else None,
+                    "epochs": epochs,
+                    "elapsed": time.perf_counter() - start,
+                    "best": best,
+                    "stop_reason": stop,
+                }
+                save_checkpoint(checkpoint, checkpoint_path)
+            if stop:
+                stop_reason = stop
+                break
+
+    result = {"epochs": epochs, "best_epoch": epochs, "val_accuracy": None}
+    if best["state"] is not None:
+        model.load_state_dict(best["state"])
+        result.update(best_epoch=best["epoch"], val_accuracy=best["val_accuracy"])
+    if epochs < NUM_EPOCHS:
+        logger.info(
+            f"Trained {epochs} of {NUM_EPOCHS} epochs ({stop_reason}), {NUM_EPOCHS - epochs} epochs saved, "
+            f"best epoch {result['best_epoch']}"
+        )
+
+    if compiled and len(step_times) > 1:
+        steady = statistics.median(step_times[1:])
+        logger.info(
+            f"Compilation {step_times[0] - steady:.2f} s (first step {step_times[0]:.2f} s), "
+            f"steady-state step {steady * 1000:.1f} ms"
+        )
+
+    if timer:
+        summary = timer.summary()
+        logger.info(f"Training stages over {epochs} epochs: {describe(summary)}")
+        result.update(summary)
+
+    return result
 
 
 def evaluate_model(
     model: torch.nn.Module,
     test_loader: torch.utils.data.DataLoader,
     device: torch.device,
+    bf16: bool = False,
+    compiled: bool = False,
 ) -> float:
     """
     Computes accuracy of provided model.
@@ -66,6 +238,8 @@ def evaluate_model(
     :param model: model to evaluate
     :param test_loader: loader for testing data
     :param device: device to evaluate model on
+    :param bf16: mixed precision, see mixed_precision
+    :param compiled: model was compiled by train.create_model, pads the last batch to batch size of loader
     """
     acc = Accuracy(task="binary").to(device)
     model.eval()
@@ -73,7 +247,12 @@ def evaluate_model(
     with torch.no_grad():
         for X_batch, y_batch in test_loader:
             X_batch, y_batch = X_batch.to(device), y_batch.to(device)
-            output = model(X_batch)
+            if compiled:
+                X_batch = pad_batch(X_batch, test_loader.batch_size)
+            if bf16 and X_batch.dim() == 4:
+                X_batch = X_batch.contiguous(memory_format=torch.channels_last)
+            with mixed_precision(device, bf16):
+                output = model(X_batch)[: len(y_batch)]
             preds = torch.argmax(output, dim=1)
             acc.update(preds, y_batch)
 
@@ -1,6 +1,8 @@
-import os, mne, shutil
+import os, mne
+from functools import partial
 from eeg_logger import logger
-
+import scripts.preprocessing.runner as runner
+import scripts.preprocessing.epoching as epoching
 
 """
 # Event |  Type  | Description
@@ -20,50 +22,55 @@ _________________________________________
 """
 
 
-def extract_epochs(data_path: str, save_path_root: str) -> None:
+SELECTED_EVENT_ID: dict[str, int] = {"left_hand": 7, "right_hand": 8}  # BASED ON EVENT_IDS
+TMIN, TMAX = 1.0, 4.0
+
+
+def extract_epochs(data_path: str, save_path_root: str, jobs: int = 1, force: bool = False) -> None:
 
     if not os.path.exists(data_path):
         logger.error(f"No data to preprocess in {data_path}")
         return
 
     save_directory: str = __create_save_directory(save_path_root)
-    subject_folders = [f for f in os.listdir(data_path)]
+    subject_inputs = {
+        subject: [__data_file(data_path, subject)]
+        for subject in os.listdir(data_path)
+        if os.path.isdir(os.path.join(data_path, subject))
+    }
+
+    params = {"event_id": SELECTED_EVENT_ID, "tmin": TMIN, "tmax": TMAX}
+    runner.extract_subjects(
+        subject_inputs, partial(extract_subject, data_path), params, save_directory, jobs=jobs, force=force
+    )
+
 
-    for subject in subject_folders:
+def extract_subject(data_path: str, subject: str, save_directory: str) -> None:
 
-        data_file = os.path.join(data_path, subject, f"A{subject[1:3]}T.gdf")
+    logger.info(f"Reading data from {subject}...")
+    raw = mne.io.read_raw_gdf(
+        __data_file(data_path, subject), eog=["EOG-left", "EOG-central", "EOG-right"], preload=True
+    )
+    epochs = __extract(raw)
+
+    os.makedirs(os.path.join(save_directory, subject))
 
-        logger.info(f"Reading data from {subject}...")
-        raw = mne.io.read_raw_gdf(data_file, eog=["EOG-left", "EOG-central", "EOG-right"], preload=True)
-        epochs = __extract(raw)
+    filename = os.path.join(save_directory, subject, f"PA{subject[1:3]}T-epo.fif")
+    epochs.save(filename)
+    logger.info(f"Preprocessed data for subject {subject[1:3]} saved as {filename}")
 
-        os.makedirs(os.path.join(save_directory, subject))
 
-        filename = os.path.join(save_directory, subject, f"PA{subject[1:3]}T-epo.fif")
-        epochs.save(filename)
-        logger.info(f"Preprocessed data for subject {subject[1:3]} saved as {filename}")
+def __data_file(data_path: str, subject: str) -> str:
+    return os.path.join(data_path, subject, f"A{subject[1:3]}T.gdf")
 
 
-def __extract(raw_data: mne.io.BaseRaw) -> mne.Epochs:
+def __extract(raw_data: mne.io.BaseRaw) -> mne.EpochsArray:
 
     events, event_ids = mne.events_from_annotations(raw_data)  # EXTRACT EVENTS
     logger.info(f"Event ids: {event_ids}")  # THIS IS IMPORTANT BECAUSE IT PROVIDES MAPPING TO EVENT IDS
-    selected_event_id = {"left_hand": 7, "right_hand": 8}  # BASED ON EVENT_IDS
-
-    # PICK ONLY EEG
-    picks = mne.pick_types(raw_data.info, meg=False, eeg=True, eog=False, stim=False, exclude="bads")
-    tmin, tmax = 1.0, 4.0
-
-    epochs = mne.Epochs(
-        raw_data,
-        events,
-        event_id=selected_event_id,
-        tmin=tmin,
-        tmax=tmax,
-        picks=picks,
-        baseline=None,
-        preload=True,
-    )
+    selected_event_id = SELECTED_EVENT_ID
+
+    epochs = epoching.extract_epochs(raw_data, events, selected_event_id, TMIN, TMAX)  # ONLY EEG
     logger.info(f"Epochs: {epochs}")
     return epochs
 
@@ -72,10 +79,6 @@ def __create_save_directory(save_path_root: str) -> str:
 
     path: str = f"{save_path_root}/BCI_IV_2a"
 
-    if os.path.exists(path):
-        logger.info("Removing old preprocess directory for BCI_IV_2a")
-        shutil.rmtree(path)
-
-    os.makedirs(path)
+    os.makedirs(path, exist_ok=True)
 
     return path
@@ -1,5 +1,8 @@
-import os, mne, shutil
+import os, mne
+from functools import partial
 from eeg_logger import logger
+import scripts.preprocessing.runner as runner
+import scripts.preprocessing.epoching as epoching
 
 """
 # Event |  Type  | Description
@@ -20,36 +23,53 @@ _________________________________________
 """
 
 
-def extract_epochs(data_path: str, save_path_root: str) -> None:
+NUM_TRAIN_SESSIONS: int = 2
+TMIN, TMAX = -0.2, 0.5  # DEFAULT WINDOW OF mne.Epochs
+
+
+def extract_epochs(data_path: str, save_path_root: str, jobs: int = 1, force: bool = False) -> None:
 
     if not os.path.exists(data_path):
         logger.error(f"No data to preprocess in {data_path}")
         return
 
     save_directory: str = __create_save_directory(save_path_root)
-    subject_folders = [f for f in os.listdir(data_path)]
+    subject_inputs = {
+        subject: __train_data_files(data_path, subject)
+        for subject in os.listdir(data_path)
+        if os.path.isdir(os.path.join(data_path, subject))
+    }
+
+    params = {"train_sessions": NUM_TRAIN_SESSIONS, "event_id": {"769": "left_hand", "770": "right_hand"}}
+    runner.extract_subjects(
+        subject_inputs, partial(extract_subject, data_path), params, save_directory, jobs=jobs, force=force
+    )
+
+
+def extract_subject(data_path: str, subject: str, save_directory: str) -> None:
 
-    for subject in subject_folders:
-        subject_dir = os.path.join(data_path, subject)
+    subject_save_dir = os.path.join(save_directory, subject)
+    os.makedirs(subject_save_dir, exist_ok=True)
 
-        subject_save_dir = os.path.join(save_directory, subject)
-        os.makedirs(subject_save_dir, exist_ok=True)
+    logger.info(f"Reading data from {subject}...")
 
-        train_data_files = [f for f in os.listdir(subject_dir) if f.endswith("T.gdf")]
-        logger.info(f"Reading data from {subject}...")
+    for idx, train_file_path in enumerate(__train_data_files(data_path, subject), start=1):
 
-        for idx, train_file in enumerate(train_data_files[:2], start=1):
-            train_file_path = os.path.join(subject_dir, train_file)
+        raw_train = mne.io.read_raw_gdf(train_file_path, eog=["EOG-left", "EOG-central", "EOG-right"], preload=True)
+        train_epochs = __extract(raw_train)
 
-            raw_train = mne.io.read_raw_gdf(train_file_path, eog=["EOG-left", "EOG-central", "EOG-right"], preload=True)
-            train_epochs = __extract(raw_train)
+        train_filename = os.path.join(subject_save_dir, f"PB{subject[1:3]}0{idx}T-epo.fif")
+        train_epochs.save(train_filename)
+        logger.info(f"Training data for subject {subject[1:3]} saved as {train_filename}")
 
-            train_filename = os.path.join(subject_save_dir, f"PB{subject[1:3]}0{idx}T-epo.fif")
-            train_epochs.save(train_filename)
-            logger.info(f"Training data for subject {subject[1:3]} saved as {train_filename}")
 
+def __train_data_files(data_path: str, subject: str) -> list[str]:
+    subject_dir = os.path.join(data_path, subject)
+    train_data_files = sorted(f for f in os.listdir(subject_dir) if f.endswith("T.gdf"))
+    return [os.path.join(subject_dir, f) for f in train_data_files[:NUM_TRAIN_SESSIONS]]
 
-def __extract(raw_data: mne.io.BaseRaw) -> mne.Epochs:
+
+def __extract(raw_data: mne.io.BaseRaw) -> mne.EpochsArray:
 
     events, event_ids = mne.events_from_annotations(raw_data)  # EXTRACT EVENTS
     logger.info(f"Event ids: {event_ids}")  # THIS IS IMPORTANT BECAUSE IT PROVIDES MAPPING TO EVENT IDS
@@ -62,17 +82,7 @@ def __extract(raw_data: mne.io.BaseRaw) -> mne.Epochs:
         logger.warning("Event values for IDs 769, 770 not matching 10 and 11, falling back to 4, 5.")
         selected_event_id = {"left_hand": 4, "right_hand": 5}
 
-    # PICK ONLY EEG
-    picks = mne.pick_types(raw_data.info, meg=False, eeg=True, eog=False, stim=False, exclude="bads")
-
-    epochs = mne.Epochs(
-        raw_data,
-        events,
-        event_id=selected_event_id,
-        picks=picks,
-        baseline=None,
-        preload=True,
-    )
+    epochs = epoching.extract_epochs(raw_data, events, selected_event_id, TMIN, TMAX)  # ONLY EEG
     logger.info(f"Epochs: {epochs}")
     return epochs
 
@@ -81,10 +91,6 @@ def __create_save_directory(save_path_root: str) -> str:
 
     path: str = f"{save_path_root}/BCI_IV_2b"
 
-    if os.path.exists(path):
-        logger.info("Removing old preprocess directory for BCI_IV_2b")
-        shutil.rmtree(path)
-
-    os.makedirs(path)
+    os.makedirs(path, exist_ok=True)
 
     return path
@@ -1,5 +1,8 @@
-import os, mne, shutil
+import os, mne
+from functools import partial
 from eeg_logger import logger
+import scripts.preprocessing.runner as runner
+import scripts.preprocessing.epoching as epoching
 
 """
 # Event | Type  | Description
@@ -16,57 +19,63 @@ _________________________________________
 """
 
 
-def extract_epochs(data_path: str, save_path_root: str) -> None:
+SELECTED_EVENT_ID: dict[str, int] = {"left_hand": 3, "right_hand": 4}  # Corrected event IDs based on dataset
+TMIN, TMAX = 0.0, 7.0
+
+
+def extract_epochs(data_path: str, save_path_root: str, jobs: int = 1, force: bool = False) -> None:
     if not os.path.exists(data_path):
         logger.error(f"No data to preprocess in {data_path}")
         return
 
     save_directory: str = __create_save_directory(save_path_root)
     subject_folders = [f for f in os.listdir(data_path) if os.path.isdir(os.path.join(data_path, f))]
+    subject_inputs = {}
 
     for subject in subject_folders:
-        data_file = os.path.join(data_path, subject, f"{subject[1:3]}.gdf")
+        data_file = __data_file(data_path, subject)
 
         if not os.path.exists(data_file):
             logger.warning(f"File {data_file} not found. Skipping subject {subject}")
             continue
 
-        logger.info(f"Reading data from {subject}...")
-        raw = mne.io.read_raw_gdf(data_file, preload=True)
-        epochs = __extract(raw)
+        subject_inputs[subject] = [data_file]
+
+    params = {"event_id": SELECTED_EVENT_ID, "tmin": TMIN, "tmax": TMAX}
+    runner.extract_subjects(
+        subject_inputs, partial(extract_subject, data_path), params, save_directory, jobs=jobs, force=force
+    )
+
+
+def extract_subject(data_path: str, subject: str, save_directory: str) -> None:
+    logger.info(f"Reading data from {subject}...")
+    raw = mne.io.read_raw_gdf(__data_file(data_path, subject), preload=True)
+    epochs = __extract(raw)
 
-        os.makedirs(os.path.join(save_directory, subject), exist_ok=True)
+    os.makedirs(os.path.join(save_directory, subject), exist_ok=True)
 
-        filename = os.path.join(save_directory, subject, f"{subject[1:3]}-epo.fif")
-        epochs.save(filename)
-        logger.info(f"Preprocessed data for subject {subject[1:3]} saved as {filename}")
+    filename = os.path.join(save_directory, subject, f"{subject[1:3]}-epo.fif")
+    epochs.save(filename)
+    logger.info(f"Preprocessed data for subject {subject[1:3]} saved as {filename}")
 
 
-def __extract(raw_data: mne.io.BaseRaw) -> mne.Epochs:
+def __data_file(data_path: str, subject: str) -> str:
+    return os.path.join(data_path, subject, f"{subject[1:3]}.gdf")
+
+
+def __extract(raw_data: mne.io.BaseRaw) -> mne.EpochsArray:
     events, event_ids = mne.events_from_annotations(raw_data)  # EXTRACT EVENTS
     logger.info(f"Event ids: {event_ids}")  # Log event IDs to verify they're correct
 
     # Only keep events for left hand (3) and right hand (4) as specified in the dataset
-    selected_event_id = {"left_hand": 3, "right_hand": 4}  # Corrected event IDs based on dataset description
-
-    # PICK ONLY EEG
-    picks = mne.pick_types(raw_data.info, meg=False, eeg=True, eog=False, stim=False, exclude="bads")
+    selected_event_id = SELECTED_EVENT_ID
 
     # Adjusted time window to match the trial timing in the dataset (0s to 7s)
-    tmin, tmax = 0.0, 7.0
-
-    # Create epochs for the selected events (left hand and right hand)
-    epochs = mne.Epochs(
-        raw_data,
-        events,
-        event_id=selected_event_id,
-        tmin=tmin,
-        tmax=tmax,
-        picks=picks,
-        baseline=None,
-        preload=True,
-        event_repeated="merge",  # Handle repeated events by merging them
-    )
+    tmin, tmax = TMIN, TMAX
+
+    # Create epochs of EEG channels for the selected events (left hand and right hand),
+    # repeated events at one sample are kept once
+    epochs = epoching.extract_epochs(raw_data, events, selected_event_id, tmin, tmax)
 
     logger.info(f"Number of epochs: {len(epochs)}")
     logger.info(f"Epochs: {epochs}")
@@ -76,10 +85,6 @@ def __extract(raw_data: mne.io.BaseRaw) -> mne.Epochs:
 def __create_save_directory(save_path_root: str) -> str:
     path: str = f"{save_path_root}/BCI_III_3a"
 
-    if os.path.exists(path):
-        logger.info("Removing old preprocess directory for BCI_III_3a")
-        shutil.rmtree(path)
-
-    os.makedirs(path)
+    os.makedirs(path, exist_ok=True)
 
     return path
@@ -0,0 +1,114 @@
+import mne
+import numpy as np
+
+"""
+Epoch extraction shared by all dataset modules.
+
+All windows of a dataset are cut from raw data in one pass: every event reads the span covering all
+windows once and every window is sliced from it into its own preallocated float32 array, which replaces
+one preloaded float64 mne.Epochs per window. Window samples are computed like mne.Epochs computes them
+(tmin and tmax included), events reaching out of the recording or overlapping annotations whose description
+starts with "bad" or "edge" are dropped. Like mne.Epochs the overlap is checked on annotations, not on data,
+so zero-duration "BAD boundary" annotations of mne.concatenate_raws drop windows spanning the join of two runs.
+"""
+
+
+def extract_windows(
+    raw: mne.io.BaseRaw,
+    events: np.ndarray,
+    event_id: dict[str, int],
+    windows: dict[str, tuple[float, float]],
+    picks: np.ndarray | None = None,
+) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """
+    :param raw: raw data
+    :param events: events of raw data (n_events, 3), e.g. from mne.events_from_annotations
+    :param event_id: selected events, other events are ignored, repeated events at one sample are kept once
+    :param windows: tmin and tmax in seconds relative to event of every window
+    :param picks: channels, EEG channels by default
+    :return: float32 epochs (n_epochs, n_channels, n_times) and their events of every window
+    """
+    if picks is None:
+        picks = mne.pick_types(raw.info, meg=False, eeg=True, eog=False, stim=False, exclude="bads")
+
+    selected = events[np.isin(events[:, 2], list(event_id.values()))]
+    selected = selected[np.unique(selected[:, 0], return_index=True)[1]]  # FIRST EVENT OF REPEATED SAMPLES
+
+    sfreq = raw.info["sfreq"]
+    annotations = raw.annotations
+    bad = np.array([description.lower().startswith(("bad", "edge")) for description in annotations.description], bool)
+    bad_onsets = annotations.onset[bad] - raw.first_time  # SECONDS FROM FIRST SAMPLE
+    bad_ends = bad_onsets + annotations.duration[bad]
+    bounds = {name: (round(tmin * sfreq), round(tmax * sfreq)) for name, (tmin, tmax) in windows.items()}
+    first = min(start for start, _ in bounds.values())
+    last = max(stop for _, stop in bounds.values())
+
+    data = {
+        name: np.empty((len(selected), len(picks), stop - start + 1), np.float32)
+        for name, (start, stop) in bounds.items()
+    }
+    kept = {name: [] for name in windows}
+
+    for index, sample in enumerate(selected[:, 0] - raw.first_samp):
+        span_start, span_stop = max(sample + first, 0), min(sample + last + 1, raw.n_times)
+        span = raw.get_data(picks=picks, start=span_start, stop=span_stop)
+
+        for name, (start, stop) in bounds.items():
+            if sample + start < 0 or sample + stop >= raw.n_times:
+                continue  # WINDOW REACHES OUT OF THE RECORDING
+            if np.any((bad_onsets < (sample + stop + 1) / sfreq) & (bad_ends > (sample + start) / sfreq)):
+                continue  # WINDOW OVERLAPS BAD SEGMENT OR BOUNDARY, SAME TEST AS mne.Epochs
+            data[name][len(kept[name])] = span[:, sample + start - span_start : sample + stop + 1 - span_start]
+            kept[name].append(index)
+
+    return {name: (data[name][: len(kept[name])], selected[kept[name]]) for name in windows}
+
+
+def zscore_(data: np.ndarray, noise_amplitude: float = 0.0, rng: np.random.Generator | None = None) -> np.ndarray:
+    """
+    Z-score of every channel of every epoch over time in place, channels with zero variance are only centered:
+    X* = (X - mean) / std + aN
+
+    :param data: float32 epochs (n_epochs, n_channels, n_times)
+    :param noise_amplitude: a, amplitude of standard normal noise N
+    :param rng: generator of noise
+    """
+    rng = rng or np.random.default_rng()
+
+    for epoch in data:  # ONE EPOCH OF TEMPORARY MEMORY AT A TIME
+        epoch -= epoch.mean(axis=-1, keepdims=True)
+        std = epoch.std(axis=-1, keepdims=True)
+        std[std == 0] = 1.0
+        epoch /= std
+        if noise_amplitude:
+            epoch += noise_amplitude * rng.standard_normal(epoch.shape, dtype=np.float32)
+
+    return data
+
+
+def to_epochs(
+    raw: mne.io.BaseRaw,
+    data: np.ndarray,
+    events: np.ndarray,
+    event_id: dict[str, int],
+    tmin: float,
+    picks: np.ndarray | None = None,
+) -> mne.EpochsArray:
+    """
+    Epochs of extract_windows for saving, picks must be the same as in extract_windows.
+    """
+    if picks is None:
+        picks = mne.pick_types(raw.info, meg=False, eeg=True, eog=False, stim=False, exclude="bads")
+    present = {name: code for name, code in event_id.items() if code in events[:, 2]}
+    info = mne.pick_info(raw.info, picks)
+    return mne.EpochsArray(data, info, events=events, tmin=tmin, event_id=present, baseline=None)
+
+
+def extract_epochs(
+    raw: mne.io.BaseRaw, events: np.ndarray, event_id: dict[str, int], tmin: float, tmax: float
+) -> mne.EpochsArray:
+    """
+    Epochs of EEG channels in one window, without normalisation.
+    """
+    ((data, selected),) = extract_windows(raw, events, event_id, {"epochs": (tmin, tmax)}).values()
+    return to_epochs(raw, data, selected, event_id, tmin)
@@ -1,6 +1,9 @@
-import os, mne, shutil
+import os, mne
 import numpy as np
+from functools import partial
 from eeg_logger import logger
+import scripts.preprocessing.runner as runner
+import scripts.preprocessing.epoching as epoching
 
 """
 In Physionet dataset, runs regarding motor imagery are [4, 8, 12].
@@ -30,117 +33,89 @@ X - raw epochs data
 mean - mean value of data
 std - standard deviation of data
 N - random noise, used np.random.randn
-a - percent of random noise, set to 0.01
+a - percent of random noise, set to 0.01 in the article
+
+Epochs are stored without noise (NOISE_AMPLITUDE = 0), noise is added to every training batch
+instead (train.py --noise 0.01, see scripts/dataset/augmentation.py), so every run sees new noise.
 
 """
 
 
-def extract_epochs(data_path: str, save_path_root: str) -> None:
+RUNS: list[int] = [4, 8, 12]
+BAD_SUBJECTS: list[int] = [88, 92, 100, 104]  # THESE SUBJECTS HAVE INCOMPLETE ANNOTATIONS
+SELECTED_EVENT_ID: dict[str, int] = {"left_hand": 2, "right_hand": 3}  # BASED ON EVENT_IDS
+WINDOWS: dict[str, tuple[float, float]] = {"3s": (2.0, 5.0), "6s": (1.0, 7.0)}
+NOISE_AMPLITUDE: float = 0.0
+
+
+def extract_epochs(data_path: str, save_path_root: str, jobs: int = 1, force: bool = False) -> None:
 
     if not os.path.exists(data_path):
         logger.error(f"No data to preprocess in {data_path}")
         return
 
     save_directory: str = __create_save_directory(save_path_root)
-    subject_folders = [f for f in os.listdir(data_path)]
-    bad_subjects = [88, 92, 100, 104]  # THESE SUBJECTS HAVE INCOMPLETE ANNOTATIONS
+    subject_inputs = {}
 
-    for idx, subject in enumerate(subject_folders, start=1):
-
-        if idx in bad_subjects:
+    for subject in os.listdir(data_path):
+        if not os.path.isdir(os.path.join(data_path, subject)) or int(subject[1:4]) in BAD_SUBJECTS:
             continue
+        subject_inputs[subject] = [__run_file(data_path, subject, run) for run in RUNS]
 
-        data_file_run_4 = os.path.join(data_path, subject, f"S{subject[1:4]}R04.edf")
-        data_file_run_8 = os.path.join(data_path, subject, f"S{subject[1:4]}R08.edf")
-        data_file_run_12 = os.path.join(data_path, subject, f"S{subject[1:4]}R12.edf")
-
-        logger.info(f"Reading data from {subject}...")
-
-        raw_run_4 = mne.io.read_raw_edf(data_file_run_4, preload=True)
-        raw_run_8 = mne.io.read_raw_edf(data_file_run_8, preload=True)
-        raw_run_12 = mne.io.read_raw_edf(data_file_run_12, preload=True)
-
-        raws = mne.concatenate_raws([raw_run_4, raw_run_8, raw_run_12])
-        epochs_3s, epochs_6s = __extract(raws)
-
-        os.makedirs(os.path.join(save_directory, subject))
+    params = {"runs": RUNS, "event_id": SELECTED_EVENT_ID, "windows": WINDOWS, "noise_amplitude": NOISE_AMPLITUDE}
+    runner.extract_subjects(
+        subject_inputs, partial(extract_subject, data_path), params, save_directory, jobs=jobs, force=force
+    )
 
-        epochs_3s_filename = os.path.join(save_directory, subject, f"PA{subject[1:4]}-3s-epo.fif")
-        epochs_6s_filename = os.path.join(save_directory, subject, f"PA{subject[1:4]}-6s-epo.fif")
 
-        epochs_3s.save(epochs_3s_filename)
-        epochs_6s.save(epochs_6s_filename)
+def extract_subject(data_path: str, subject: str, save_directory: str) -> None:
 
-        logger.info(f"Preprocessed data for subject {subject[1:4]} saved")
+    logger.info(f"Reading data from {subject}...")
 
+    raws = mne.concatenate_raws(
+        [mne.io.read_raw_edf(__run_file(data_path, subject, run), preload=True) for run in RUNS]
+    )
+    windows = __extract(raws)
 
-def __extract(raw_data: mne.io.BaseRaw) -> tuple[mne.Epochs, mne.Epochs]:
+    os.makedirs(os.path.join(save_directory, subject))
 
-    events, event_ids = mne.events_from_annotations(raw_data)  # EXTRACT EVENTS
-    logger.info(f"Event ids: {event_ids}")  # THIS IS IMPORTANT BECAUSE IT PROVIDES MAPPING TO EVENT IDS
-    selected_event_id = {"left_hand": 2, "right_hand": 3}  # BASED ON EVENT_IDS
-
-    # PICK ONLY EEG
-    picks = mne.pick_types(raw_data.info, meg=False, eeg=True, eog=False, stim=False, exclude="bads")
-    tmin_3s, tmax_3s = 2.0, 5.0
-    tmin_6s, tmax_6s = 1.0, 7.0
-
-    epochs_3s = mne.Epochs(
-        raw_data,
-        events,
-        event_id=selected_event_id,
-        tmin=tmin_3s,
-        tmax=tmax_3s,
-        picks=picks,
-        baseline=None,
-        preload=True,
-    )
+    # ONE WINDOW AT A TIME IN FLOAT64 EPOCHS FOR SAVING
+    for window, (data, events) in windows.items():
+        epochs = epoching.to_epochs(raws, data, events, SELECTED_EVENT_ID, WINDOWS[window][0])
+        epochs.save(os.path.join(save_directory, subject, f"PA{subject[1:4]}-{window}-epo.fif"))
+        del epochs
 
-    epochs_6s = mne.Epochs(
-        raw_data,
-        events,
-        event_id=selected_event_id,
-        tmin=tmin_6s,
-        tmax=tmax_6s,
-        picks=picks,
-        baseline=None,
-        preload=True,
-    )
+    logger.info(f"Preprocessed data for subject {subject[1:4]} saved")
 
-    epochs_normalised_3s = __normalise(epochs_3s)
-    epochs_normalised_6s = __normalise(epochs_6s)
 
-    logger.info(f"Extracted {len(epochs_normalised_3s)} epochs (3s) and {len(epochs_normalised_6s)} epochs (6s)")
-    return epochs_normalised_3s, epochs_normalised_6s
+def __run_file(data_path: str, subject: str, run: int) -> str:
+    return os.path.join(data_path, subject, f"S{subject[1:4]}R{run:02d}.edf")
 
 
-def __normalise(epochs: mne.Epochs) -> mne.epochs:
+def __extract(raw_data: mne.io.BaseRaw) -> dict[str, tuple[np.ndarray, np.ndarray]]:
     """
-    Applies z-score normalisation according to this formula:
+    Extracts all WINDOWS in one pass and normalises them in place in float32:
     X* = (X - mean) / std + aN
+
+    :return: float32 epochs and their events of every window
     """
 
-    data: np.ndarray = epochs.get_data()  # shape: (n_epochs, n_channels, n_times)
-    mean = data.mean(axis=2, keepdims=True)
-    std = data.std(axis=2, keepdims=True)
-    std[std == 0] = 1.0
-    N = np.random.randn(*data.shape)
-    a = 0.01
+    events, event_ids = mne.events_from_annotations(raw_data)  # EXTRACT EVENTS
+    logger.info(f"Event ids: {event_ids}")  # THIS IS IMPORTANT BECAUSE IT PROVIDES MAPPING TO EVENT IDS
 
-    zscored_data = (data - mean) / std + a * N
-    epochs._data = zscored_data
+    windows = epoching.extract_windows(raw_data, events, SELECTED_EVENT_ID, WINDOWS)
+    for data, _ in windows.values():
+        epoching.zscore_(data, NOISE_AMPLITUDE)
 
-    return epochs
+    counts = ", ".join(f"{len(data)} epochs ({window})" for window, (data, _) in windows.items())
+    logger.info(f"Extracted {counts}")
+    return windows
 
 
 def __create_save_directory(save_path_root: str) -> str:
 
     path: str = f"{save_path_root}/Physionet"
 
-    if os.path.exists(path):
-        logger.info("Removing old preprocess directory for Physionet")
-        shutil.rmtree(path)
-
-    os.makedirs(path)
+    os.makedirs(path, exist_ok=True)
 
     return path
@@ -0,0 +1,97 @@
+import os, json, shutil, hashlib
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from eeg_logger import logger
+
+"""
+Runs per-subject epoch extraction of any dataset module in a process pool.
+
+Every save directory keeps a manifest.json with, for every extracted subject, a hash of the
+extraction parameters and a sha1 of each of its input files:
+
+{
+    "S001": {"params": "<sha1 of parameters>", "inputs": {"S001R04.edf": "<sha1>", ...}},
+    ...
+}
+
+Subjects whose entry matches the current parameters and input files are skipped, so only new
+or changed subjects are extracted again.
+"""
+
+MANIFEST_FILENAME: str = "manifest.json"
+
+
+def extract_subjects(
+    subject_inputs: dict[str, list[str]],
+    extract_subject: Callable[[str, str], None],
+    params: dict,
+    save_directory: str,
+    jobs: int = 1,
+    force: bool = False,
+) -> None:
+    """
+    Extracts epochs of all subjects whose inputs or parameters changed since the last run.
+
+    :param subject_inputs: mapping of subject folder name to its input files
+    :param extract_subject: picklable function called as extract_subject(subject, save_directory)
+    :param params: extraction parameters of the dataset, stored in the manifest
+    :param save_directory: directory with preprocessed data of the dataset
+    :param jobs: number of worker processes
+    :param force: extract all subjects, ignoring the manifest
+    """
+    os.makedirs(save_directory, exist_ok=True)
+    manifest = {} if force else __load_manifest(save_directory)
+    params_hash = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+    pending = {}
+    for subject, input_files in sorted(subject_inputs.items()):
+        entry = {"params": params_hash, "inputs": {os.path.basename(f): __file_hash(f) for f in input_files}}
+        if manifest.get(subject) == entry and os.path.exists(os.path.join(save_directory, subject)):
+            continue
+        pending[subject] = entry
+
+    skipped = len(subject_inputs) - len(pending)
+    logger.info(f"Extracting {len(pending)} subjects with {jobs} jobs, {skipped} unchanged subjects skipped")
+
+    for subject in pending:
+        manifest.pop(subject, None)
+        subject_save_dir = os.path.join(save_directory, subject)
+        if os.path.exists(subject_save_dir):
+            shutil.rmtree(subject_save_dir)
+    __save_manifest(save_directory, manifest)
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(extract_subject, subject, save_directory): subject for subject in pending}
+        for future in as_completed(futures):
+            subject = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"Failed to extract epochs for subject {subject}: {e}")
+                continue
+            # SAVED AFTER EVERY SUBJECT, SO AN INTERRUPTED RUN KEEPS ITS PROGRESS
+            manifest[subject] = pending[subject]
+            __save_manifest(save_directory, manifest)
+
+
+def __file_hash(file_path: str) -> str:
+    with open(file_path, "rb") as file:
+        return hashlib.file_digest(file, "sha1").hexdigest()
+
+
+def __load_manifest(save_directory: str) -> dict:
+    path = os.path.join(save_directory, MANIFEST_FILENAME)
+
+    if not os.path.exists(path):
+        return {}
+
+    with open(path) as file:
+        return json.load(file)
+
+
+def __save_manifest(save_directory: str, manifest: dict) -> None:
+    path = os.path.join(save_directory, MANIFEST_FILENAME)
+
+    with open(path + ".tmp", "w") as file:
+        json.dump(manifest, file, indent=4, sort_keys=True)
+    os.replace(path + ".tmp", path)
@@ -0,0 +1,66 @@
+import json, socket, time, threading, bisect
+import numpy as np
+from scripts.dataset.epoch_store import load_subject_data
+from scripts.streaming.service import CHUNK_HEADER
+from eeg_logger import logger
+
+
+def replay(file_path: str, host: str, port: int, chunk_size: int, sfreq: float, speed: float = 1.0) -> None:
+    """
+    Streams preprocessed epochs to the inference service as if they came from an amplifier,
+    epochs are concatenated into one continuous recording. Logs end-to-end latency percentiles,
+    measured from sending the chunk that completed a window to receiving its classification.
+
+    :param file_path: -epo.fif file with preprocessed epochs
+    :param chunk_size: number of samples sent at once
+    :param sfreq: sampling frequency of the recording
+    :param speed: replay speed relative to real time, 0 sends as fast as possible
+    """
+    X, _ = load_subject_data(file_path)
+    recording = np.ascontiguousarray(np.concatenate(X, axis=1).T, dtype=np.float32)  # (n_samples, n_channels)
+    num_samples, num_channels = recording.shape
+
+    chunk_ends: list[int] = []
+    send_times: list[float] = []
+    latencies: list[float] = []
+
+    with socket.create_connection((host, port)) as connection:
+        reader = threading.Thread(target=__read_responses, args=(connection, chunk_ends, send_times, latencies))
+        reader.start()
+
+        connection.sendall((json.dumps({"channels": num_channels}) + "\n").encode())
+        logger.info(f"Replaying {num_samples} samples of {file_path} in chunks of {chunk_size}")
+        start = time.perf_counter()
+
+        try:
+            for chunk_start in range(0, num_samples, chunk_size):
+                if speed > 0:
+                    delay = start + chunk_start / sfreq / speed - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                chunk = recording[chunk_start : chunk_start + chunk_size]
+                chunk_ends.append(chunk_start + len(chunk))
+                send_times.append(time.perf_counter())
+                connection.sendall(CHUNK_HEADER.pack(len(chunk)) + chunk.tobytes())
+            connection.shutdown(socket.SHUT_WR)
+        except (BrokenPipeError, ConnectionResetError):
+            logger.error("Inference service closed the session")
+        reader.join()
+
+    if latencies:
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        logger.info(f"{len(latencies)} classifications, end-to-end latency p50 {p50:.2f} ms, p99 {p99:.2f} ms")
+    else:
+        logger.warning("No classifications received, recording shorter than window?")
+
+
+def __read_responses(connection: socket.socket, chunk_ends: list, send_times: list, latencies: list) -> None:
+    for line in connection.makefile("rb"):
+        received = time.perf_counter()
+        response = json.loads(line)
+        if "error" in response:
+            logger.error(f"Inference service rejected the session: {response['error']}")
+            return
+        chunk = bisect.bisect_left(chunk_ends, response["sample"])  # CHUNK THAT COMPLETED THE WINDOW
+        latencies.append(received - send_times[chunk])
@@ -0,0 +1,38 @@
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Fixed-size multichannel buffer keeping the most recent `size` samples.
+    """
+
+    def __init__(self, num_channels: int, size: int):
+        """
+        :param int num_channels: number of EEG channels
+        :param int size: number of most recent samples kept
+        """
+        self.size = size
+        self.data = np.zeros((num_channels, size), dtype=np.float32)
+        self.position = 0  # WHERE THE NEXT SAMPLE IS WRITTEN
+        self.total_samples = 0
+
+    def write(self, chunk: np.ndarray) -> None:
+        """
+        :param chunk: samples of shape (n_channels, n_samples)
+        """
+        self.total_samples += chunk.shape[1]
+        chunk = chunk[:, -self.size :]  # ONLY THE LAST `size` SAMPLES CAN SURVIVE
+        n = chunk.shape[1]
+        first = min(n, self.size - self.position)
+        self.data[:, self.position : self.position + first] = chunk[:, :first]
+        self.data[:, : n - first] = chunk[:, first:]
+        self.position = (self.position + n) % self.size
+
+    def is_full(self) -> bool:
+        return self.total_samples >= self.size
+
+    def window(self) -> np.ndarray:
+        """
+        Returns copy of buffered samples in chronological order, shape (n_channels, size).
+        """
+        return np.concatenate([self.data[:, self.position :], self.data[:, : self.position]], axis=1)
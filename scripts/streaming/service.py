@@ -0,0 +1,139 @@
+import json, struct, time, socketserver, threading
+import numpy as np
+import torch
+import scripts.preprocessing.epoching as epoching
+from scripts.streaming.ring_buffer import RingBuffer
+from eeg_logger import logger
+
+"""
+Streaming inference over a local TCP socket.
+
+Protocol of one session (one connection):
+
+client -> server: header, one JSON line: {"channels": 64}, channels must match input channels of the model
+client -> server: any number of chunks: uint32 (little endian) number of samples,
+                  followed by float32 samples of shape (n_samples, n_channels), sample after sample
+server -> client: one JSON line per classification, every `hop` samples once the window is full:
+                  {"sample": <samples received so far>, "prediction": <class>, "probabilities": [...],
+                   "latency_ms": <time from receiving the chunk to sending the classification>}
+
+Client closes its side of connection to end the session. Invalid header is answered with one JSON line
+{"error": <reason>} and the connection is closed, session ends also at truncated chunk at end of input.
+"""
+
+CHUNK_HEADER = struct.Struct("<I")
+
+
+class LatencyStats:
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.lock = threading.Lock()
+
+    def record(self, latency: float) -> None:
+        with self.lock:
+            self.latencies.append(latency)
+
+    def summary(self) -> str:
+        with self.lock:
+            if not self.latencies:
+                return "no classifications"
+            p50, p99 = np.percentile(self.latencies, [50, 99]) * 1000
+            return f"{len(self.latencies)} classifications, latency p50 {p50:.2f} ms, p99 {p99:.2f} ms"
+
+
+class InferenceService:
+    def __init__(self, model: torch.nn.Module, window: int, hop: int, cnn_mode: bool, channels: int):
+        """
+        :param model: trained model, any model returned by train.create_model
+        :param int window: number of samples classified at once, same as training epochs length
+        :param int hop: number of samples between consecutive classifications
+        :param bool cnn_mode: adds channel dimension to windows, required by CNN models
+        :param int channels: input channels of model, sessions with other number of channels are rejected
+        """
+        self.model = model.eval()
+        self.channels = channels
+        self.window = window
+        self.hop = hop
+        self.cnn_mode = cnn_mode
+        self.stats = LatencyStats()
+
+    @torch.inference_mode()
+    def classify(self, samples: np.ndarray) -> np.ndarray:
+        """
+        :param samples: window of shape (n_channels, window)
+        :return: class probabilities
+        """
+        # SAME NORMALISATION AS PREPROCESSING, WITHOUT NOISE, ON A COPY OF THE RING BUFFER WINDOW
+        X = torch.from_numpy(epoching.zscore_(samples.astype(np.float32, copy=True)[np.newaxis]))
+        if self.cnn_mode:
+            X = X.unsqueeze(1)
+        return torch.softmax(self.model(X), dim=1)[0].numpy()
+
+    def serve(self, host: str, port: int) -> None:
+        service = self
+
+        class SessionHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                service.handle_session(self.rfile, self.wfile, self.client_address)
+
+        with socketserver.ThreadingTCPServer((host, port), SessionHandler) as server:
+            logger.info(f"Inference service listening on {host}:{port}, window {self.window}, hop {self.hop}")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                logger.info(f"Inference service stopped, {self.stats.summary()}")
+
+    def handle_session(self, rfile, wfile, client_address) -> None:
+        try:
+            num_channels = json.loads(rfile.readline())["channels"]
+        except (ValueError, TypeError, KeyError) as e:
+            self.__reject(wfile, client_address, f"Invalid session header: {e!r}")
+            return
+        if num_channels != self.channels:
+            self.__reject(wfile, client_address, f"Session has {num_channels} channels, model takes {self.channels}")
+            return
+
+        buffer = RingBuffer(num_channels, self.window)
+        next_classification = self.window
+        session_stats = LatencyStats()
+        logger.info(f"Session from {client_address} started, {num_channels} channels")
+
+        while chunk_header := rfile.read(CHUNK_HEADER.size):
+            if len(chunk_header) < CHUNK_HEADER.size:
+                logger.warning(f"Session from {client_address} ended with truncated chunk header")
+                break
+            (n_samples,) = CHUNK_HEADER.unpack(chunk_header)
+            payload = rfile.read(n_samples * num_channels * 4)
+            received = time.perf_counter()
+            if len(payload) < n_samples * num_channels * 4:
+                logger.warning(f"Session from {client_address} ended with truncated chunk of {n_samples} samples")
+                break
+            chunk = np.frombuffer(payload, dtype=np.float32).reshape(n_samples, num_channels).T
+
+            # CHUNK IS SPLIT AT HOP BOUNDARIES, SO EVERY HOP IS CLASSIFIED EVEN FOR CHUNKS LONGER THAN HOP
+            while chunk.shape[1] > 0:
+                n = min(chunk.shape[1], next_classification - buffer.total_samples)
+                buffer.write(chunk[:, :n])
+                chunk = chunk[:, n:]
+
+                if buffer.total_samples == next_classification:
+                    probabilities = self.classify(buffer.window())
+                    latency = time.perf_counter() - received
+                    response = {
+                        "sample": buffer.total_samples,
+                        "prediction": int(probabilities.argmax()),
+                        "probabilities": probabilities.tolist(),
+                        "latency_ms": latency * 1000,
+                    }
+                    wfile.write((json.dumps(response) + "\n").encode())
+                    wfile.flush()
+                    session_stats.record(latency)
+                    self.stats.record(latency)
+                    next_classification += self.hop
+
+        logger.info(f"Session from {client_address} finished, {session_stats.summary()}")
+
+    def __reject(self, wfile, client_address, error: str) -> None:
+        logger.error(f"Session from {client_address} rejected: {error}")
+        wfile.write((json.dumps({"error": error}) + "\n").encode())
+        wfile.flush()
@@ -0,0 +1,62 @@
+import argparse
+import torch
+from train import MODELS, create_model
+from scripts.models.export import load_artifact
+from scripts.streaming.service import InferenceService
+from scripts.streaming.replay import replay
+from eeg_logger import logger
+
+HOST: str = "127.0.0.1"
+PORT: int = 5555
+SAMPLING_FREQUENCY: int = 160  # PHYSIONET
+NUM_CHANNELS: int = 64  # PHYSIONET
+WINDOW: int = 481  # 3S EPOCHS
+HOP: int = 16  # 0.1S
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Streaming inference on live EEG")
+    subparsers = parser.add_subparsers(dest="command")
+
+    serve_parser = subparsers.add_parser("serve", help="runs inference service")
+    serve_parser.add_argument("model", help=", ".join(MODELS))
+    serve_parser.add_argument("--weights", default=None, help="state dict of trained model")
+    serve_parser.add_argument("--artifact", default=None, help="torchscript artifact exported by train.py")
+    serve_parser.add_argument("--channels", type=int, default=NUM_CHANNELS)
+    serve_parser.add_argument("--window", type=int, default=WINDOW, help="samples classified at once")
+    serve_parser.add_argument("--hop", type=int, default=HOP, help="samples between classifications")
+    serve_parser.add_argument("--port", type=int, default=PORT)
+
+    replay_parser = subparsers.add_parser("replay", help="streams preprocessed epochs to inference service")
+    replay_parser.add_argument("file", help="-epo.fif file with preprocessed epochs")
+    replay_parser.add_argument("--chunk", type=int, default=HOP, help="samples sent at once")
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="relative to real time, 0 - no pacing")
+    replay_parser.add_argument("--port", type=int, default=PORT)
+
+    args = parser.parse_args()
+
+    match args.command:
+        case "serve":
+            if args.model not in MODELS:
+                logger.error(f"Unknown model {args.model}, available models: {', '.join(MODELS)}")
+                return
+
+            model_name, cnn_mode = MODELS[args.model]
+            if args.artifact:
+                model = load_artifact(args.artifact)
+            elif args.weights:
+                model = create_model(model_name, (1, args.channels, args.window))
+                model.load_state_dict(torch.load(args.weights, map_location="cpu"))
+            else:
+                model = create_model(model_name, (1, args.channels, args.window))
+                logger.warning("No weights provided, serving untrained model")
+
+            InferenceService(model, args.window, args.hop, cnn_mode, args.channels).serve(HOST, args.port)
+        case "replay":
+            replay(args.file, HOST, args.port, args.chunk, SAMPLING_FREQUENCY, args.speed)
+        case _:
+            parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
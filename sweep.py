@@ -0,0 +1,281 @@
+import os, json, time, sqlite3, hashlib, argparse, itertools
+from datetime import datetime
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from sklearn.model_selection import KFold
+from train import MODELS, create_model, train_fold
+from scripts.dataset.epoch_store import EpochStore, store_exists
+from scripts.features.cache import FeatureCache, feature_key
+from scripts.features.layout import model_input
+import scripts.models.utils as utils
+from eeg_logger import logger
+
+"""
+Hyperparameter sweep over models, feature methods, feature parameters and learning rates.
+
+Grid is a JSON file, every list is swept, e.g.:
+
+{
+    "window": "3s",
+    "models": ["temporal", "temporalcnn"],
+    "features": [
+        {"method": "raw"},
+        {"method": "stft", "n_fft": [128, 256], "hop_length": [32]},
+        {"method": "wavelet", "wavelet": ["db4", "coif3"], "level": [3]}
+    ],
+    "learning_rates": [0.0001, 0.0007],
+    "train_options": {"patience": 10, "validation_split": 0.1},
+    "model_options": {}
+}
+
+Epochs are loaded once from the epoch store (python preprocess.py pack). Features are computed once
+per feature method and parameters into the shared FeatureCache and laid out as input of spatial or
+temporal models into another cache shard, every worker memory-maps the laid-out features.
+Early stopping (train_options patience) holds out utils.VALIDATION_SPLIT of every training fold,
+unless validation_split is given.
+Every fold of every configuration is one task, tasks run in worker processes and every finished
+fold is recorded in SQLite database, so an interrupted sweep started again skips finished folds.
+"""
+
+DEFAULT_DB: str = "./sweep.sqlite"
+NUM_FOLDS: int = 5
+
+_store: EpochStore | None = None
+_window: str = "3s"
+_cache: FeatureCache | None = None
+_features: tuple[str, np.ndarray] | None = None  # LAST MODEL INPUT OF WORKER, TASKS ARE ORDERED BY FEATURES
+
+
+def expand_grid(grid: dict) -> list[dict]:
+    """
+    :return: one configuration per combination of model, feature parameters and learning rate
+    """
+    configs = []
+    for feature in grid["features"]:
+        method = feature["method"]
+        names = [name for name in feature if name != "method"]
+        values = [value if isinstance(value, list) else [value] for value in (feature[name] for name in names)]
+
+        for combination in itertools.product(*values):
+            params = dict(zip(names, combination))
+            for model, learning_rate in itertools.product(grid["models"], grid["learning_rates"]):
+                configs.append(
+                    {
+                        "model": model,
+                        "method": method,
+                        "params": params,
+                        "learning_rate": learning_rate,
+                        "train_options": grid.get("train_options", {}),
+                        "model_options": grid.get("model_options", {}),
+                    }
+                )
+    return configs
+
+
+def config_id(config: dict, window: str, store_hash: str) -> str:
+    return hashlib.sha1(
+        json.dumps({**config, "window": window, "store": store_hash}, sort_keys=True).encode()
+    ).hexdigest()
+
+
+def features_id(config: dict) -> str:
+    spatial = "Spatial" in MODELS[config["model"]][0]
+    return json.dumps({"method": config["method"], "params": config["params"], "spatial": spatial}, sort_keys=True)
+
+
+def open_db(path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(path)
+    connection.executescript("""
+        CREATE TABLE IF NOT EXISTS configs (
+            id TEXT PRIMARY KEY, model TEXT, method TEXT, params TEXT, learning_rate REAL,
+            window TEXT, options TEXT, status TEXT
+        );
+        CREATE TABLE IF NOT EXISTS folds (
+            config_id TEXT, fold INTEGER, accuracy REAL, seconds REAL, finished TEXT,
+            PRIMARY KEY (config_id, fold)
+        );
+        """)
+    return connection
+
+
+def _init_sweep_worker(store_path: str, window: str, cache_dir: str, num_threads: int) -> None:
+    global _store, _window, _cache
+    _store, _window, _cache = EpochStore(store_path), window, FeatureCache(cache_dir)
+    torch.set_num_threads(num_threads)
+
+
+def _model_input(config: dict) -> np.ndarray:
+    global _features
+    key = features_id(config)
+
+    if _features is None or _features[0] != key:
+        _features = None  # RELEASES PREVIOUS FEATURES BEFORE COMPUTING NEW ONES
+        X = _store.as_tensor().numpy()  # NO COPY OF FLOAT32 STORES, COMPACT STORES ARE DECODED
+        method, params = config["method"], config["params"]
+        spatial = "Spatial" in MODELS[config["model"]][0]
+        if method == "raw":
+            features = model_input(X, method, spatial)
+        else:
+            # LAID-OUT FEATURES ARE CACHED TOO, TRANSPOSED LAYOUTS ARE NOT COPIED INTO MEMORY OF EVERY WORKER
+            layout = "spatial" if spatial else "temporal"
+            features = _cache.cached(
+                feature_key(_store.content_hash, _window, method, {**params, "layout": layout}),
+                lambda: model_input(_cache.features(X, _store.content_hash, _window, method, params), method, spatial),
+                {"store": _store.content_hash, "window": _window, "method": method, "params": params, "layout": layout},
+            )
+            features = np.asarray(features, dtype=np.float32)  # ONE COPY ONLY FOR FLOAT16 CACHES
+        _features = (key, features)
+
+    return _features[1]
+
+
+def _run_fold(config: dict, fold: int, train_idx: np.ndarray, test_idx: np.ndarray) -> tuple[float, float]:
+    model_name, cnn_mode = MODELS[config["model"]]
+    X = _model_input(config)
+    train_options = {**config["train_options"], "learning_rate": config["learning_rate"]}
+
+    start = time.perf_counter()
+    accuracy = train_fold(
+        model_name,
+        cnn_mode,
+        X,
+        _store.y,
+        train_idx,
+        test_idx,
+        fold,
+        torch.device("cuda" if torch.cuda.is_available() else "cpu"),
+        model_options=config["model_options"],
+        train_options=train_options,
+    )
+    return accuracy, time.perf_counter() - start
+
+
+def _check_supported(config: dict) -> str | None:
+    """
+    Some models cannot take some feature layouts, e.g. SpatialCNNTransformer needs ~481 time samples.
+    :return: error of forward pass of one sample, None if supported
+    """
+    model_name, cnn_mode = MODELS[config["model"]]
+    X = torch.as_tensor(_model_input(config)[:1])
+    try:
+        model = create_model(model_name, X.shape, **config["model_options"])
+        with torch.no_grad():
+            model(X.unsqueeze(1) if cnn_mode else X)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}".splitlines()[0]
+    return None
+
+
+def run_sweep(
+    grid: dict,
+    db_path: str = DEFAULT_DB,
+    jobs: int = 1,
+    threads_per_job: int | None = None,
+    cache_dir: str | None = None,
+) -> None:
+    """
+    :param grid: sweep grid, see module docstring
+    :param db_path: SQLite database with results, finished folds in it are skipped
+    :param jobs: number of folds trained concurrently in separate processes
+    :param threads_per_job: torch intra-op threads of every process, by default cores are split evenly
+    :param cache_dir: directory of feature cache
+    """
+    window = grid.get("window", "3s")
+    store_path = f"{utils.EPOCH_STORE_DIR}/Physionet-{window}"
+    if not store_exists(store_path):
+        logger.error(f"No epoch store in {store_path}, run: python preprocess.py pack")
+        return
+
+    cache_dir = cache_dir or FeatureCache().cache_dir
+    threads_per_job = threads_per_job or max(1, (os.cpu_count() or 1) // jobs)
+    _init_sweep_worker(store_path, window, cache_dir, torch.get_num_threads())
+    connection = open_db(db_path)
+    folds = list(KFold(n_splits=NUM_FOLDS, shuffle=True, random_state=42).split(_store.X, _store.y))
+
+    configs = sorted(expand_grid(grid), key=features_id)  # WORKERS REUSE FEATURES OF CONSECUTIVE TASKS
+    tasks = []
+    for config in configs:
+        cid = config_id(config, window, _store.content_hash)
+        options = json.dumps({"train": config["train_options"], "model": config["model_options"]}, sort_keys=True)
+        row = (cid, config["model"], config["method"], json.dumps(config["params"]), config["learning_rate"], window)
+        connection.execute("INSERT OR IGNORE INTO configs VALUES (?, ?, ?, ?, ?, ?, ?, 'pending')", (*row, options))
+
+        # FEATURES ARE COMPUTED HERE ONCE, WORKERS ONLY MEMORY-MAP THEM FROM THE CACHE
+        if error := _check_supported(config):
+            logger.warning(f"Skipping {config['model']} with {config['method']} {config['params']}: {error}")
+            connection.execute("UPDATE configs SET status = ? WHERE id = ?", (f"unsupported: {error}", cid))
+            continue
+
+        finished = {fold for (fold,) in connection.execute("SELECT fold FROM folds WHERE config_id = ?", (cid,))}
+        tasks += [(cid, config, fold) for fold in range(NUM_FOLDS) if fold not in finished]
+    connection.commit()
+
+    global _features
+    _features = None
+    logger.info(f"{len(configs)} configurations, {len(tasks)} folds to train, feature cache {_cache.stats()}")
+
+    def record(cid: str, config: dict, fold: int, accuracy: float, seconds: float) -> None:
+        row = (cid, fold, accuracy, seconds, datetime.now().isoformat(timespec="seconds"))
+        connection.execute("INSERT OR REPLACE INTO folds VALUES (?, ?, ?, ?, ?)", row)
+        done = connection.execute("SELECT COUNT(*) FROM folds WHERE config_id = ?", (cid,)).fetchone()[0]
+        if done == NUM_FOLDS:
+            connection.execute("UPDATE configs SET status = 'finished' WHERE id = ?", (cid,))
+        connection.commit()
+        description = f"{config['model']}, {config['method']} {config['params']}, lr {config['learning_rate']}"
+        logger.info(f"{description}, fold {fold + 1}: {accuracy * 100:.2f}% in {seconds:.0f} s")
+
+    if jobs == 1:
+        for cid, config, fold in tasks:
+            record(cid, config, fold, *_run_fold(config, fold, *folds[fold]))
+    else:
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_sweep_worker,
+            initargs=(store_path, window, cache_dir, threads_per_job),
+        ) as executor:
+            futures = {
+                executor.submit(_run_fold, config, fold, *folds[fold]): (cid, config, fold)
+                for cid, config, fold in tasks
+            }
+            for future in as_completed(futures):
+                record(*futures[future], *future.result())
+
+    log_summary(connection)
+    connection.close()
+
+
+def log_summary(connection: sqlite3.Connection) -> None:
+    rows = connection.execute("""
+        SELECT c.model, c.method, c.params, c.learning_rate, AVG(f.accuracy), COUNT(f.fold)
+        FROM configs c JOIN folds f ON f.config_id = c.id
+        GROUP BY c.id ORDER BY AVG(f.accuracy) DESC
+        """).fetchall()
+
+    lines = ["| Model | Feature Method | Learning Rate | Average Accuracy(%) | Params | Folds |"]
+    for model, method, params, learning_rate, accuracy, num_folds in rows:
+        lines.append(
+            f"| {MODELS[model][0]} | {method} | {learning_rate} | {accuracy * 100:.2f} | {params} | {num_folds} |"
+        )
+    logger.info("Sweep results:\n" + "\n".join(lines))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Resumable hyperparameter sweep with 5-fold cross-validation")
+    parser.add_argument("grid", help="JSON file with sweep grid")
+    parser.add_argument("--db", default=DEFAULT_DB, help="SQLite database with results")
+    parser.add_argument("--jobs", type=int, default=1, help="number of folds trained concurrently")
+    parser.add_argument("--threads", type=int, default=None, help="torch threads of every worker process")
+    parser.add_argument("--cache-dir", default=None, help="directory of feature cache")
+    args = parser.parse_args()
+
+    with open(args.grid) as file:
+        grid = json.load(file)
+
+    run_sweep(grid, args.db, args.jobs, args.threads, args.cache_dir)
+
+
+if __name__ == "__main__":
+    main()
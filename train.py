@@ -1,12 +1,16 @@
 import numpy as np
 import torch
-import mne
 import os
-import sys
-from sklearn.model_selection import KFold
-from torch.utils.data import DataLoader
+import argparse
+import torch.multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from sklearn.model_selection import KFold, train_test_split
 
 from scripts.dataset.eeg_dataset import EEGDataset
+from scripts.dataset.batch_loader import TensorBatchLoader
+from scripts.dataset.augmentation import BatchAugmenter
+from scripts.dataset.epoch_store import CompactEpochs, EpochStore, load_subject_data, store_exists
+from scripts.models.transformer_block import ATTENTION_BACKENDS
 from scripts.models.transformer_models import (
     SpatialTransformer,
     TemporalTransformer,
@@ -15,123 +19,431 @@ from scripts.models.transformer_models import (
     FusionCNNTransformer,
 )
 import scripts.models.utils as utils
+import scripts.models.export as export
+import scripts.models.checkpoint as checkpoint
+from scripts.models.compilation import compile_model
 from eeg_logger import logger
 
 
-def load_subject_data(file_path: str) -> tuple[np.ndarray, np.ndarray]:
-    epochs = mne.read_epochs(file_path, preload=True, verbose=False)
+def epoch_store_path(window: str = "3s") -> str:
+    return f"{utils.EPOCH_STORE_DIR}/Physionet-{window}"
+
+
+def load_dataset(window: str = "3s") -> tuple[np.ndarray | CompactEpochs, np.ndarray]:
     """
-    Format danych: (Number of epochs, channels, n_times)
-    Dla danych 3-sekundowych: 3 sekundy x 160 Hz = 480, n_times = 480
-    Dla danych 6-sekundowych: 6 sekund x 160 Hz = 960, n_times = 960
+    Loads all Physionet epochs for given window. Uses the packed epoch store if it exists,
+    otherwise falls back to reading every subject's -epo.fif file. Epochs of float16/int16 stores
+    stay compact and are decoded per batch.
+
+    :param window: epochs length, "3s" or "6s"
     """
-    # Data
-    X = epochs.get_data()
-    # Labels
-    y = epochs.events[:, -1]
-    # Labels should be numered 0, 1, 2 ...
-    y = np.array([0 if label == 2 else 1 for label in y])
-    return X, y
+    store_path = epoch_store_path(window)
+    if store_exists(store_path):
+        store = EpochStore(store_path)
+        logger.info(f"Loaded {len(store)} epochs from {store.dtype} epoch store {store_path}")
+        return store.epochs, store.y
+
+    logger.warning(f"No epoch store in {store_path}, reading epochs from fif files (run: python preprocess.py pack)")
+    all_X = []
+    all_y = []
+
+    for subj_folder in sorted(os.listdir(utils.PREPROCESSED_DATA_DIR)):
+        subj_folder_path = os.path.join(utils.PREPROCESSED_DATA_DIR, subj_folder)
+        file_path = os.path.join(subj_folder_path, f"PA{subj_folder[1:]}-{window}-epo.fif")
+        if os.path.exists(file_path):
+            X, y = load_subject_data(file_path)
+            all_X.append(X)
+            all_y.append(y)
 
+    return np.concatenate(all_X, axis=0), np.concatenate(all_y, axis=0)
+
+
+def create_model(
+    model_name: str,
+    test_data_shape: np.ndarray.shape,
+    attention: str = utils.ATTENTION,
+    attention_window: int = utils.ATTENTION_WINDOW,
+    patch_size: int | None = utils.PATCH_SIZE,
+    patch_stride: int | None = utils.PATCH_STRIDE,
+    compile: bool = False,
+) -> torch.nn.Module:
+    """
+    :param compile: compiles model with torch.compile for static input shapes, see compilation.py
+    """
+    attention_options = {"attention": attention, "attention_window": attention_window}
+    patch_options = {"patch_size": patch_size, "patch_stride": patch_stride}
 
-def create_model(model_name: str, test_data_shape: np.ndarray.shape) -> torch.nn.Module:
     match model_name:
         case "SpatialTransformer":
-            return SpatialTransformer(
+            model = SpatialTransformer(
                 input_size=test_data_shape[2],
                 d_model=utils.D_MODEL,
                 num_heads=utils.NUM_HEADS,
                 num_classes=utils.NUM_CLASSES,
+                **attention_options,
             )
         case "TemporalTransformer":
-            return TemporalTransformer(
+            model = TemporalTransformer(
                 input_size=test_data_shape[1],
                 d_model=utils.D_MODEL,
                 num_heads=utils.NUM_HEADS,
                 num_classes=utils.NUM_CLASSES,
+                max_len=max(1000, test_data_shape[2]),
+                **attention_options,
+                **patch_options,
             )
         case "SpatialCNNTransformer":
-            return SpatialCNNTransformer(
+            model = SpatialCNNTransformer(
                 d_model=utils.D_MODEL,
                 num_heads=utils.NUM_HEADS,
                 num_classes=utils.NUM_CLASSES,
+                **attention_options,
             )
         case "TemporalCNNTransformer":
-            return TemporalCNNTransformer(
+            model = TemporalCNNTransformer(
                 d_model=utils.D_MODEL,
                 num_heads=utils.NUM_HEADS,
                 num_classes=utils.NUM_CLASSES,
+                **attention_options,
+                **patch_options,
             )
         case "FusionCNNTransformer":
-            return FusionCNNTransformer(
+            model = FusionCNNTransformer(
                 d_model=utils.D_MODEL,
                 num_heads=utils.NUM_HEADS,
                 num_classes=utils.NUM_CLASSES,
+                **attention_options,
+                **patch_options,
             )
 
+    if compile:
+        compile_model(model, utils.COMPILE_CACHE_DIR)
+    return model
+
+
+def train_fold(
+    model_name: str,
+    cnn_mode: bool,
+    all_X: np.ndarray | torch.Tensor | CompactEpochs,
+    all_y: np.ndarray | torch.Tensor,
+    train_idx: np.ndarray,
+    test_idx: np.ndarray,
+    fold: int,
+    device: torch.device,
+    model_options: dict | None = None,
+    train_options: dict | None = None,
+    export_dir: str | None = None,
+    export_format: str = "torchscript",
+    int8: bool = False,
+) -> float:
+    """
+    Trains and evaluates one cross-validation fold, returns its accuracy.
+
+    :param model_options: keyword arguments of create_model, e.g. attention or patch_size
+    :param train_options: keyword arguments of utils.train_model, e.g. profile or patience,
+        validation_split holds out part of training fold as validation data for early stopping,
+        utils.VALIDATION_SPLIT if patience is given without it,
+        checkpoint_dir saves checkpoints of the fold in this directory,
+        augmentation holds keyword arguments of BatchAugmenter, its generator is seeded per fold
+    :param export_dir: saves state dict and inference artifact of trained model in this directory
+    :param export_format: format of inference artifact, one of export.EXPORT_FORMATS
+    :param int8: exports also dynamically int8-quantized artifact
+    """
+    torch.manual_seed(utils.SEED + fold)  # SAME INITIALISATION IN SERIAL AND FOLD-PARALLEL MODE
+
+    train_options = dict(train_options or {})
+    validation_split = train_options.pop("validation_split", None)
+    if validation_split is None and train_options.get("patience") is not None:
+        validation_split = utils.VALIDATION_SPLIT  # EARLY STOPPING NEEDS VALIDATION DATA
+    if validation_split:
+        train_idx, val_idx = train_test_split(
+            train_idx, test_size=validation_split, stratify=np.asarray(all_y[train_idx]), random_state=utils.SEED + fold
+        )
+
+    # FOLDS ARE INDEX VIEWS OF all_X, BATCHES ARE GATHERED FROM IT WITHOUT FOLD-SIZED COPIES
+    train_dataset = EEGDataset(all_X, all_y, cnn_mode=cnn_mode, indices=train_idx)
+    test_dataset = EEGDataset(all_X, all_y, cnn_mode=cnn_mode, indices=test_idx)
+
+    pin_memory = device.type == "cuda"
+    train_loader = TensorBatchLoader(
+        train_dataset, batch_size=utils.BATCH_SIZE, shuffle=True, reuse_buffers=True, pin_memory=pin_memory
+    )
+    test_loader = TensorBatchLoader(
+        test_dataset, batch_size=utils.BATCH_SIZE, shuffle=False, reuse_buffers=True, pin_memory=pin_memory
+    )
+
+    if validation_split:
+        val_dataset = EEGDataset(all_X, all_y, cnn_mode=cnn_mode, indices=val_idx)
+        train_options["val_loader"] = TensorBatchLoader(
+            val_dataset, batch_size=utils.BATCH_SIZE, shuffle=False, reuse_buffers=True, pin_memory=pin_memory
+        )
+
+    model = create_model(model_name, (len(train_idx), *all_X.shape[1:]), **(model_options or {}))
+
+    if train_options.get("trace_steps"):
+        os.makedirs(utils.TRACE_DIR, exist_ok=True)
+        train_options["trace_path"] = f"{utils.TRACE_DIR}/{model_name}-fold{fold + 1}-trace.json"
+    if augmentation := train_options.pop("augmentation", None):
+        train_options["augmenter"] = BatchAugmenter(**augmentation, seed=utils.SEED + fold)
+    if checkpoint_dir := train_options.pop("checkpoint_dir", None):
+        train_options["checkpoint_path"] = f"{checkpoint_dir}/{model_name}-fold{fold + 1}.pt"
+
+    logger.info(f"Training {model_name} in fold {fold + 1}...")
+    utils.train_model(model, train_loader, device, verbose=False, **train_options)
+
+    eval_options = {key: train_options[key] for key in ["bf16", "compiled"] if key in train_options}
+    accuracy = utils.evaluate_model(model, test_loader, device, **eval_options)
+    logger.info(f"Accuracy for {model_name}  in fold {fold + 1}: {accuracy * 100:.2f}%")
+
+    if export_dir:
+        export_fold(model, test_loader, f"{export_dir}/{model_name}-fold{fold + 1}", export_format, int8)
+
+    return accuracy
 
-def train_model(model_name: str, cnn_mode: bool = False) -> None:
 
+def export_fold(model: torch.nn.Module, test_loader, path: str, export_format: str, int8: bool) -> None:
+    """
+    Saves state dict and inference artifacts of one fold's model, torchscript artifacts are
+    checked against the float model on the held-out fold.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    torch.save(model.state_dict(), f"{path}-state.pt")
+    example_input = next(iter(test_loader))[0].clone()
+
+    artifact_path = export.export_model(model, example_input, path, export_format)
+    if export_format == "torchscript":
+        export.check_artifact(artifact_path, model, test_loader)
+
+    if int8:
+        artifact_path = export.export_model(model, example_input, f"{path}-int8", "torchscript", int8=True)
+        export.check_artifact(artifact_path, model, test_loader, int8=True)
+
+
+def fold_tensors(X: np.ndarray | CompactEpochs, y: np.ndarray) -> tuple[torch.Tensor | CompactEpochs, torch.Tensor]:
+    """
+    :return: one float32 tensor (no copy of float32 stores) or compact epochs for all folds, folds are its index views
+    """
+    if not isinstance(X, CompactEpochs):
+        X = torch.as_tensor(X, dtype=torch.float32)
+    return X, torch.as_tensor(y, dtype=torch.long)
+
+
+# DATASET SHARED WITH FOLD WORKER PROCESSES, SET BY _init_fold_worker
+_shared_X: torch.Tensor | CompactEpochs | None = None
+_shared_y: torch.Tensor | None = None
+
+
+def _init_fold_worker(
+    store_path: str | None, X: torch.Tensor | CompactEpochs | None, y: torch.Tensor | None, num_threads: int
+) -> None:
+    """
+    :param store_path: epoch store reopened by every worker, its pages are shared through the page cache
+    :param X: dataset in shared memory, used when there is no epoch store
+    """
+    global _shared_X, _shared_y
+    if store_path:
+        store = EpochStore(store_path)
+        X, y = fold_tensors(store.epochs, store.y)
+    _shared_X, _shared_y = X, y
+    torch.set_num_threads(num_threads)
+
+
+def _train_fold_in_worker(model_name: str, cnn_mode: bool, *fold_args) -> float:
+    return train_fold(model_name, cnn_mode, _shared_X, _shared_y, *fold_args)
+
+
+def train_model(
+    model_name: str,
+    cnn_mode: bool = False,
+    jobs: int = 1,
+    threads_per_job: int | None = None,
+    model_options: dict | None = None,
+    train_options: dict | None = None,
+    export_dir: str | None = None,
+    export_format: str = "torchscript",
+    int8: bool = False,
+    checkpoint_dir: str | None = None,
+    resume: bool = False,
+) -> None:
+    """
+    Trains and evaluates model with 5-fold cross-validation.
+
+    :param model_name: name of model class
+    :param cnn_mode: adds channel dimension to data, required by CNN models
+    :param jobs: number of folds trained concurrently in separate processes
+    :param threads_per_job: torch intra-op threads of every fold process (or of this process if jobs is 1),
+        by default cores are split evenly between jobs
+    :param model_options: keyword arguments of create_model, e.g. attention or patch_size
+    :param train_options: keyword arguments of utils.train_model, e.g. profile or trace_steps
+    :param export_dir: saves state dict and inference artifacts of every fold's model in this directory
+    :param export_format: format of inference artifacts, one of export.EXPORT_FORMATS
+    :param int8: exports also dynamically int8-quantized torchscript artifacts
+    :param checkpoint_dir: saves checkpoint of every fold after every utils.CHECKPOINT_EVERY epochs
+        and accuracies of finished folds in this directory
+    :param resume: skips finished folds and continues interrupted folds from their last checkpoint,
+        run with different options is not resumed
+    """
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     if device == "cpu":
         logger.warning("Warning - training model on cpu")
 
-    accuracies = []
-    all_subject_folders = sorted(os.listdir(utils.PREPROCESSED_DATA_DIR))
-    all_X = []
-    all_y = []
+    all_X, all_y = load_dataset()
 
-    for subj_folder in all_subject_folders:
-        subj_folder_path = os.path.join(utils.PREPROCESSED_DATA_DIR, subj_folder)
-        file_path = os.path.join(subj_folder_path, f"PA{subj_folder[1:]}-3s-epo.fif")
-        if os.path.exists(file_path):
-            X, y = load_subject_data(file_path)
-            all_X.append(X)
-            all_y.append(y)
+    kf = KFold(n_splits=5, shuffle=True, random_state=42)
+    folds = list(kf.split(all_X, all_y))
 
-    all_X = np.concatenate(all_X, axis=0)
-    all_y = np.concatenate(all_y, axis=0)
+    all_X, all_y = fold_tensors(all_X, all_y)
 
-    kf = KFold(n_splits=5, shuffle=True, random_state=42)
+    results_path = f"{checkpoint_dir}/{model_name}-results.json" if checkpoint_dir else None
+    run_options = {"cnn_mode": cnn_mode, "model_options": model_options, "train_options": train_options}
+    accuracies = {}
+    if results_path and resume:
+        accuracies = checkpoint.load_results(results_path, run_options)
+        if accuracies is None:
+            logger.warning(f"No results of run with the same options in {results_path}, starting from scratch")
+            accuracies, resume = {}, False
+        elif accuracies:
+            logger.info(f"Skipping finished folds {', '.join(str(fold + 1) for fold in sorted(accuracies))}")
+    if results_path and not resume:
+        # FOLD CHECKPOINTS OF PREVIOUS RUNS ARE NOT RESUMED INTO THIS RUN
+        for fold in range(len(folds)):
+            if os.path.exists(fold_checkpoint := f"{checkpoint_dir}/{model_name}-fold{fold + 1}.pt"):
+                os.remove(fold_checkpoint)
+        # OPTIONS ARE RECORDED BEFORE THE FIRST FOLD FINISHES, SO AN INTERRUPTED FIRST FOLD IS RESUMED TOO
+        checkpoint.save_results(results_path, run_options, accuracies)
+    if checkpoint_dir:
+        train_options = {**(train_options or {}), "checkpoint_dir": checkpoint_dir, "resume": resume}
 
-    for fold, (train_idx, test_idx) in enumerate(kf.split(all_X, all_y)):
+    def record(fold: int, accuracy: float) -> None:
+        accuracies[fold] = accuracy
+        if results_path:
+            checkpoint.save_results(results_path, run_options, accuracies)
 
-        X_train, X_test = all_X[train_idx], all_X[test_idx]
-        y_train, y_test = all_y[train_idx], all_y[test_idx]
+    fold_arguments = [
+        (train_idx, test_idx, fold, device, model_options, train_options, export_dir, export_format, int8)
+        for fold, (train_idx, test_idx) in enumerate(folds)
+        if fold not in accuracies
+    ]
 
-        train_dataset = EEGDataset(X_train, y_train, cnn_mode=cnn_mode)
-        test_dataset = EEGDataset(X_test, y_test, cnn_mode=cnn_mode)
+    if jobs == 1:
+        if threads_per_job:
+            torch.set_num_threads(threads_per_job)
+        for fold_args in fold_arguments:
+            record(fold_args[2], train_fold(model_name, cnn_mode, all_X, all_y, *fold_args))
+    else:
+        threads_per_job = threads_per_job or max(1, (os.cpu_count() or 1) // jobs)
+        logger.info(f"Training {len(folds)} folds in {jobs} processes with {threads_per_job} threads each")
 
-        train_loader = DataLoader(train_dataset, batch_size=utils.BATCH_SIZE, shuffle=True)
-        test_loader = DataLoader(test_dataset, batch_size=utils.BATCH_SIZE, shuffle=False)
+        if store_exists(store_path := epoch_store_path()):
+            # WORKERS REOPEN THE MEMORY-MAPPED STORE, share_memory_ WOULD COPY IT INTO /dev/shm
+            dataset = (store_path, None, None)
+        else:
+            # DATASET MOVED ONCE INTO SHARED MEMORY, WORKERS RECEIVE ONLY ITS HANDLE
+            dataset = (None, all_X.share_memory_(), all_y.share_memory_())
 
-        model = create_model(model_name, X_train.shape)
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_fold_worker,
+            initargs=(*dataset, threads_per_job),
+        ) as executor:
+            futures = {
+                executor.submit(_train_fold_in_worker, model_name, cnn_mode, *fold_args): fold_args[2]
+                for fold_args in fold_arguments
+            }
+            for future in as_completed(futures):  # FINISHED FOLDS ARE RECORDED BEFORE SLOWER ONES FINISH
+                record(futures[future], future.result())
 
-        logger.info(f"Training {model_name} in fold {fold + 1}...")
-        utils.train_model(model, train_loader, device, verbose=False)
+    logger.info(f"Accuracy across 5 folds for {model_name}: {np.mean(list(accuracies.values())) * 100:.2f}%")
 
-        accuracy = utils.evaluate_model(model, test_loader, device)
-        logger.info(f"Accuracy for {model_name}  in fold {fold + 1}: {accuracy * 100:.2f}%")
-        accuracies.append(accuracy)
 
-    logger.info(f"Accuracy across 5 folds for {model_name}: {np.mean(accuracies) * 100:.2f}%")
+MODELS: dict[str, tuple[str, bool]] = {
+    "spatial": ("SpatialTransformer", False),
+    "temporal": ("TemporalTransformer", False),
+    "spatialcnn": ("SpatialCNNTransformer", True),
+    "temporalcnn": ("TemporalCNNTransformer", True),
+    "fusion": ("FusionCNNTransformer", True),
+}
 
 
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Trains model with 5-fold cross-validation on Physionet data")
+    parser.add_argument("model", nargs="?", default="", help=", ".join(MODELS))
+    parser.add_argument("--jobs", type=int, default=1, help="number of folds trained concurrently")
+    parser.add_argument("--threads", type=int, default=None, help="torch threads, of every fold process with --jobs")
+    parser.add_argument("--attention", default=utils.ATTENTION, choices=ATTENTION_BACKENDS)
+    parser.add_argument("--attention-window", type=int, default=utils.ATTENTION_WINDOW, help="local attention radius")
+    parser.add_argument("--patch-size", type=int, default=utils.PATCH_SIZE, help="time samples per token")
+    parser.add_argument("--patch-stride", type=int, default=utils.PATCH_STRIDE)
+    parser.add_argument("--export-dir", default=None, help="saves every fold's model and inference artifact")
+    parser.add_argument("--export-format", default="torchscript", choices=export.EXPORT_FORMATS)
+    parser.add_argument("--int8", action="store_true", help="exports also int8-quantized torchscript artifacts")
+    parser.add_argument("--profile", action="store_true", help="logs time of data, forward, backward and step stages")
+    parser.add_argument(
+        "--trace-steps", type=int, nargs=2, metavar=("FIRST", "COUNT"), help="records steps with torch.profiler"
+    )
+    parser.add_argument("--bf16", action="store_true", help="bfloat16 autocast and channels_last CNN stems")
+    parser.add_argument("--compile", action="store_true", help="torch.compile with static shapes and on-disk cache")
+    parser.add_argument(
+        "--patience", type=int, nargs="?", const=utils.PATIENCE, help="early stopping on validation accuracy"
+    )
+    parser.add_argument("--validation-split", type=float, default=None, help="part of training fold for validation")
+    parser.add_argument("--max-epochs", type=int, default=None, help="epoch budget of every fold")
+    parser.add_argument("--time-budget", type=float, default=None, help="wall-clock budget of every fold in seconds")
+    parser.add_argument("--learning-rate", type=float, default=utils.LEARNING_RATE)
+    parser.add_argument("--noise", type=float, default=0.0, help="std of Gaussian noise added to training batches")
+    parser.add_argument("--scale", type=float, default=0.0, help="random amplitude scaling of channels, e.g. 0.1")
+    parser.add_argument("--shift", type=int, default=0, help="random circular time shift in samples")
+    parser.add_argument("--channel-dropout", type=float, default=0.0, help="probability of zeroing a channel")
+    parser.add_argument(
+        "--checkpoint", nargs="?", const=utils.CHECKPOINT_DIR, metavar="DIR", help="saves checkpoints of every fold"
+    )
+    parser.add_argument("--resume", action="store_true", help="continues interrupted run from its checkpoints")
+    args = parser.parse_args()
+
+    if args.model not in MODELS:
+        logger.warning(f"No model to train provided, available models: {', '.join(MODELS)}")
+        return
 
-    model_to_train: str = sys.argv[1] if len(sys.argv) > 1 else ""
-
-    match model_to_train:
-        case "spatial":
-            train_model("SpatialTransformer")
-        case "temporal":
-            train_model("TemporalTransformer")
-        case "spatialcnn":
-            train_model("SpatialCNNTransformer", cnn_mode=True)
-        case "temporalcnn":
-            train_model("TemporalCNNTransformer", cnn_mode=True)
-        case "fusion":
-            train_model("FusionCNNTransformer", cnn_mode=True)
+    model_name, cnn_mode = MODELS[args.model]
+    model_options = {
+        "attention": args.attention,
+        "attention_window": args.attention_window,
+        "patch_size": args.patch_size,
+        "patch_stride": args.patch_stride,
+        "compile": args.compile,
+    }
+    augmentation = {
+        "noise": args.noise,
+        "scale": args.scale,
+        "shift": args.shift,
+        "channel_dropout": args.channel_dropout,
+    }
+    train_options = {
+        "profile": args.profile,
+        "trace_steps": args.trace_steps,
+        "bf16": args.bf16,
+        "compiled": args.compile,
+        "patience": args.patience,
+        "validation_split": args.validation_split,
+        "max_epochs": args.max_epochs,
+        "time_budget": args.time_budget,
+        "learning_rate": args.learning_rate,
+        "augmentation": augmentation if any(augmentation.values()) else None,
+    }
+    train_model(
+        model_name,
+        cnn_mode,
+        jobs=args.jobs,
+        threads_per_job=args.threads,
+        model_options=model_options,
+        train_options=train_options,
+        export_dir=args.export_dir,
+        export_format=args.export_format,
+        int8=args.int8,
+        checkpoint_dir=args.checkpoint or (utils.CHECKPOINT_DIR if args.resume else None),
+        resume=args.resume,
+    )
 
 
 if __name__ == "__main__":